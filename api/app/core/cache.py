@@ -0,0 +1,286 @@
+"""
+Response caching for read-heavy endpoints.
+
+Entries live in an in-process LRU with a TTL by default. Setting CACHE_URL to a
+redis:// URL switches to a shared Redis backend so every worker sees the same
+entries and invalidations. Invalidation is per user: each user has a generation
+number that is part of every key, so bumping it drops all of that user's entries
+at once without scanning the cache.
+"""
+from collections import OrderedDict
+from functools import wraps
+from fastapi.encoders import jsonable_encoder
+from typing import Any, Callable, Dict, List, Optional
+import json
+import os
+import threading
+import time
+import logging
+from dotenv import load_dotenv
+from . import events
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+class MemoryBackend:
+    """Thread-safe LRU of JSON-compatible values with per-entry expiry"""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # Counters are bounded like the entries, least recently incremented first out.
+        # Their values come from one sequence, and a counter that is not tracked reads as
+        # a value reserved at the last eviction, so dropping one never brings back a
+        # generation that still has entries
+        self._counters: "OrderedDict[str, int]" = OrderedDict()
+        self._sequence = 0
+        self._untracked = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get_counter(self, name: str) -> int:
+        return self._counters.get(name, self._untracked)
+
+    def incr_counter(self, name: str) -> int:
+        with self._lock:
+            self._sequence += 1
+            value = self._counters[name] = self._sequence
+            self._counters.move_to_end(name)
+            if len(self._counters) > self.maxsize:
+                self._counters.popitem(last=False)
+                self._sequence += 1
+                self._untracked = self._sequence
+            return value
+
+    def size(self) -> int:
+        return len(self._entries)
+
+class RedisBackend:
+    """Shared backend for multi-worker deployments (requires the `redis` package)"""
+
+    def __init__(self, url: str, namespace: str):
+        import redis  # Only needed when CACHE_URL points at Redis
+
+        self.client = redis.Redis.from_url(url)
+        self.namespace = namespace
+
+    def get(self, key: str) -> Any:
+        raw = self.client.get(f"{self.namespace}:{key}")
+        return _MISSING if raw is None else json.loads(raw)
+
+    def set(self, key: str, value: Any, ttl: float):
+        self.client.set(f"{self.namespace}:{key}", json.dumps(value), ex=max(int(ttl), 1))
+
+    def delete(self, key: str):
+        self.client.delete(f"{self.namespace}:{key}")
+
+    def get_counter(self, name: str) -> int:
+        return int(self.client.get(f"{self.namespace}:counter:{name}") or 0)
+
+    def incr_counter(self, name: str) -> int:
+        return int(self.client.incr(f"{self.namespace}:counter:{name}"))
+
+    def size(self) -> int:
+        return -1  # Not tracked for shared backends
+
+class ResponseCache:
+    """Per-user cache of endpoint responses with hit/miss accounting"""
+
+    def __init__(self, name: str, ttl: float = 60, maxsize: int = 1024, url: Optional[str] = None):
+        self.name = name
+        self.ttl = ttl
+        self.backend = self._create_backend(url, maxsize)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _create_backend(self, url: Optional[str], maxsize: int):
+        if url and url.startswith(("redis://", "rediss://")):
+            try:
+                return RedisBackend(url, namespace=f"cache:{self.name}")
+            except Exception as e:
+                logger.error(f"Could not use {url} for the {self.name} cache, falling back to memory: {e}")
+        return MemoryBackend(maxsize)
+
+    def key(self, user_id: str, endpoint: str, params: Dict[str, Any]) -> str:
+        """Build the key of a response. It embeds the user's current generation, so take
+        it before computing the response: an invalidation during the computation then
+        leaves the result under an already-dead key"""
+        generation = self.backend.get_counter(f"user:{user_id}")
+        query = "&".join(f"{name}={params[name]}" for name in sorted(params))
+        return f"{user_id}:{generation}:{endpoint}?{query}"
+
+    def get(self, key: str) -> Any:
+        value = self.backend.get(key)
+        if value is _MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any):
+        self.backend.set(key, value, self.ttl)
+
+    def invalidate_user(self, user_id: str):
+        """Drop every cached response of a user"""
+        self.backend.incr_counter(f"user:{user_id}")
+        self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "size": self.backend.size(),
+            "ttl": self.ttl
+        }
+
+    def cached(self, endpoint: str) -> Callable:
+        """
+        Decorate an async endpoint taking `current_user` so its JSON-encoded response is
+        cached per user and per query parameter. The `db` and `current_user` arguments
+        are not part of the key.
+        """
+        def decorator(func: Callable) -> Callable:
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                user = kwargs.get("current_user")
+                if user is None:
+                    return await func(*args, **kwargs)
+
+                params = {
+                    name: value for name, value in kwargs.items()
+                    if name not in ("current_user", "db")
+                }
+                key = self.key(user.id, endpoint, params)
+                value = self.get(key)
+                if value is _MISSING:
+                    value = jsonable_encoder(await func(*args, **kwargs))
+                    self.set(key, value)
+                return value
+            return wrapper
+        return decorator
+
+class LocalChannel:
+    """Invalidation channel within one process"""
+
+    def __init__(self):
+        self.handlers: List[Callable[[str], None]] = []
+
+    def subscribe(self, handler: Callable[[str], None]):
+        self.handlers.append(handler)
+
+    def publish(self, message: str):
+        self._deliver(message)
+
+    def _deliver(self, message: str):
+        for handler in self.handlers:
+            try:
+                handler(message)
+            except Exception as e:
+                logger.error(f"Error handling invalidation {message}: {e}")
+
+class RedisChannel(LocalChannel):
+    """Invalidation channel shared by every worker through Redis pub/sub (requires the `redis` package)"""
+
+    def __init__(self, url: str, name: str):
+        super().__init__()
+        import redis  # Only needed when CACHE_URL points at Redis
+
+        self.client = redis.Redis.from_url(url)
+        self.name = name
+        self._listener: Optional[threading.Thread] = None
+
+    def subscribe(self, handler: Callable[[str], None]):
+        super().subscribe(handler)
+        if self._listener is None:
+            self._listener = threading.Thread(target=self._listen, name=f"channel-{self.name}", daemon=True)
+            self._listener.start()
+
+    def publish(self, message: str):
+        # Deliver locally right away; our own listener will see the message again, which is harmless
+        self._deliver(message)
+        self.client.publish(self.name, message)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.name)
+                for message in pubsub.listen():
+                    data = message["data"]
+                    self._deliver(data.decode() if isinstance(data, bytes) else str(data))
+            except Exception as e:
+                logger.error(f"Lost the {self.name} channel, reconnecting: {e}")
+                time.sleep(1)
+
+def create_channel(name: str, url: Optional[str] = None):
+    """An invalidation channel: Redis pub/sub when `url` (default CACHE_URL) is a redis:// URL, in-process otherwise"""
+    url = url or os.getenv("CACHE_URL")
+    if url and url.startswith(("redis://", "rediss://")):
+        try:
+            return RedisChannel(url, name=f"invalidate:{name}")
+        except Exception as e:
+            logger.error(f"Could not use {url} for the {name} channel, falling back to in-process: {e}")
+    return LocalChannel()
+
+# Registry of caches, exposed through the stats endpoint
+caches: Dict[str, Any] = {}
+
+def get_cache(name: str, ttl: float = 60, maxsize: int = 1024) -> ResponseCache:
+    """Get or create a named cache. CACHE_URL selects the backend for all caches"""
+    if name not in caches:
+        caches[name] = ResponseCache(name, ttl=ttl, maxsize=maxsize, url=os.getenv("CACHE_URL"))
+    return caches[name]
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: cache.stats() for name, cache in caches.items()}
+
+dashboard_cache = get_cache(
+    "dashboard",
+    ttl=float(os.getenv("DASHBOARD_CACHE_TTL", "60")),
+    maxsize=int(os.getenv("DASHBOARD_CACHE_SIZE", "4096"))
+)
+
+def _invalidate_dashboard(event: str, user_id: Optional[str] = None, **payload):
+    if user_id:
+        dashboard_cache.invalidate_user(user_id)
+
+for _event in (
+    events.SCAN_STARTED,
+    events.SCAN_COMPLETED,
+    events.SCAN_FAILED,
+    events.PENTEST_STARTED,
+    events.PENTEST_COMPLETED,
+    events.VULNERABILITIES_INGESTED,
+    events.VULNERABILITY_STATUS_CHANGED,
+):
+    events.subscribe(_event, _invalidate_dashboard)
@@ -0,0 +1,35 @@
+"""
+In-process domain events.
+
+Services publish an event after they commit a change, and interested components
+(caches, rollups, metrics) subscribe to it instead of being called directly.
+"""
+from collections import defaultdict
+from typing import Callable, Dict, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Event names
+SCAN_STARTED = "scan.started"
+SCAN_COMPLETED = "scan.completed"
+SCAN_FAILED = "scan.failed"
+PENTEST_STARTED = "pentest.started"
+PENTEST_COMPLETED = "pentest.completed"
+VULNERABILITIES_INGESTED = "vulnerabilities.ingested"
+VULNERABILITY_STATUS_CHANGED = "vulnerability.status_changed"
+USER_UPDATED = "user.updated"
+
+_subscribers: Dict[str, List[Callable]] = defaultdict(list)
+
+def subscribe(event: str, handler: Callable):
+    """Register a handler called as handler(event, **payload) whenever `event` is published"""
+    _subscribers[event].append(handler)
+
+def publish(event: str, **payload):
+    """Notify every subscriber of `event`. A failing handler is logged and never breaks the publisher"""
+    for handler in _subscribers.get(event, []):
+        try:
+            handler(event, **payload)
+        except Exception as e:
+            logger.error(f"Error handling event {event}: {e}")
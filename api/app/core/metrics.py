@@ -0,0 +1,207 @@
+"""
+Minimal Prometheus instrumentation.
+
+Counters and histograms are plain dicts of ints and floats updated from the event
+loop thread, so they need no locks; the few counters that worker threads update are
+registered as synchronized. Gauges that describe state elsewhere (database, caches,
+pools) are computed by collectors when /metrics is scraped.
+"""
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Tuple
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(names, values)
+    ]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for label_values, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+class SynchronizedCounter(Counter):
+    """A counter that may be incremented from any thread"""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1):
+        with self._lock:
+            super().inc(*label_values, amount=amount)
+
+    def expose(self) -> List[str]:
+        with self._lock:
+            return super().expose()
+
+class Gauge(Counter):
+    def set(self, *label_values: str, value: float):
+        self.values[label_values] = value
+
+    def dec(self, *label_values: str, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+    def expose(self) -> List[str]:
+        lines = super().expose()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # Per label set: [count per bucket (+Inf last)], sum, count
+        self.values: Dict[LabelValues, list] = {}
+
+    def observe(self, *label_values: str, value: float):
+        entry = self.values.get(label_values)
+        if entry is None:
+            entry = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values, (bucket_counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.labels + ("le",), label_values + (le,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+        self.collectors: List[Callable[[], Iterable[Gauge]]] = []
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Tuple[str, ...] = (), synchronized: bool = False) -> Counter:
+        """A counter; `synchronized` for one that is incremented off the event loop"""
+        counter_class = SynchronizedCounter if synchronized else Counter
+        return self.metrics.get(name) or self.register(counter_class(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        return self.metrics.get(name) or self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.metrics.get(name) or self.register(Histogram(name, documentation, labels, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[Gauge]]):
+        """Register a function returning gauges computed at scrape time"""
+        self.collectors.append(collector)
+
+    def expose(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics.values():
+            lines.extend(metric.expose())
+        for collector in self.collectors:
+            try:
+                for gauge in collector():
+                    lines.extend(gauge.expose())
+            except Exception as e:
+                logger.error(f"Error in metrics collector {collector.__name__}: {e}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+REQUESTS = registry.counter(
+    "nexa_http_requests_total", "HTTP requests by method, route template and status", ("method", "route", "status")
+)
+REQUEST_LATENCY = registry.histogram(
+    "nexa_http_request_duration_seconds", "HTTP request latency by method and route template", ("method", "route")
+)
+IN_FLIGHT = registry.gauge("nexa_http_requests_in_flight", "HTTP requests currently being served")
+
+_route_templates: Dict[object, str] = {}
+
+def route_template(scope) -> str:
+    """The path template (e.g. /scan/{scan_id}/status) of the route that handled a request"""
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    template = _route_templates.get(endpoint)
+    if template is None:
+        router = scope.get("router")
+        template = next(
+            (route.path for route in getattr(router, "routes", []) if getattr(route, "endpoint", None) is endpoint),
+            getattr(endpoint, "__name__", "unknown")
+        )
+        _route_templates[endpoint] = template
+    return template
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording count, status and latency per route template. A request
+    ends when its last body chunk is sent: background tasks run afterwards, inside
+    the same call, and are not part of the request's latency
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        started = time.perf_counter()
+        finished = False
+
+        def finish():
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            IN_FLIGHT.dec()
+            route = route_template(scope)
+            REQUESTS.inc(scope["method"], route, str(status_code))
+            REQUEST_LATENCY.observe(scope["method"], route, value=time.perf_counter() - started)
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Requests that failed before sending a complete response
+            finish()
@@ -0,0 +1,158 @@
+"""
+Stack-sampling profiler.
+
+A daemon thread wakes every `interval` seconds, grabs the stack of every other
+thread with sys._current_frames() (including the event-loop thread, whose stack
+shows the coroutine currently running), or of just the event-loop thread when
+profiling a single request, and counts identical stacks. The output is
+the collapsed-stack format read by flamegraph.pl and speedscope. Nothing runs
+unless a profile is being taken.
+"""
+from collections import Counter, OrderedDict
+from typing import Dict, Optional
+from starlette.concurrency import run_in_threadpool
+import hmac
+import os
+import sys
+import threading
+import time
+import uuid
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Token that enables per-request profiling through the X-Profile header. Unset disables it.
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+MAX_PROFILE_SECONDS = 60
+MAX_STORED_PROFILES = 20
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return label.replace(";", ":")
+
+class StackSampler:
+    """
+    Samples the stacks of all threads (except itself), or only of `thread_id`, until
+    stopped or for at most `max_seconds`
+    """
+
+    def __init__(self, interval: float = 0.005, thread_id: Optional[int] = None, max_seconds: Optional[float] = None):
+        self.interval = interval
+        self.thread_id = thread_id
+        self.max_seconds = max_seconds
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        frames = sys._current_frames()
+        if self.thread_id is not None:
+            frames = {self.thread_id: frames[self.thread_id]} if self.thread_id in frames else {}
+        for thread_id, frame in frames.items():
+            if thread_id == own_id:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(thread_id, f"thread-{thread_id}").replace(";", ":"))
+            self.stacks[";".join(reversed(labels))] += 1
+        self.samples += 1
+
+    def _run(self):
+        deadline = time.monotonic() + self.max_seconds if self.max_seconds is not None else None
+        while not self._stop.wait(self.interval):
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> "StackSampler":
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        return self
+
+    def collapsed(self) -> str:
+        """The profile in collapsed-stack format: one 'frame;frame;frame count' line per stack"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+# Only one on-demand profile at a time: concurrent samplers would skew each other
+profile_lock = threading.Lock()
+
+def profile_for(seconds: float, interval: float = 0.005) -> StackSampler:
+    """Sample every thread for `seconds` seconds. Blocks the calling thread, so run it off the event loop"""
+    sampler = StackSampler(interval)
+    sampler.start()
+    try:
+        time.sleep(min(seconds, MAX_PROFILE_SECONDS))
+    finally:
+        sampler.stop()
+    return sampler
+
+# Profiles of recent individual requests, by id
+recent_profiles: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+
+def store_profile(profile_id: str, route: str, sampler: StackSampler):
+    recent_profiles[profile_id] = {"route": route, "samples": str(sampler.samples), "collapsed": sampler.collapsed()}
+    while len(recent_profiles) > MAX_STORED_PROFILES:
+        recent_profiles.popitem(last=False)
+
+class ProfilingMiddleware:
+    """
+    Profile a single request when it carries `X-Profile: <PROFILE_TOKEN>`, from its
+    start until its last response chunk is sent (background tasks are left out) and
+    for at most MAX_PROFILE_SECONDS. Only the event-loop thread is sampled, so work the
+    request hands to the threadpool is not shown, while coroutines of concurrent
+    requests are: they run on the same thread. Profile on a quiet worker. The response
+    gets an X-Profile-Id header; admins fetch the result from /admin/profiles/{id}.
+    Requests without the header only pay for a header lookup.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.token = PROFILE_TOKEN.encode() if PROFILE_TOKEN else None
+
+    async def __call__(self, scope, receive, send):
+        if self.token is None or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        requested = next((value for name, value in scope["headers"] if name == b"x-profile"), None)
+        if requested is None or not hmac.compare_digest(requested, self.token):
+            await self.app(scope, receive, send)
+            return
+
+        sampler = StackSampler(interval=0.001, thread_id=threading.get_ident(), max_seconds=MAX_PROFILE_SECONDS)
+        profile_id = str(uuid.uuid4())
+        stored = False
+
+        async def finish():
+            nonlocal stored
+            if stored:
+                return
+            stored = True
+            # Joining the sampler thread would block the event loop for up to an interval
+            store_profile(profile_id, f"{scope['method']} {scope['path']}", await run_in_threadpool(sampler.stop))
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", profile_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                await finish()
+
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            await finish()
@@ -0,0 +1,202 @@
+"""
+Revocation store for JWTs.
+
+Every token carries a random `jti`. Revoked ids are written to the revoked_tokens
+table and added to an in-memory Bloom filter, so checking a token that was never
+revoked (nearly all of them) is a memory lookup. A Bloom hit is confirmed against a
+bounded map of known answers and, failing that, the table. Workers learn about each
+other's revocations through the invalidation channel (Redis pub/sub when CACHE_URL
+is set) and by polling the table every REVOCATION_SYNC_INTERVAL seconds. Rows are
+pruned once the token has expired, and the filter is rebuilt from what remains.
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+import asyncio
+import hashlib
+import math
+import os
+import threading
+import logging
+from dotenv import load_dotenv
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from ..database.database import SessionLocal
+from ..models.revoked_token import RevokedToken
+from .cache import create_channel
+from .metrics import registry
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", "1000000"))
+BLOOM_ERROR_RATE = float(os.getenv("REVOCATION_BLOOM_ERROR_RATE", "0.001"))
+SYNC_INTERVAL = float(os.getenv("REVOCATION_SYNC_INTERVAL", "10"))
+PRUNE_INTERVAL = float(os.getenv("REVOCATION_PRUNE_INTERVAL", "3600"))
+KNOWN_ANSWERS_SIZE = 100000
+# Rows committed just before a sync may carry an older revoked_at, so syncs overlap
+SYNC_OVERLAP = timedelta(seconds=5)
+
+LOOKUPS = registry.counter(
+    "nexa_token_revocation_lookups_total", "Revocation checks by where they were answered", ("answered_by",)
+)
+
+class BloomFilter:
+    """Set membership with false positives but no false negatives, in about 1.8 MB per million items at 0.1%"""
+
+    def __init__(self, capacity: int = BLOOM_CAPACITY, error_rate: float = BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+        if self.count == self.capacity + 1:
+            logger.warning("Revocation Bloom filter is over capacity; raise REVOCATION_BLOOM_CAPACITY")
+
+    def __contains__(self, item: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+class RevocationStore:
+    def __init__(self):
+        self.bloom = BloomFilter()
+        # jti -> revoked, for ids whose Bloom hit was already resolved
+        self.known: "OrderedDict[str, bool]" = OrderedDict()
+        self.channel = create_channel("revocations")
+        self.channel.subscribe(self._add)
+        self._synced_until = datetime.min
+        self._task: Optional[asyncio.Task] = None
+        # Sync and prune run in worker threads; a lost bit would be a false negative
+        self._lock = threading.Lock()
+
+    def _remember(self, jti: str, revoked: bool):
+        with self._lock:
+            self.known[jti] = revoked
+            self.known.move_to_end(jti)
+            while len(self.known) > KNOWN_ANSWERS_SIZE:
+                self.known.popitem(last=False)
+
+    def _add(self, jti: str):
+        with self._lock:
+            self.bloom.add(jti)
+        self._remember(jti, True)
+
+    def revoke(self, db: Session, jti: str, expires_at: datetime):
+        """Revoke a token id until `expires_at`, in this worker and every other"""
+        db.merge(RevokedToken(jti=jti, expires_at=expires_at, revoked_at=datetime.utcnow()))
+        db.commit()
+        self.channel.publish(jti)
+
+    def claim(self, db: Session, jti: str, expires_at: datetime) -> bool:
+        """
+        Revoke a token id only if nobody has yet, for single-use tokens. The primary key
+        makes the insert the arbiter between concurrent requests, so exactly one of them
+        gets True; the filter is only updated once the row is committed.
+        """
+        db.add(RevokedToken(jti=jti, expires_at=expires_at, revoked_at=datetime.utcnow()))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            self._remember(jti, True)
+            return False
+        self.channel.publish(jti)
+        return True
+
+    def is_revoked(self, jti: str, db: Optional[Session] = None) -> bool:
+        if jti not in self.bloom:
+            LOOKUPS.inc("bloom")
+            return False
+        known = self.known.get(jti)
+        if known is not None:
+            LOOKUPS.inc("memory")
+            return known
+
+        LOOKUPS.inc("database")
+        session = db or SessionLocal()
+        try:
+            revoked = session.query(RevokedToken.jti).filter(RevokedToken.jti == jti).first() is not None
+        finally:
+            if db is None:
+                session.close()
+        self._remember(jti, revoked)
+        return revoked
+
+    def sync(self):
+        """Add revocations made by other workers since the last sync"""
+        db = SessionLocal()
+        try:
+            since = self._synced_until - SYNC_OVERLAP if self._synced_until > datetime.min + SYNC_OVERLAP else datetime.min
+            rows = db.query(RevokedToken.jti, RevokedToken.revoked_at).filter(RevokedToken.revoked_at >= since)
+            for jti, revoked_at in rows.yield_per(10000):
+                if self.known.get(jti) is not True:
+                    self._add(jti)
+                self._synced_until = max(self._synced_until, revoked_at)
+        finally:
+            db.close()
+
+    def prune(self):
+        """Delete expired revocations and rebuild the filter from the rest"""
+        db = SessionLocal()
+        try:
+            db.query(RevokedToken).filter(RevokedToken.expires_at < datetime.utcnow()).delete()
+            db.commit()
+            bloom = BloomFilter()
+            synced_until = datetime.min
+            for jti, revoked_at in db.query(RevokedToken.jti, RevokedToken.revoked_at).yield_per(10000):
+                bloom.add(jti)
+                synced_until = max(synced_until, revoked_at)
+        finally:
+            db.close()
+        # Revocations added while rebuilding are only in the old filter; carry the recent ones over
+        with self._lock:
+            for jti, revoked in self.known.items():
+                if revoked and jti not in bloom:
+                    bloom.add(jti)
+            self.bloom = bloom
+        self._synced_until = max(self._synced_until, synced_until)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        last_prune = loop.time()
+        try:
+            await loop.run_in_executor(None, self.prune)
+        except Exception as e:
+            logger.error(f"Error loading token revocations: {e}")
+        while True:
+            await asyncio.sleep(SYNC_INTERVAL)
+            try:
+                if loop.time() - last_prune >= PRUNE_INTERVAL:
+                    await loop.run_in_executor(None, self.prune)
+                    last_prune = loop.time()
+                else:
+                    await loop.run_in_executor(None, self.sync)
+            except Exception as e:
+                logger.error(f"Error syncing token revocations: {e}")
+
+revocations = RevocationStore()
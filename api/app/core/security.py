@@ -1,5 +1,8 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
+import asyncio
+import uuid
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 import os
@@ -9,6 +12,9 @@ from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from ..schemas.auth import TokenData
 from ..database.database import get_db
+from .user_cache import user_cache
+from .metrics import registry
+from .revocation import revocations
 
 load_dotenv()
 
@@ -16,10 +22,24 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
+# Comma-separated emails of users allowed on the /admin endpoints
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()}
 
 # Password context for hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt takes hundreds of milliseconds per call, so it runs on a dedicated pool instead
+# of the event loop. Calls beyond PASSWORD_HASH_QUEUE_SIZE waiting or running are rejected
+# with a 503 rather than queued without bound.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", "64"))
+
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_hash_pending = 0
+
+HASH_PENDING = registry.gauge("nexa_password_hash_pending", "Password hash/verify calls waiting or running")
+HASH_REJECTED = registry.counter("nexa_password_hash_rejected_total", "Password hash/verify calls rejected because the queue was full")
+
 # OAuth2 password bearer for token authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login/token", auto_error=False)
 
@@ -31,6 +51,33 @@ def get_password_hash(password):
     """Get hash of password"""
     return pwd_context.hash(password)
 
+async def _run_password_hasher(func, *args):
+    """Run a bcrypt call on the password hashing pool, rejecting it when the queue is full"""
+    global _hash_pending
+    if _hash_pending >= PASSWORD_HASH_QUEUE_SIZE:
+        HASH_REJECTED.inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many concurrent authentication requests, please retry",
+            headers={"Retry-After": "1"},
+        )
+
+    _hash_pending += 1
+    HASH_PENDING.inc()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, func, *args)
+    finally:
+        _hash_pending -= 1
+        HASH_PENDING.dec()
+
+async def verify_password_async(plain_password, hashed_password):
+    """Verify password with hashed password without blocking the event loop"""
+    return await _run_password_hasher(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    """Get hash of password without blocking the event loop"""
+    return await _run_password_hasher(get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create access token"""
     to_encode = data.copy()
@@ -40,19 +87,30 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     
     return encoded_jwt
 
 def create_refresh_token(data: dict):
-    """Create refresh token with longer expiry"""
+    """Create refresh token with longer expiry and a unique id, so it can be rotated and revoked"""
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex, "type": "refresh"})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def revoke_token(db: Session, token: Optional[str]):
+    """Revoke a token until it expires. Tokens that don't decode or carry no id are ignored"""
+    if not token:
+        return
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return
+    if payload.get("jti") and payload.get("exp"):
+        revocations.revoke(db, payload["jti"], datetime.utcfromtimestamp(payload["exp"]))
+
 def set_auth_cookies(response: Response, access_token: str, refresh_token: str = None):
     """Set auth cookies for frontend"""
     # Set access token cookie
@@ -82,7 +140,12 @@ def clear_auth_cookies(response: Response):
     response.delete_cookie(key="refresh_token")
 
 async def get_token_from_cookie_or_header(request: Request, token_from_header: Optional[str] = Depends(oauth2_scheme)):
-    """Get token from cookie, localStorage header or Authorization header directly"""
+    """Get token from an X-API-Key header, cookie, localStorage header or Authorization header directly"""
+    # API keys of machine clients, also accepted as a bearer token below
+    token = request.headers.get("X-API-Key")
+    if token:
+        return token
+    
     # Try to get from cookie
     token = request.cookies.get("access_token")
     
@@ -114,22 +177,52 @@ async def get_current_user(
     if not token:
         raise credentials_exception
     
+    from ..services.auth_service import get_user_by_id
+    from ..services import api_key_service
+    
+    if api_key_service.is_api_key(token):
+        api_key = api_key_service.authenticate_api_key(db, token)
+        if api_key is None:
+            raise credentials_exception
+        if not api_key_service.has_scope(api_key.scopes, request.method, request.url.path):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="API key scope does not allow this request"
+            )
+        request.state.api_key = api_key
+        user = user_cache.get(api_key.user_id, lambda: get_user_by_id(api_key.user_id, db))
+        if user is None:
+            raise credentials_exception
+        return user
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
         
-        if user_id is None:
+        if user_id is None or payload.get("type") == "refresh":
+            raise credentials_exception
+        
+        jti = payload.get("jti")
+        if jti and revocations.is_revoked(jti, db):
             raise credentials_exception
             
         token_data = TokenData(user_id=user_id)
     except JWTError:
         raise credentials_exception
         
-    # Get user from database using the provided database session
-    from ..services.auth_service import get_user_by_id
-    user = get_user_by_id(token_data.user_id, db)
+    # Get user from the user cache, falling back to the database session
+    user = user_cache.get(token_data.user_id, lambda: get_user_by_id(token_data.user_id, db))
     
     if user is None:
         raise credentials_exception
         
-    return user 
\ No newline at end of file
+    return user
+
+async def get_current_admin(current_user = Depends(get_current_user)):
+    """Get current user, requiring them to be listed in ADMIN_EMAILS"""
+    if current_user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required"
+        )
+    return current_user
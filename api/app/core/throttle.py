@@ -0,0 +1,251 @@
+"""
+Login throttling.
+
+Failed logins are counted per account and per client IP over a sliding window,
+approximated from the counts of the current and previous fixed windows. A key that
+reaches its limit is blocked with exponential backoff. Each attempt is reserved
+before the password is hashed, and a reservation counts towards the limit until the
+attempt fails or succeeds, so a concurrent burst cannot get more hashes in than the
+limit allows. Counters live in process memory by default; THROTTLE_URL (or
+CACHE_URL) pointing at Redis shares them between workers.
+"""
+from typing import Dict, List, Optional
+import os
+import time
+import logging
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request, status
+from .metrics import registry
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LOGIN_ACCOUNT_LIMIT = int(os.getenv("LOGIN_ACCOUNT_LIMIT", "5"))
+LOGIN_ACCOUNT_WINDOW = float(os.getenv("LOGIN_ACCOUNT_WINDOW", "900"))
+LOGIN_IP_LIMIT = int(os.getenv("LOGIN_IP_LIMIT", "20"))
+LOGIN_IP_WINDOW = float(os.getenv("LOGIN_IP_WINDOW", "60"))
+LOGIN_BACKOFF_BASE = float(os.getenv("LOGIN_BACKOFF_BASE", "1"))
+LOGIN_BACKOFF_MAX = float(os.getenv("LOGIN_BACKOFF_MAX", "900"))
+THROTTLE_MAX_KEYS = int(os.getenv("THROTTLE_MAX_KEYS", "100000"))
+
+# Retry-After for attempts turned away because reservations in flight fill the limit
+PENDING_RETRY_AFTER = 1.0
+# Reservations left behind by a crashed worker expire from Redis after this many seconds
+PENDING_TTL = 60
+
+THROTTLED = registry.counter("nexa_login_throttled_total", "Login attempts rejected by the throttle", ("scope",))
+
+# Entry fields of the in-memory limiter
+_WINDOW, _CURRENT, _PREVIOUS, _BLOCKED_UNTIL, _STRIKES, _PENDING = range(6)
+
+class SlidingWindowLimiter:
+    """Counts failures per key and blocks keys over `limit` per `window` seconds"""
+
+    def __init__(self, limit: int, window: float, backoff_base: float = LOGIN_BACKOFF_BASE,
+                 backoff_max: float = LOGIN_BACKOFF_MAX, max_keys: int = THROTTLE_MAX_KEYS):
+        self.limit = limit
+        self.window = window
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_keys = max_keys
+        self._entries: Dict[str, List[float]] = {}
+
+    def retry_after(self, key: str) -> float:
+        """Seconds until `key` may try again, 0 if it is not blocked"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return 0.0
+        remaining = entry[_BLOCKED_UNTIL] - time.monotonic()
+        return remaining if remaining > 0 else 0.0
+
+    def _entry(self, key: str, now: float) -> List[float]:
+        """The entry of `key`, created or moved to the current window"""
+        index = now // self.window
+        entry = self._entries.get(key)
+        if entry is None:
+            if len(self._entries) >= self.max_keys:
+                self._prune(index)
+            entry = self._entries[key] = [index, 0, 0, 0.0, 0, 0]
+        elif entry[_WINDOW] != index:
+            entry[_PREVIOUS] = entry[_CURRENT] if entry[_WINDOW] == index - 1 else 0
+            entry[_CURRENT] = 0
+            entry[_WINDOW] = index
+            if entry[_PREVIOUS] == 0:
+                entry[_STRIKES] = 0  # A quiet window forgives earlier blocks
+        return entry
+
+    def _failures(self, entry: List[float], now: float) -> float:
+        elapsed = (now % self.window) / self.window
+        return entry[_PREVIOUS] * (1 - elapsed) + entry[_CURRENT]
+
+    def acquire(self, key: str) -> float:
+        """
+        Reserve an attempt for `key`: 0 if it may go ahead, else the seconds to wait.
+        A reservation must be ended by record_failure or release
+        """
+        retry_after = self.retry_after(key)
+        if retry_after:
+            return retry_after
+        now = time.monotonic()
+        entry = self._entry(key, now)
+        # With none in flight one attempt may always go ahead, as when a block ends
+        if entry[_PENDING] and self._failures(entry, now) + entry[_PENDING] >= self.limit:
+            return PENDING_RETRY_AFTER
+        entry[_PENDING] += 1
+        return 0.0
+
+    def release(self, key: str):
+        """End a reservation of an attempt that did not fail"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[_PENDING] > 0:
+            entry[_PENDING] -= 1
+
+    def record_failure(self, key: str):
+        """Count a failed attempt, ending its reservation if it had one"""
+        self.release(key)
+        now = time.monotonic()
+        entry = self._entry(key, now)
+        entry[_CURRENT] += 1
+        if self._failures(entry, now) >= self.limit:
+            delay = min(self.backoff_base * 2 ** entry[_STRIKES], self.backoff_max)
+            entry[_BLOCKED_UNTIL] = now + delay
+            if delay < self.backoff_max:
+                entry[_STRIKES] += 1
+
+    def reset(self, key: str):
+        self._entries.pop(key, None)
+
+    def _prune(self, index: float):
+        """Drop keys idle for two windows, not blocked and without attempts in flight, then the oldest half if still full"""
+        now = time.monotonic()
+        self._entries = {
+            key: entry for key, entry in self._entries.items()
+            if entry[_WINDOW] >= index - 1 or entry[_BLOCKED_UNTIL] > now or entry[_PENDING]
+        }
+        if len(self._entries) >= self.max_keys:
+            keep = sorted(self._entries.items(), key=lambda item: item[1][_WINDOW])[len(self._entries) // 2:]
+            self._entries = dict(keep)
+
+class RedisLimiter:
+    """The same limiter with its counters in Redis, shared by every worker (requires the `redis` package)"""
+
+    def __init__(self, url: str, namespace: str, limit: int, window: float,
+                 backoff_base: float = LOGIN_BACKOFF_BASE, backoff_max: float = LOGIN_BACKOFF_MAX):
+        import redis  # Only needed when THROTTLE_URL points at Redis
+
+        self.client = redis.Redis.from_url(url)
+        self.namespace = namespace
+        self.limit = limit
+        self.window = window
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def retry_after(self, key: str) -> float:
+        remaining_ms = self.client.pttl(f"{self.namespace}:{key}:blocked")
+        return remaining_ms / 1000 if remaining_ms and remaining_ms > 0 else 0.0
+
+    def acquire(self, key: str) -> float:
+        now = time.time()
+        index = int(now // self.window)
+        prefix = f"{self.namespace}:{key}"
+        pipe = self.client.pipeline()
+        pipe.pttl(f"{prefix}:blocked")
+        pipe.incr(f"{prefix}:pending")
+        pipe.expire(f"{prefix}:pending", PENDING_TTL)
+        pipe.get(f"{prefix}:{index}")
+        pipe.get(f"{prefix}:{index - 1}")
+        blocked_ms, pending, _, current, previous = pipe.execute()
+
+        if blocked_ms and blocked_ms > 0:
+            self.release(key)
+            return blocked_ms / 1000
+        elapsed = (now % self.window) / self.window
+        # `pending` already includes this attempt
+        if pending > 1 and int(previous or 0) * (1 - elapsed) + int(current or 0) + pending - 1 >= self.limit:
+            self.release(key)
+            return PENDING_RETRY_AFTER
+        return 0.0
+
+    def release(self, key: str):
+        pending_key = f"{self.namespace}:{key}:pending"
+        if self.client.decr(pending_key) < 0:
+            self.client.set(pending_key, 0, ex=PENDING_TTL)
+
+    def record_failure(self, key: str):
+        self.release(key)
+        now = time.time()
+        index = int(now // self.window)
+        prefix = f"{self.namespace}:{key}"
+        pipe = self.client.pipeline()
+        pipe.incr(f"{prefix}:{index}")
+        pipe.expire(f"{prefix}:{index}", int(self.window * 2) + 1)
+        pipe.get(f"{prefix}:{index - 1}")
+        current, _, previous = pipe.execute()
+
+        elapsed = (now % self.window) / self.window
+        if int(previous or 0) * (1 - elapsed) + int(current) >= self.limit:
+            strikes = self.client.incr(f"{prefix}:strikes") - 1
+            self.client.expire(f"{prefix}:strikes", int(self.window * 2) + 1)
+            delay = min(self.backoff_base * 2 ** min(strikes, 32), self.backoff_max)
+            self.client.set(f"{prefix}:blocked", 1, px=max(int(delay * 1000), 1))
+
+    def reset(self, key: str):
+        prefix = f"{self.namespace}:{key}"
+        index = int(time.time() // self.window)
+        self.client.delete(f"{prefix}:{index}", f"{prefix}:{index - 1}", f"{prefix}:strikes", f"{prefix}:blocked")
+
+def create_limiter(name: str, limit: int, window: float, url: Optional[str] = None):
+    """A limiter in Redis when `url` (default THROTTLE_URL, then CACHE_URL) is a redis:// URL, in memory otherwise"""
+    url = url or os.getenv("THROTTLE_URL") or os.getenv("CACHE_URL")
+    if url and url.startswith(("redis://", "rediss://")):
+        try:
+            return RedisLimiter(url, namespace=f"throttle:{name}", limit=limit, window=window)
+        except Exception as e:
+            logger.error(f"Could not use {url} for the {name} throttle, falling back to memory: {e}")
+    return SlidingWindowLimiter(limit, window)
+
+account_limiter = create_limiter("login-account", LOGIN_ACCOUNT_LIMIT, LOGIN_ACCOUNT_WINDOW)
+ip_limiter = create_limiter("login-ip", LOGIN_IP_LIMIT, LOGIN_IP_WINDOW)
+
+def _client_ip(request: Request) -> str:
+    # Behind a reverse proxy this is the proxy's address unless uvicorn runs with
+    # --proxy-headers --forwarded-allow-ips=<proxy>, which takes it from X-Forwarded-For
+    return request.client.host if request.client else "unknown"
+
+def check_login(request: Request, email: str):
+    """
+    Reserve a login attempt for its account and client IP before the password is
+    hashed, or reject it with 429 while either is blocked or has its limit taken by
+    attempts in flight. End the reservation with record_login_failure,
+    record_login_success or release_login
+    """
+    account = email.lower()
+    retry_after = account_limiter.acquire(account)
+    scope = "account"
+    if not retry_after:
+        retry_after = ip_limiter.acquire(_client_ip(request))
+        scope = "ip"
+        if retry_after:
+            account_limiter.release(account)
+    if retry_after:
+        THROTTLED.inc(scope)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many failed login attempts, please retry later",
+            headers={"Retry-After": str(int(retry_after) + 1)},
+        )
+
+def record_login_failure(request: Request, email: str):
+    account_limiter.record_failure(email.lower())
+    ip_limiter.record_failure(_client_ip(request))
+
+def record_login_success(request: Request, email: str):
+    """A successful login clears the account's failures (the IP's are kept)"""
+    account_limiter.reset(email.lower())
+    ip_limiter.release(_client_ip(request))
+
+def release_login(request: Request, email: str):
+    """End the reservation of an attempt that neither failed nor succeeded, e.g. on a 503"""
+    account_limiter.release(email.lower())
+    ip_limiter.release(_client_ip(request))
@@ -0,0 +1,84 @@
+"""
+Cache of authenticated users.
+
+get_current_user answers from a per-worker LRU of user snapshots with a TTL instead
+of querying the users table on every request. The snapshots are User schemas, so
+they carry no password hash and are safe to share between requests. When a user
+changes, the USER_UPDATED event invalidates the entry here and is broadcast on an
+invalidation channel (Redis pub/sub when CACHE_URL is set) to the other workers.
+"""
+from typing import Any, Callable, Dict, Optional
+import os
+import threading
+from dotenv import load_dotenv
+from . import events
+from .cache import MemoryBackend, caches, create_channel, _MISSING
+from ..schemas.auth import User
+
+load_dotenv()
+
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+class UserCache:
+    def __init__(self, name: str = "users", ttl: float = USER_CACHE_TTL, maxsize: int = USER_CACHE_SIZE):
+        self.name = name
+        self.ttl = ttl
+        self.backend = MemoryBackend(maxsize)
+        self.channel = create_channel(name)
+        self.channel.subscribe(self._drop)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # Bumped by every invalidation, so a load racing with one is not stored
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str, load: Callable[[], Any]) -> Optional[User]:
+        """The user with `user_id`, calling `load` for the database row on a miss"""
+        user = self.backend.get(user_id)
+        if user is not _MISSING:
+            self.hits += 1
+            return user
+
+        self.misses += 1
+        epoch = self._epoch
+        row = load()
+        if row is None:
+            return None
+        user = User.model_validate(row)
+        with self._lock:
+            if epoch == self._epoch:
+                self.backend.set(user_id, user, self.ttl)
+        return user
+
+    def invalidate(self, user_id: str):
+        """Drop a user from this worker and every worker listening on the channel"""
+        self.channel.publish(user_id)
+
+    def _drop(self, user_id: str):
+        with self._lock:
+            self._epoch += 1
+            self.backend.delete(user_id)
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "channel": type(self.channel).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "size": self.backend.size(),
+            "ttl": self.ttl
+        }
+
+user_cache = caches["users"] = UserCache()
+
+def _invalidate_user(event: str, user_id: Optional[str] = None, **payload):
+    if user_id:
+        user_cache.invalidate(user_id)
+
+events.subscribe(events.USER_UPDATED, _invalidate_user)
@@ -0,0 +1,141 @@
+"""
+SQL query instrumentation.
+
+Cursor events on the engine time every statement. Statements slower than
+SLOW_QUERY_MS are logged with their parameterized SQL and the route that issued
+them. QueryCountMiddleware counts the statements of each request and warns when a
+request repeats the same statement shape more than N_PLUS_ONE_THRESHOLD times,
+the signature of an N+1 loop. With DEBUG on, responses carry the counts in
+X-Query-Count and X-Query-Time-Ms headers.
+"""
+from contextvars import ContextVar
+from typing import Dict, Optional
+import os
+import re
+import threading
+import time
+import logging
+from dotenv import load_dotenv
+from sqlalchemy import event
+from ..core.metrics import registry, route_template
+
+load_dotenv()
+
+logger = logging.getLogger("app.sql")
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+DEBUG = os.getenv("DEBUG", "false").lower() in ("1", "true", "yes")
+
+QUERIES_PER_REQUEST = registry.histogram(
+    "nexa_db_queries_per_request",
+    "Database statements issued per HTTP request, by route template",
+    ("route",),
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200)
+)
+# Statements run in worker threads too, so this counter takes a lock
+SLOW_QUERIES = registry.counter(
+    "nexa_db_slow_queries_total", "Statements slower than SLOW_QUERY_MS", ("route",), synchronized=True
+)
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER_LISTS = re.compile(r"\((?:\s*(?:\?|%\(\w+\)s|:\w+)\s*,)+\s*(?:\?|%\(\w+\)s|:\w+)\s*\)")
+
+def statement_shape(statement: str) -> str:
+    """Normalize a statement so queries differing only in IN-list length share a shape"""
+    return _PLACEHOLDER_LISTS.sub("(?...)", _WHITESPACE.sub(" ", statement).strip())
+
+class QueryStats:
+    """Statements issued while serving one request"""
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.count = 0
+        self.total_ms = 0.0
+        self.shapes: Dict[str, int] = {}
+        # Set once the response is sent; background tasks still see these stats
+        # through the context but their statements are not the request's
+        self.finished = False
+        self._lock = threading.Lock()  # Widgets may query from threadpool workers
+
+    def record(self, statement: str, elapsed_ms: float):
+        shape = statement_shape(statement)
+        with self._lock:
+            self.count += 1
+            self.total_ms += elapsed_ms
+            self.shapes[shape] = self.shapes.get(shape, 0) + 1
+
+    @property
+    def route(self) -> str:
+        return f"{self.scope['method']} {route_template(self.scope)}"
+
+current_stats: ContextVar[Optional[QueryStats]] = ContextVar("current_query_stats", default=None)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_start_time"].pop()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    stats = current_stats.get()
+    if stats is not None and stats.finished:
+        stats = None
+
+    if stats is not None:
+        stats.record(statement, elapsed_ms)
+
+    if elapsed_ms >= SLOW_QUERY_MS:
+        route = stats.route if stats else "background"
+        SLOW_QUERIES.inc(route)
+        logger.warning(f"Slow query ({elapsed_ms:.1f} ms) in {route}: {_WHITESPACE.sub(' ', statement)}")
+
+def install(engine):
+    """Attach the timing hooks to an engine"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+class QueryCountMiddleware:
+    """
+    ASGI middleware counting the statements of each request and flagging repeated
+    shapes. Counting stops when the last response chunk is sent, so background tasks
+    started by the request are not charged to its route
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats(scope)
+        token = current_stats.set(stats)
+
+        def finish():
+            if stats.finished:
+                return
+            stats.finished = True
+            QUERIES_PER_REQUEST.observe(route_template(scope), value=stats.count)
+            for shape, count in stats.shapes.items():
+                if count > N_PLUS_ONE_THRESHOLD:
+                    logger.warning(
+                        f"Possible N+1 in {stats.route}: statement repeated {count} times "
+                        f"({stats.count} queries total): {shape}"
+                    )
+
+        async def send_wrapper(message):
+            if DEBUG and message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-query-count", str(stats.count).encode()))
+                headers.append((b"x-query-time-ms", f"{stats.total_ms:.1f}".encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_stats.reset(token)
+            finish()
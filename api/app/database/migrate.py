@@ -4,7 +4,8 @@ This script should be run once to update the database schema.
 """
 import os
 import sqlite3
-from sqlalchemy import create_engine, text
+import json
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 import logging
@@ -156,6 +157,229 @@ def migrate_users_table():
             session.close()
         except Exception as e:
             logger.error(f"Migration error: {e}")
+
+def add_missing_columns(table_name, columns):
+    """
+    Add any of the given columns that are missing from an existing table.
+    `columns` maps column name to its SQL type declaration. Returns the list of added columns.
+    """
+    engine = create_engine(DATABASE_URL)
+    inspector = inspect(engine)
+    
+    if not inspector.has_table(table_name):
+        logger.info(f"{table_name} table doesn't exist yet. No migration needed.")
+        return []
+    
+    existing = {column["name"] for column in inspector.get_columns(table_name)}
+    added = []
+    
+    with engine.begin() as conn:
+        for name, ddl in columns.items():
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {name} {ddl}"))
+                added.append(name)
+    
+    if added:
+        logger.info(f"Added columns to {table_name}: {', '.join(added)}")
+    return added
+
+def ensure_index(index_name, table_name, columns):
+    """Create an index on an existing table if it doesn't exist yet"""
+    engine = create_engine(DATABASE_URL)
+    if not inspect(engine).has_table(table_name):
+        return
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({', '.join(columns)})"))
+
+def migrate_scans_table():
+    """
+    Add pre-computed severity count columns to the scans table and backfill them
+    from the stored summary so list views never need to load the findings JSON
+    """
+    added = add_missing_columns("scans", {
+        "total_findings": "INTEGER DEFAULT 0",
+        "critical_findings": "INTEGER DEFAULT 0",
+        "high_findings": "INTEGER DEFAULT 0",
+        "medium_findings": "INTEGER DEFAULT 0",
+        "low_findings": "INTEGER DEFAULT 0",
+        "info_findings": "INTEGER DEFAULT 0",
+    })
+    if not added:
+        return
+    
+    try:
+        engine = create_engine(DATABASE_URL)
+        with engine.begin() as conn:
+            rows = conn.execute(text("SELECT id, summary FROM scans WHERE summary IS NOT NULL")).fetchall()
+            for scan_id, summary in rows:
+                if isinstance(summary, str):
+                    summary = json.loads(summary or "{}")
+                counts = (summary or {}).get("severity_counts", {})
+                conn.execute(
+                    text("""
+                        UPDATE scans SET total_findings = :total, critical_findings = :critical,
+                            high_findings = :high, medium_findings = :medium,
+                            low_findings = :low, info_findings = :info
+                        WHERE id = :id
+                    """),
+                    {
+                        "id": scan_id,
+                        "total": sum(counts.values()),
+                        "critical": counts.get("critical", 0),
+                        "high": counts.get("high", 0),
+                        "medium": counts.get("medium", 0),
+                        "low": counts.get("low", 0),
+                        "info": counts.get("info", 0),
+                    }
+                )
+        logger.info(f"Backfilled severity counts for {len(rows)} scans.")
+    except Exception as e:
+        logger.error(f"Migration error: {e}")
+
+def migrate_vulnerabilities_table():
+    """Add the index used by the per-day dashboard aggregations"""
+    try:
+        ensure_index("ix_vulnerabilities_user_discovered", "vulnerabilities", ["user_id", "discovered"])
+    except Exception as e:
+        logger.error(f"Migration error: {e}")
+
+def migrate_cvss_columns():
+    """Add the CVSS vector, packed metrics and temporal/environmental score columns"""
+    try:
+        add_missing_columns("vulnerabilities", {
+            "cvss_vector": "VARCHAR",
+            "cvss_metrics": "BIGINT",
+            "cvss_temporal_score": "FLOAT",
+            "cvss_environmental_score": "FLOAT",
+        })
+        ensure_index("ix_vulnerabilities_user_cvss", "vulnerabilities", ["user_id", "cvss_metrics"])
+    except Exception as e:
+        logger.error(f"Migration error: {e}")
+
+def migrate_daily_stats():
+    """Backfill the daily_stats rollup when it is empty but vulnerabilities already exist"""
+    try:
+        from .database import SessionLocal
+        from ..services import rollup_service
+        
+        engine = create_engine(DATABASE_URL)
+        if not inspect(engine).has_table("daily_stats"):
+            logger.info("daily_stats table doesn't exist yet. No migration needed.")
+            return
+        
+        with engine.connect() as conn:
+            has_rollups = conn.execute(text("SELECT 1 FROM daily_stats LIMIT 1")).first() is not None
+            has_vulnerabilities = conn.execute(text("SELECT 1 FROM vulnerabilities LIMIT 1")).first() is not None
+        
+        if has_rollups or not has_vulnerabilities:
+            return
+        
+        logger.info("Building daily_stats rollup from existing vulnerabilities...")
+        db = SessionLocal()
+        try:
+            rows = rollup_service.rebuild(db)
+        finally:
+            db.close()
+        logger.info(f"daily_stats rollup built with {rows} rows.")
+    except Exception as e:
+        logger.error(f"Migration error: {e}")
+
+def migrate_ip_columns():
+    """
+    Add the integer address columns to devices, scans and vulnerabilities, backfill
+    them from the stored addresses and scan targets, and index them for range queries
+    """
+    from ..utils import ipaddr
     
+    try:
+        add_missing_columns("devices", {"ip_hi": "BIGINT", "ip_lo": "BIGINT"})
+        add_missing_columns("scans", {"ip_hi": "BIGINT", "ip_lo": "BIGINT", "ip_end_hi": "BIGINT", "ip_end_lo": "BIGINT"})
+        add_missing_columns("vulnerabilities", {"host": "VARCHAR", "ip_hi": "BIGINT", "ip_lo": "BIGINT"})
+        
+        engine = create_engine(DATABASE_URL)
+        inspector = inspect(engine)
+        with engine.begin() as conn:
+            if inspector.has_table("devices"):
+                rows = conn.execute(text("SELECT id, ip FROM devices WHERE ip_hi IS NULL")).fetchall()
+                updates = [
+                    {"id": device_id, "hi": hi, "lo": lo}
+                    for device_id, ip in rows
+                    for hi, lo in [ipaddr.encode(ip)] if hi is not None
+                ]
+                if updates:
+                    conn.execute(text("UPDATE devices SET ip_hi = :hi, ip_lo = :lo WHERE id = :id"), updates)
+                    logger.info(f"Backfilled integer addresses for {len(updates)} devices.")
+            if inspector.has_table("scans"):
+                rows = conn.execute(text("SELECT id, target FROM scans WHERE ip_hi IS NULL AND target IS NOT NULL")).fetchall()
+                updates = []
+                for scan_id, target in rows:
+                    covered = ipaddr.target_range(target)
+                    if covered:
+                        (hi, lo), (end_hi, end_lo) = ipaddr.split(covered[0]), ipaddr.split(covered[1])
+                        updates.append({"id": scan_id, "hi": hi, "lo": lo, "end_hi": end_hi, "end_lo": end_lo})
+                if updates:
+                    conn.execute(
+                        text("UPDATE scans SET ip_hi = :hi, ip_lo = :lo, ip_end_hi = :end_hi, ip_end_lo = :end_lo WHERE id = :id"),
+                        updates
+                    )
+                    logger.info(f"Backfilled integer target ranges for {len(updates)} scans.")
+        
+        ensure_index("ix_devices_user_ip_int", "devices", ["user_id", "ip_hi", "ip_lo"])
+        ensure_index("ix_scans_user_ip_int", "scans", ["user_id", "ip_hi", "ip_lo"])
+        ensure_index("ix_vulnerabilities_user_ip_int", "vulnerabilities", ["user_id", "ip_hi", "ip_lo"])
+    except Exception as e:
+        logger.error(f"Migration error: {e}")
+
+def migrate_device_vulnerability_counts():
+    """
+    Add per-severity vulnerability counts to devices and the device link to
+    vulnerabilities, attribute existing vulnerabilities by address and recount
+    """
+    try:
+        added = add_missing_columns("devices", {
+            "critical_findings": "INTEGER DEFAULT 0",
+            "high_findings": "INTEGER DEFAULT 0",
+            "medium_findings": "INTEGER DEFAULT 0",
+            "low_findings": "INTEGER DEFAULT 0",
+            "info_findings": "INTEGER DEFAULT 0",
+        })
+        add_missing_columns("vulnerabilities", {"device_id": "VARCHAR"})
+        ensure_index("ix_vulnerabilities_user_device", "vulnerabilities", ["user_id", "device_id"])
+        if not added:
+            return
+        
+        engine = create_engine(DATABASE_URL)
+        unresolved = "(v.status IS NULL OR v.status NOT IN ('resolved', 'false_positive'))"
+        with engine.begin() as conn:
+            conn.execute(text("""
+                UPDATE vulnerabilities SET device_id = (
+                    SELECT d.id FROM devices d
+                    WHERE d.user_id = vulnerabilities.user_id AND d.ip_hi = vulnerabilities.ip_hi AND d.ip_lo = vulnerabilities.ip_lo
+                )
+                WHERE device_id IS NULL AND ip_hi IS NOT NULL
+            """))
+            counts = ", ".join(
+                f"{severity}_findings = (SELECT COUNT(*) FROM vulnerabilities v "
+                f"WHERE v.device_id = devices.id AND LOWER(v.severity) = '{severity}' AND {unresolved})"
+                for severity in ("critical", "high", "medium", "low", "info")
+            )
+            conn.execute(text(f"UPDATE devices SET {counts}"))
+            conn.execute(text(
+                "UPDATE devices SET vulnerabilities = critical_findings + high_findings + medium_findings + low_findings + info_findings"
+            ))
+        logger.info("Attributed vulnerabilities to devices and counted them per severity.")
+    except Exception as e:
+        logger.error(f"Migration error: {e}")
+
+def run_migrations():
+    """Run all schema migrations in order"""
+    migrate_users_table()
+    migrate_scans_table()
+    migrate_vulnerabilities_table()
+    migrate_cvss_columns()
+    migrate_daily_stats()
+    migrate_ip_columns()
+    migrate_device_vulnerability_counts()
+
 if __name__ == "__main__":
-    migrate_users_table() 
\ No newline at end of file
+    run_migrations() 
\ No newline at end of file
@@ -1,9 +1,15 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from .routers import auth, scan, network, vulnerabilities, pentests, dashboard, system, reports, settings
+from .routers import auth, scan, network, vulnerabilities, pentests, dashboard, system, reports, settings, metrics, admin
 from .database.database import create_db_and_tables
-from .database.migrate import migrate_users_table
+from .database.migrate import run_migrations
+from .services.health_service import sampler
+from .services.api_key_service import last_used
+from .core.revocation import revocations
+from .core.metrics import MetricsMiddleware
+from .database.instrumentation import QueryCountMiddleware
+from .core.profiler import ProfilingMiddleware, PROFILE_TOKEN
 import os
 from dotenv import load_dotenv
 import logging
@@ -31,9 +37,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["Content-Type", "Authorization", "Accept", "X-Requested-With"],
-    expose_headers=["Content-Type", "Authorization"],
+    expose_headers=["Content-Type", "Authorization", "X-Query-Count", "X-Query-Time-Ms", "X-Profile-Id", "X-Total-Count"],
 )
 
+# Per-route request metrics, served from /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Per-request SQL query counting and N+1 detection
+app.add_middleware(QueryCountMiddleware)
+
+# Per-request profiling through the X-Profile header, only installed when PROFILE_TOKEN is set
+if PROFILE_TOKEN:
+    app.add_middleware(ProfilingMiddleware)
+
 # Global exception handler for debugging
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -55,6 +71,8 @@ app.include_router(dashboard.router)
 app.include_router(system.router)
 app.include_router(reports.router)
 app.include_router(settings.router)
+app.include_router(metrics.router)
+app.include_router(admin.router)
 
 @app.on_event("startup")
 async def startup():
@@ -65,11 +83,26 @@ async def startup():
         
         # Run migration to update existing schema
         logger.info("Running database migrations...")
-        migrate_users_table()
+        run_migrations()
         logger.info("Migrations completed")
     except Exception as e:
         logger.error(f"Error during startup: {e}")
         # Continue running, as tables might already exist
+    
+    # Start sampling system health in the background
+    sampler.start()
+    
+    # Write API key usage in batches
+    last_used.start()
+    
+    # Load revoked tokens and keep them in sync with other workers
+    revocations.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await sampler.stop()
+    await last_used.stop()
+    await revocations.stop()
 
 @app.get("/")
 async def root():
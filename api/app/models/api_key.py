@@ -0,0 +1,18 @@
+from sqlalchemy import Column, String, DateTime, ForeignKey, JSON
+from sqlalchemy.sql import func
+import uuid
+from ..database.database import Base
+
+class ApiKey(Base):
+    """API key of a machine client. Only the HMAC-SHA256 digest of the key is stored"""
+    __tablename__ = "api_keys"
+
+    id = Column(String, primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String, ForeignKey("users.id"), index=True)
+    name = Column(String)
+    prefix = Column(String)  # First characters of the key, to recognize it in listings
+    key_hash = Column(String(64), unique=True, index=True, nullable=False)
+    scopes = Column(JSON, default=list)
+    created_at = Column(DateTime, default=func.now())
+    last_used_at = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime, nullable=True)
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, String, Date, Integer, ForeignKey
+from ..database.database import Base
+
+class DailyStat(Base):
+    """Vulnerability counts rolled up per user, discovery date, severity and status"""
+    __tablename__ = "daily_stats"
+
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    date = Column(Date, primary_key=True)
+    severity = Column(String, primary_key=True)
+    status = Column(String, primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
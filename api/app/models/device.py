@@ -0,0 +1,58 @@
+from sqlalchemy import Column, String, DateTime, Integer, BigInteger, JSON, ForeignKey, Index, UniqueConstraint
+from sqlalchemy.sql import func
+import uuid
+from ..database.database import Base
+
+class Device(Base):
+    """A network device in a user's inventory, unique per user and IP address"""
+    __tablename__ = "devices"
+    __table_args__ = (
+        UniqueConstraint("user_id", "ip", name="uq_devices_user_ip"),
+        Index("ix_devices_user_type", "user_id", "type"),
+        Index("ix_devices_user_status", "user_id", "status"),
+        Index("ix_devices_user_last_seen", "user_id", "last_seen"),
+        Index("ix_devices_user_ip_int", "user_id", "ip_hi", "ip_lo"),
+    )
+
+    id = Column(String, primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    ip = Column(String, nullable=False)
+    # The address as integers, see app.utils.ipaddr
+    ip_hi = Column(BigInteger)
+    ip_lo = Column(BigInteger)
+    name = Column(String)
+    type = Column(String)
+    status = Column(String, default="online")
+    # Unresolved vulnerabilities attributed to the device, in total and per severity
+    vulnerabilities = Column(Integer, default=0)
+    critical_findings = Column(Integer, default=0)
+    high_findings = Column(Integer, default=0)
+    medium_findings = Column(Integer, default=0)
+    low_findings = Column(Integer, default=0)
+    info_findings = Column(Integer, default=0)
+    first_seen = Column(DateTime, default=func.now())
+    last_seen = Column(DateTime, default=func.now())
+
+class InventoryVersion(Base):
+    """Version of a user's device inventory, bumped by every change to its map attributes"""
+    __tablename__ = "inventory_versions"
+
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+
+class InventoryChange(Base):
+    """
+    One device changed by one inventory version: its map attributes (name, type,
+    status, ip) before and after, null when it was added or removed
+    """
+    __tablename__ = "inventory_changes"
+    __table_args__ = (
+        Index("ix_inventory_changes_user_version", "user_id", "version"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    version = Column(Integer, nullable=False)
+    device_id = Column(String, nullable=False)
+    before = Column(JSON)
+    after = Column(JSON)
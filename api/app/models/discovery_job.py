@@ -0,0 +1,20 @@
+from sqlalchemy import Column, String, DateTime, Integer, ForeignKey, Text
+from sqlalchemy.sql import func
+import uuid
+from ..database.database import Base
+
+class DiscoveryJob(Base):
+    """A host discovery sweep over a network range, with its progress"""
+    __tablename__ = "discovery_jobs"
+
+    id = Column(String, primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String, ForeignKey("users.id"), index=True)
+    target = Column(String)
+    status = Column(String, default="pending")
+    progress = Column(Integer, default=0)
+    hosts_total = Column(Integer, default=0)
+    hosts_scanned = Column(Integer, default=0)
+    devices_found = Column(Integer, default=0)
+    started_at = Column(DateTime, default=func.now())
+    finished_at = Column(DateTime, nullable=True)
+    error = Column(Text, nullable=True)
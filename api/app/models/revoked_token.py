@@ -0,0 +1,10 @@
+from sqlalchemy import Column, String, DateTime
+from ..database.database import Base
+
+class RevokedToken(Base):
+    """A revoked JWT, kept until the token would have expired anyway"""
+    __tablename__ = "revoked_tokens"
+
+    jti = Column(String, primary_key=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked_at = Column(DateTime, nullable=False, index=True)
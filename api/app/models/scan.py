@@ -1,14 +1,22 @@
-from sqlalchemy import Column, String, DateTime, JSON, Integer, Float, ForeignKey
+from sqlalchemy import Column, String, DateTime, JSON, Integer, BigInteger, Float, ForeignKey, Index
 from sqlalchemy.sql import func
 import uuid
 from ..database.database import Base
 
 class Scan(Base):
     __tablename__ = "scans"
+    __table_args__ = (
+        Index("ix_scans_user_ip_int", "user_id", "ip_hi", "ip_lo"),
+    )
 
     id = Column(String, primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
     user_id = Column(String, ForeignKey("users.id"))
     target = Column(String)
+    # First and last address covered by the target as integers, see app.utils.ipaddr
+    ip_hi = Column(BigInteger, nullable=True)
+    ip_lo = Column(BigInteger, nullable=True)
+    ip_end_hi = Column(BigInteger, nullable=True)
+    ip_end_lo = Column(BigInteger, nullable=True)
     scan_type = Column(String)
     status = Column(String, default="pending")
     progress = Column(Integer, default=0)
@@ -17,5 +25,11 @@ class Scan(Base):
     end_time = Column(DateTime, nullable=True)
     findings = Column(JSON, default=list)
     summary = Column(JSON, default=dict)
+    total_findings = Column(Integer, default=0)
+    critical_findings = Column(Integer, default=0)
+    high_findings = Column(Integer, default=0)
+    medium_findings = Column(Integer, default=0)
+    low_findings = Column(Integer, default=0)
+    info_findings = Column(Integer, default=0)
     output_directory = Column(String)
     estimated_time_remaining = Column(Integer, nullable=True) 
\ No newline at end of file
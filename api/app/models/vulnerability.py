@@ -1,10 +1,17 @@
-from sqlalchemy import Column, String, DateTime, Float, ForeignKey, Text
+from sqlalchemy import Column, String, DateTime, Float, BigInteger, ForeignKey, Text, Index
 from sqlalchemy.sql import func
 import uuid
+from datetime import datetime
 from ..database.database import Base
 
 class Vulnerability(Base):
     __tablename__ = "vulnerabilities"
+    __table_args__ = (
+        Index("ix_vulnerabilities_user_discovered", "user_id", "discovered"),
+        Index("ix_vulnerabilities_user_ip_int", "user_id", "ip_hi", "ip_lo"),
+        Index("ix_vulnerabilities_user_device", "user_id", "device_id"),
+        Index("ix_vulnerabilities_user_cvss", "user_id", "cvss_metrics"),
+    )
 
     id = Column(String, primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
     user_id = Column(String, ForeignKey("users.id"))
@@ -13,8 +20,20 @@ class Vulnerability(Base):
     severity = Column(String)
     status = Column(String, default="open")
     affected = Column(String)
-    discovered = Column(DateTime, default=func.now())
+    # Host the finding was reported on, and its address as integers (see app.utils.ipaddr)
+    host = Column(String, nullable=True)
+    ip_hi = Column(BigInteger, nullable=True)
+    ip_lo = Column(BigInteger, nullable=True)
+    # Inventory device the host resolved to, if any
+    device_id = Column(String, nullable=True)
+    # Set on the Python side, the clock the daily_stats rollup buckets by (see rollup_service)
+    discovered = Column(DateTime, default=datetime.now)
     cvss_score = Column(Float, nullable=True)
+    # CVSS v3.1 vector, its metrics packed into an integer (see app.utils.cvss) and its other scores
+    cvss_vector = Column(String, nullable=True)
+    cvss_metrics = Column(BigInteger, nullable=True)
+    cvss_temporal_score = Column(Float, nullable=True)
+    cvss_environmental_score = Column(Float, nullable=True)
     cve_id = Column(String, nullable=True)
     remediation = Column(Text, nullable=True)
     created_at = Column(DateTime, default=func.now())
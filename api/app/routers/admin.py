@@ -0,0 +1,54 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+from ..core.security import get_current_admin
+from ..core import profiler
+from ..schemas.auth import User
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["Admin"],
+)
+
+def _collapsed_response(collapsed: str, filename: str, samples: int) -> PlainTextResponse:
+    return PlainTextResponse(
+        collapsed,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Profile-Samples": str(samples)
+        }
+    )
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile_process(
+    seconds: float = Query(10, gt=0, le=profiler.MAX_PROFILE_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=100, description="Milliseconds between samples"),
+    current_user: User = Depends(get_current_admin)
+):
+    """
+    Sample the stacks of every thread, including the event loop, for `seconds` seconds.
+    Returns collapsed stacks for flamegraph.pl or speedscope.
+    """
+    if not profiler.profile_lock.acquire(blocking=False):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A profile is already running")
+    try:
+        sampler = await run_in_threadpool(profiler.profile_for, seconds, interval_ms / 1000)
+    finally:
+        profiler.profile_lock.release()
+    return _collapsed_response(sampler.collapsed(), "profile.folded", sampler.samples)
+
+@router.get("/profiles")
+async def list_request_profiles(current_user: User = Depends(get_current_admin)):
+    """List the stored per-request profiles (requests sent with the X-Profile header)"""
+    return [
+        {"id": profile_id, "route": profile["route"], "samples": int(profile["samples"])}
+        for profile_id, profile in reversed(profiler.recent_profiles.items())
+    ]
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_request_profile(profile_id: str, current_user: User = Depends(get_current_admin)):
+    """Get the collapsed stacks of a profiled request"""
+    profile = profiler.recent_profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return _collapsed_response(profile["collapsed"], f"request-{profile_id}.folded", int(profile["samples"]))
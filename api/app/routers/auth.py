@@ -2,12 +2,16 @@ from fastapi import APIRouter, Depends, HTTPException, status, Response, Request
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from jose import JWTError, jwt
-from typing import Optional
+from typing import List, Optional
 import os
-from datetime import timedelta
+from datetime import datetime, timedelta
 
 from ..database.database import get_db
-from ..schemas.auth import LoginRequest, LoginResponse, SignupRequest, SignupResponse, User, Token, RefreshTokenRequest
+from ..schemas.auth import (
+    LoginRequest, LoginResponse, SignupRequest, SignupResponse, User, Token, RefreshTokenRequest,
+    ApiKey, ApiKeyCreate, ApiKeyCreated
+)
+from ..services import api_key_service
 from ..services.auth_service import authenticate_user, create_user, generate_token_for_user, generate_tokens_for_user, get_user_by_id
 from ..core.security import (
     get_current_user, 
@@ -15,8 +19,12 @@ from ..core.security import (
     clear_auth_cookies, 
     SECRET_KEY, 
     ALGORITHM,
-    create_access_token
+    create_access_token,
+    get_token_from_cookie_or_header,
+    revoke_token
 )
+from ..core.revocation import revocations
+from ..core.throttle import check_login, record_login_failure, record_login_success, release_login
 
 router = APIRouter(
     prefix="/auth",
@@ -25,15 +33,23 @@ router = APIRouter(
 )
 
 @router.post("/login/json", response_model=LoginResponse)
-async def login_json(login_data: LoginRequest, response: Response, db: Session = Depends(get_db)):
-    user = authenticate_user(db, login_data.email, login_data.password)
+async def login_json(login_data: LoginRequest, request: Request, response: Response, db: Session = Depends(get_db)):
+    check_login(request, login_data.email)
+    try:
+        user = await authenticate_user(db, login_data.email, login_data.password)
+    except Exception:
+        release_login(request, login_data.email)
+        raise
     if not user:
+        record_login_failure(request, login_data.email)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    record_login_success(request, user.email)
+    
     # Generate tokens
     tokens = generate_tokens_for_user(user)
     access_token = tokens["access_token"]
@@ -66,18 +82,27 @@ async def get_user_profile(current_user: User = Depends(get_current_user)):
 
 @router.post("/login/token", response_model=Token)
 async def login_for_access_token(
+    request: Request,
     response: Response,
     form_data: OAuth2PasswordRequestForm = Depends(), 
     db: Session = Depends(get_db)
 ):
-    user = authenticate_user(db, form_data.username, form_data.password)
+    check_login(request, form_data.username)
+    try:
+        user = await authenticate_user(db, form_data.username, form_data.password)
+    except Exception:
+        release_login(request, form_data.username)
+        raise
     if not user:
+        record_login_failure(request, form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    record_login_success(request, user.email)
+    
     # Generate tokens
     tokens = generate_tokens_for_user(user)
     access_token = tokens["access_token"]
@@ -95,7 +120,7 @@ async def login_for_access_token(
 
 @router.post("/signup", response_model=SignupResponse)
 async def signup(signup_data: SignupRequest, response: Response, db: Session = Depends(get_db)):
-    user = create_user(db, signup_data)
+    user = await create_user(db, signup_data)
     
     # Generate tokens
     tokens = generate_tokens_for_user(user)
@@ -123,11 +148,21 @@ async def signup(signup_data: SignupRequest, response: Response, db: Session = D
     )
 
 @router.post("/logout")
-async def logout(response: Response, current_user: User = Depends(get_current_user)):
+async def logout(
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    access_token: Optional[str] = Depends(get_token_from_cookie_or_header),
+    db: Session = Depends(get_db),
+    refresh_token_data: RefreshTokenRequest = None,
+    refresh_token_cookie: Optional[str] = Cookie(None, alias="refresh_token")
+):
+    # Revoke the session's tokens so they can't be used until they expire
+    revoke_token(db, access_token)
+    revoke_token(db, refresh_token_data.refresh_token if refresh_token_data and refresh_token_data.refresh_token else refresh_token_cookie)
+    
     # Clear cookies for frontend
     clear_auth_cookies(response)
     
-    # For stateless JWT, no server-side action needed
     return {"status": "success", "message": "Logged out successfully"}
 
 @router.post("/refresh", response_model=Token)
@@ -152,8 +187,10 @@ async def refresh_token(
         # Decode the refresh token
         payload = jwt.decode(refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
+        jti = payload.get("jti")
         
-        if user_id is None:
+        # Refresh tokens are single use: each refresh revokes the presented token
+        if user_id is None or payload.get("type") != "refresh" or not jti or revocations.is_revoked(jti, db):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid refresh token",
@@ -169,28 +206,46 @@ async def refresh_token(
                 headers={"WWW-Authenticate": "Bearer"},
             )
         
-        # Create new access token
-        access_token_expires = timedelta(minutes=int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30)))
-        access_token = create_access_token(
-            data={"sub": user_id},
-            expires_delta=access_token_expires
-        )
-        
-        # Set new access token cookie
-        response.set_cookie(
-            key="access_token",
-            value=access_token,
-            httponly=True,
-            max_age=int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30)) * 60,
-            samesite="lax",
-            secure=os.getenv("ENVIRONMENT", "development") == "production"
-        )
+        # Rotate: claim the presented refresh token and issue a new pair. The check above
+        # only turns away tokens already known to be used; two concurrent refreshes both
+        # pass it, and the insert decides which one wins
+        if not revocations.claim(db, jti, datetime.utcfromtimestamp(payload["exp"])):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid refresh token",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        tokens = generate_tokens_for_user(user)
+        set_auth_cookies(response, tokens["access_token"], tokens["refresh_token"])
         
-        # Return new access token
-        return Token(access_token=access_token, token_type="bearer", refresh_token=refresh_token)
+        return Token(access_token=tokens["access_token"], token_type="bearer", refresh_token=tokens["refresh_token"])
     except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid refresh token",
             headers={"WWW-Authenticate": "Bearer"},
-        ) 
\ No newline at end of file
+        )
+
+@router.post("/api-keys", response_model=ApiKeyCreated)
+async def create_api_key(
+    key_data: ApiKeyCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Create an API key for machine clients. The key is only shown in this response"""
+    api_key, key = api_key_service.create_api_key(
+        db, current_user.id, key_data.name, key_data.scopes, key_data.expiresInDays
+    )
+    return ApiKeyCreated(**ApiKey.model_validate(api_key).model_dump(), key=key)
+
+@router.get("/api-keys", response_model=List[ApiKey])
+async def list_api_keys(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """List the current user's API keys"""
+    return api_key_service.get_user_api_keys(db, current_user.id)
+
+@router.delete("/api-keys/{key_id}")
+async def delete_api_key(key_id: str, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Revoke an API key"""
+    if not api_key_service.delete_api_key(db, current_user.id, key_id):
+        raise HTTPException(status_code=404, detail="API key not found")
+    return {"status": "success", "message": "API key revoked"}
@@ -1,16 +1,21 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List, Dict
-from sqlalchemy import func, desc, or_
-from ..database.database import get_db
-from ..schemas.dashboard import SystemHealth, Alert, ThreatDataPoint, DashboardOverview, TrendsData, RecentActivity, SecurityScore
+from typing import List, Dict, Literal, Optional
+from sqlalchemy import desc, text
+from ..database.database import get_db, SessionLocal
+from ..schemas.dashboard import SystemHealth, Alert, ThreatDataPoint, DashboardOverview, TrendsData, RecentActivity, SecurityScore, WidgetResult, DashboardBundle
 from ..core.security import get_current_user
+from ..core.cache import dashboard_cache
 from ..schemas.auth import User
 from ..models.scan import Scan
 from ..models.pentest import Pentest
 from ..models.vulnerability import Vulnerability
-import random
+from ..services import dashboard_service, health_service
 import uuid
+import time
+import asyncio
 from datetime import datetime, timedelta
 
 router = APIRouter(
@@ -18,27 +23,12 @@ router = APIRouter(
     tags=["Dashboard"],
 )
 
-# System health is still mocked as it would depend on an actual monitoring system
-MOCK_SYSTEM_HEALTH = {
-    "status": "healthy",
-    "cpu": 32.5,
-    "memory": 45.2,
-    "disk": 28.7,
-    "uptime": 432000,  # 5 days in seconds
-    "lastUpdate": datetime.now().isoformat(),
-    "error": None
-}
-
 @router.get("/system-health", response_model=SystemHealth)
 async def get_system_health(current_user: User = Depends(get_current_user)):
-    """Get system health information"""
-    return SystemHealth(**MOCK_SYSTEM_HEALTH)
+    """Get system health information from the latest background sample"""
+    return SystemHealth(**health_service.to_system_health(health_service.sampler.latest()))
 
-@router.get("/alerts", response_model=List[Alert])
-async def get_alerts(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
+def compute_alerts(db: Session, current_user: User):
     """Get security alerts"""
     # Create alerts based on actual vulnerabilities and failed scans
     alerts = []
@@ -104,201 +94,91 @@ async def get_alerts(
     
     return alerts
 
-@router.get("/threat-data", response_model=List[ThreatDataPoint])
-async def get_threat_data(
+@router.get("/alerts", response_model=List[Alert])
+@dashboard_cache.cached("alerts")
+async def get_alerts(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    """Get security alerts"""
+    return compute_alerts(db, current_user)
+
+def compute_threat_data(db: Session, current_user: User, days: int, bucket: Literal["day", "week", "month"]):
     """Get threat data for visualization"""
-    # Get vulnerability counts by severity and date for the last 7 days
-    threat_data = []
+    # Vulnerability counts by severity for each bucket, in a single grouped query
+    series = dashboard_service.get_severity_series(db, current_user.id, days, bucket)
     
-    # Get date range
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=7)
-    
-    # Try to get real data first
-    try:
-        # Query vulnerabilities by severity for each day and severity
-        for i in range(7):
-            current_date = end_date - timedelta(days=i)
-            current_date_start = datetime(current_date.year, current_date.month, current_date.day)
-            current_date_end = current_date_start + timedelta(days=1)
-            date_str = current_date_start.strftime("%Y-%m-%d")
-            
-            # Query vulnerabilities by severity for this day
-            for severity in ["critical", "high", "medium", "low"]:
-                # Try to get real count from database
-                count = db.query(func.count(Vulnerability.id)).filter(
-                    Vulnerability.user_id == current_user.id,
-                    Vulnerability.severity == severity,
-                    Vulnerability.discovered >= current_date_start,
-                    Vulnerability.discovered < current_date_end
-                ).scalar() or 0
-                
-                # If no real data, use random mock data
-                if count == 0 and random.random() < 0.7:  # 70% chance to add mock data for empty entries
-                    if severity == "critical":
-                        count = random.randint(0, 2)
-                    elif severity == "high":
-                        count = random.randint(0, 5)
-                    elif severity == "medium":
-                        count = random.randint(1, 8)
-                    else:  # low
-                        count = random.randint(2, 10)
-                
-                if count > 0:  # Only add entries with non-zero counts to reduce clutter
-                    threat_data.append(ThreatDataPoint(
-                        date=date_str,
-                        severity=severity,
-                        count=count
-                    ))
-    except Exception as e:
-        # If database query fails, generate mock data
-        print(f"Error querying threat data: {e}")
-        for i in range(7):
-            current_date = end_date - timedelta(days=i)
-            date_str = current_date.strftime("%Y-%m-%d")
-            
-            for severity in ["critical", "high", "medium", "low"]:
-                if random.random() < 0.8:  # 80% chance to add an entry
-                    if severity == "critical":
-                        count = random.randint(0, 3)
-                    elif severity == "high":
-                        count = random.randint(1, 7)
-                    elif severity == "medium":
-                        count = random.randint(2, 10)
-                    else:  # low
-                        count = random.randint(3, 15)
-                    
-                    if count > 0:  # Only add entries with non-zero counts
-                        threat_data.append(ThreatDataPoint(
-                            date=date_str,
-                            severity=severity,
-                            count=count
-                        ))
-    
-    # Ensure we have at least some data
-    if not threat_data:
-        # Generate fallback data if we have none
-        for i in range(7):
-            current_date = end_date - timedelta(days=i)
-            date_str = current_date.strftime("%Y-%m-%d")
-            
-            threat_data.extend([
-                ThreatDataPoint(date=date_str, severity="critical", count=random.randint(0, 2)),
-                ThreatDataPoint(date=date_str, severity="high", count=random.randint(1, 5)),
-                ThreatDataPoint(date=date_str, severity="medium", count=random.randint(2, 8)),
-                ThreatDataPoint(date=date_str, severity="low", count=random.randint(3, 12))
-            ])
-    
-    return threat_data
+    # Only return entries with non-zero counts to reduce clutter
+    return [ThreatDataPoint(**point) for point in series if point["count"] > 0]
 
-@router.get("/overview", response_model=DashboardOverview)
-async def get_dashboard_overview(
+@router.get("/threat-data", response_model=List[ThreatDataPoint])
+@dashboard_cache.cached("threat-data")
+async def get_threat_data(
+    days: int = Query(7, ge=1, le=365),
+    bucket: Literal["day", "week", "month"] = Query("day"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    """Get threat data for visualization"""
+    return compute_threat_data(db, current_user, days=days, bucket=bucket)
+
+def compute_overview(db: Session, current_user: User):
     """Get dashboard overview statistics"""
-    # Get real statistics from the database
+    stats = dashboard_service.get_user_stats(db, current_user.id)
     
-    # Scan statistics
-    total_scans = db.query(func.count(Scan.id)).filter(
-        Scan.user_id == current_user.id
-    ).scalar() or 0
-    
-    active_scans = db.query(func.count(Scan.id)).filter(
-        Scan.user_id == current_user.id,
-        or_(Scan.status == "running", Scan.status == "pending")
-    ).scalar() or 0
-    
-    # Pentest statistics
-    total_pentests = db.query(func.count(Pentest.id)).filter(
-        Pentest.user_id == current_user.id
-    ).scalar() or 0
-    
-    active_pentests = db.query(func.count(Pentest.id)).filter(
-        Pentest.user_id == current_user.id,
-        or_(Pentest.status == "running", Pentest.status == "pending")
-    ).scalar() or 0
-    
-    # Vulnerability statistics by severity
-    vulnerability_statistics = {}
-    for severity in ["critical", "high", "medium", "low"]:
-        count = db.query(func.count(Vulnerability.id)).filter(
-            Vulnerability.user_id == current_user.id,
-            Vulnerability.severity == severity,
-            Vulnerability.status != "resolved",
-            Vulnerability.status != "false_positive"
-        ).scalar() or 0
-        
-        vulnerability_statistics[severity] = count
+    # Vulnerability statistics by severity (everything not resolved or a false positive)
+    vulnerability_statistics = stats["vulnerabilities"]["unresolved"]
     
     # Finding statistics (aggregate from scan and pentest findings)
     # We'll use vulnerability counts for now since we don't have a separate findings model
     finding_statistics = vulnerability_statistics.copy()
     
     return DashboardOverview(
-        total_scans=total_scans,
-        total_pentests=total_pentests,
-        active_scans=active_scans,
-        active_pentests=active_pentests,
+        total_scans=stats["scans"]["total"],
+        total_pentests=stats["pentests"]["total"],
+        active_scans=stats["scans"]["active"],
+        active_pentests=stats["pentests"]["active"],
         vulnerability_statistics=vulnerability_statistics,
         finding_statistics=finding_statistics
     )
 
-@router.get("/trends", response_model=TrendsData)
-async def get_trends_data(
+@router.get("/overview", response_model=DashboardOverview)
+@dashboard_cache.cached("overview")
+async def get_dashboard_overview(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    """Get dashboard overview statistics"""
+    return compute_overview(db, current_user)
+
+def compute_trends(db: Session, current_user: User, days: int, bucket: Literal["day", "week", "month"]):
     """Get trends data for charts"""
-    vulnerability_trends = []
-    finding_trends = []
-    
-    # Get date range for the last 30 days
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=30)
-    
-    # Get vulnerability trends
-    for i in range(30):
-        current_date = end_date - timedelta(days=i)
-        current_date_start = datetime(current_date.year, current_date.month, current_date.day)
-        current_date_end = current_date_start + timedelta(days=1)
-        date_str = current_date_start.strftime("%Y-%m-%d")
-        
-        # Get critical and high severity vulnerabilities for this day
-        for severity in ["critical", "high"]:
-            count = db.query(func.count(Vulnerability.id)).filter(
-                Vulnerability.user_id == current_user.id,
-                Vulnerability.severity == severity,
-                Vulnerability.discovered >= current_date_start,
-                Vulnerability.discovered < current_date_end
-            ).scalar() or 0
-            
-            vulnerability_trends.append(ThreatDataPoint(
-                date=date_str,
-                severity=severity,
-                count=count
-            ))
-            
-            # For findings trends, we'll use the same data for now
-            finding_trends.append(ThreatDataPoint(
-                date=date_str,
-                severity=severity,
-                count=count
-            ))
+    # Critical and high severity vulnerabilities per bucket, zero-filled
+    series = dashboard_service.get_severity_series(
+        db, current_user.id, days, bucket, severities=["critical", "high"]
+    )
+    vulnerability_trends = [ThreatDataPoint(**point) for point in series]
+    
+    # For findings trends, we'll use the same data for now
+    finding_trends = [ThreatDataPoint(**point) for point in series]
     
     return TrendsData(
         vulnerability_trends=vulnerability_trends,
         finding_trends=finding_trends
     )
 
-@router.get("/recent-activity", response_model=RecentActivity)
-async def get_recent_activity(
+@router.get("/trends", response_model=TrendsData)
+@dashboard_cache.cached("trends")
+async def get_trends_data(
+    days: int = Query(30, ge=1, le=365),
+    bucket: Literal["day", "week", "month"] = Query("day"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    """Get trends data for charts"""
+    return compute_trends(db, current_user, days=days, bucket=bucket)
+
+def compute_recent_activity(db: Session, current_user: User):
     """Get recent activity data"""
     # Get recent scans
     recent_scans = db.query(Scan).filter(
@@ -355,89 +235,59 @@ async def get_recent_activity(
         recent_findings=recent_findings
     )
 
-@router.get("/monthly-summary")
-async def get_monthly_summary(
+@router.get("/recent-activity", response_model=RecentActivity)
+@dashboard_cache.cached("recent-activity")
+async def get_recent_activity(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get monthly summary data"""
-    # Get month range
-    end_date = datetime.now()
-    start_date = datetime(end_date.year, end_date.month, 1)  # First day of current month
-    
-    # Get scan and pentest counts for the month
-    total_scans = db.query(func.count(Scan.id)).filter(
-        Scan.user_id == current_user.id,
-        Scan.start_time >= start_date
-    ).scalar() or 0
-    
-    total_pentests = db.query(func.count(Pentest.id)).filter(
-        Pentest.user_id == current_user.id,
-        Pentest.start_time >= start_date
-    ).scalar() or 0
-    
-    # Get vulnerability counts by severity
-    critical_vulnerabilities = db.query(func.count(Vulnerability.id)).filter(
-        Vulnerability.user_id == current_user.id,
-        Vulnerability.severity == "critical",
-        Vulnerability.discovered >= start_date
-    ).scalar() or 0
-    
-    high_vulnerabilities = db.query(func.count(Vulnerability.id)).filter(
-        Vulnerability.user_id == current_user.id,
-        Vulnerability.severity == "high",
-        Vulnerability.discovered >= start_date
-    ).scalar() or 0
-    
-    # Calculate month-over-month changes (we'll mock this as we don't have previous month data)
-    scan_mom_change = random.randint(-20, 50)
-    pentest_mom_change = random.randint(-20, 50)
-    vulnerability_mom_change = random.randint(-30, 30)
+    """Get recent activity data"""
+    return compute_recent_activity(db, current_user)
+
+def compute_monthly_summary(db: Session, current_user: User, year: Optional[int], month: Optional[int]):
+    """Get monthly summary data (defaults to the current month)"""
+    stats = dashboard_service.get_user_stats(db, current_user.id, year, month)
+    scans = stats["scans"]
+    pentests = stats["pentests"]
+    this_month = stats["vulnerabilities"]["this_month"]
+    previous_month = stats["vulnerabilities"]["previous_month"]
     
     return {
-        "total_scans": total_scans,
-        "total_pentests": total_pentests,
-        "critical_vulnerabilities": critical_vulnerabilities,
-        "high_vulnerabilities": high_vulnerabilities,
-        "scan_mom_change": scan_mom_change,
-        "pentest_mom_change": pentest_mom_change,
-        "vulnerability_mom_change": vulnerability_mom_change
+        "total_scans": scans["this_month"],
+        "total_pentests": pentests["this_month"],
+        "critical_vulnerabilities": this_month["critical"],
+        "high_vulnerabilities": this_month["high"],
+        "scan_mom_change": dashboard_service.percent_change(scans["this_month"], scans["previous_month"]),
+        "pentest_mom_change": dashboard_service.percent_change(pentests["this_month"], pentests["previous_month"]),
+        "vulnerability_mom_change": dashboard_service.percent_change(
+            sum(this_month.values()), sum(previous_month.values())
+        )
     }
 
-@router.get("/security-score", response_model=SecurityScore)
-async def get_security_score(
+@router.get("/monthly-summary")
+@dashboard_cache.cached("monthly-summary")
+async def get_monthly_summary(
+    year: Optional[int] = Query(None, ge=2000, le=9999),
+    month: Optional[int] = Query(None, ge=1, le=12),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    """Get monthly summary data (defaults to the current month)"""
+    return compute_monthly_summary(db, current_user, year=year, month=month)
+
+def compute_security_score(db: Session, current_user: User):
     """Get security score"""
     # Calculate security score based on vulnerabilities
     # Start with a perfect score and deduct based on vulnerabilities
     base_score = 100
     
     # Count open vulnerabilities by severity
-    critical_count = db.query(func.count(Vulnerability.id)).filter(
-        Vulnerability.user_id == current_user.id,
-        Vulnerability.severity == "critical",
-        Vulnerability.status == "open"
-    ).scalar() or 0
-    
-    high_count = db.query(func.count(Vulnerability.id)).filter(
-        Vulnerability.user_id == current_user.id,
-        Vulnerability.severity == "high",
-        Vulnerability.status == "open"
-    ).scalar() or 0
-    
-    medium_count = db.query(func.count(Vulnerability.id)).filter(
-        Vulnerability.user_id == current_user.id,
-        Vulnerability.severity == "medium",
-        Vulnerability.status == "open"
-    ).scalar() or 0
-    
-    low_count = db.query(func.count(Vulnerability.id)).filter(
-        Vulnerability.user_id == current_user.id,
-        Vulnerability.severity == "low",
-        Vulnerability.status == "open"
-    ).scalar() or 0
+    bounds = dashboard_service.get_month_bounds()
+    vulnerability_counts = dashboard_service.get_vulnerability_stats(db, current_user.id, bounds)["open"]
+    critical_count = vulnerability_counts["critical"]
+    high_count = vulnerability_counts["high"]
+    medium_count = vulnerability_counts["medium"]
+    low_count = vulnerability_counts["low"]
     
     # Apply deductions based on severity
     # Critical: -15 points each, up to -60
@@ -483,7 +333,115 @@ async def get_security_score(
         recommendations.append("Keep up the good work! Continue regular security testing.")
     
     return SecurityScore(
-        score=final_score,
-        label=score_label,
+        security_score=final_score,
+        risk_level=score_label,
+        vulnerability_counts=vulnerability_counts,
+        finding_counts=vulnerability_counts.copy(),
         recommendations=recommendations
-    ) 
\ No newline at end of file
+    )
+
+@router.get("/security-score", response_model=SecurityScore)
+@dashboard_cache.cached("security-score")
+async def get_security_score(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get security score"""
+    return compute_security_score(db, current_user)
+
+def compute_system_health(db: Session, current_user: User):
+    """Latest system health sample; it is not read from the database"""
+    return SystemHealth(**health_service.to_system_health(health_service.sampler.latest()))
+
+# Widgets available through /dashboard/bundle and the arguments they are computed with.
+# These are the uncached compute functions: the bundle must read its snapshot, not
+# whatever an earlier request left in the response cache.
+BUNDLE_WIDGETS = {
+    "overview": (compute_overview, {}),
+    "alerts": (compute_alerts, {}),
+    "threat-data": (compute_threat_data, {"days": 7, "bucket": "day"}),
+    "trends": (compute_trends, {"days": 30, "bucket": "day"}),
+    "recent-activity": (compute_recent_activity, {}),
+    "security-score": (compute_security_score, {}),
+    "monthly-summary": (compute_monthly_summary, {"year": None, "month": None}),
+    "system-health": (compute_system_health, {}),
+}
+
+def _run_widget(name: str, db: Session, current_user: User) -> WidgetResult:
+    """Compute one widget on the given session and time it"""
+    compute, arguments = BUNDLE_WIDGETS[name]
+    started = time.perf_counter()
+    try:
+        data = jsonable_encoder(compute(db, current_user, **arguments))
+        return WidgetResult(data=data, duration_ms=round((time.perf_counter() - started) * 1000, 2))
+    except Exception as e:
+        return WidgetResult(error=str(e), duration_ms=round((time.perf_counter() - started) * 1000, 2))
+
+def _compute_in_snapshot(name: str, current_user: User, snapshot_id: str) -> WidgetResult:
+    """Compute one widget on its own session, joined to the exported Postgres snapshot"""
+    db = SessionLocal()
+    try:
+        db.execute(text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ"))
+        db.execute(text(f"SET TRANSACTION SNAPSHOT '{snapshot_id}'"))
+        return _run_widget(name, db, current_user)
+    finally:
+        db.rollback()
+        db.close()
+
+def _compute_in_transaction(names: List[str], current_user: User, db: Session) -> Dict[str, WidgetResult]:
+    """
+    Compute widgets one after the other inside an explicit read transaction on the
+    request session. pysqlite does not begin a transaction for SELECTs on its own, so
+    without the BEGIN every query would see the latest commit.
+    """
+    db.rollback()
+    db.execute(text("BEGIN"))
+    try:
+        return {name: _run_widget(name, db, current_user) for name in names}
+    finally:
+        db.rollback()
+
+@router.get("/bundle", response_model=DashboardBundle)
+async def get_dashboard_bundle(
+    widgets: List[str] = Query(list(BUNDLE_WIDGETS)),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get several dashboard widgets in one request. The user is resolved once and every
+    widget is computed uncached against the same database snapshot; each result carries
+    its own timing.
+    """
+    names = list(dict.fromkeys(name for value in widgets for name in value.split(",") if name))
+    unknown = [name for name in names if name not in BUNDLE_WIDGETS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown widgets: {', '.join(unknown)}")
+    
+    started = time.perf_counter()
+    if db.bind.dialect.name == "postgresql":
+        # Export a repeatable-read snapshot and compute the widgets concurrently in worker
+        # threads, each on its own connection that imports the snapshot. Authentication
+        # may already have queried this session, and SET TRANSACTION must come first
+        db.rollback()
+        db.execute(text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ"))
+        snapshot_id = db.execute(text("SELECT pg_export_snapshot()")).scalar()
+        try:
+            computed = await asyncio.gather(*[
+                run_in_threadpool(_compute_in_snapshot, name, current_user, snapshot_id) for name in names
+            ])
+        finally:
+            db.rollback()
+        results = dict(zip(names, computed))
+        snapshot = "exported"
+    else:
+        # SQLite cannot share a snapshot between connections, so the widgets run in one
+        # deferred read transaction on the request session; its shared lock keeps every
+        # query on the same database state until the rollback
+        results = await run_in_threadpool(_compute_in_transaction, names, current_user, db)
+        snapshot = "transaction"
+    
+    return DashboardBundle(
+        widgets=results,
+        duration_ms=round((time.perf_counter() - started) * 1000, 2),
+        snapshot=snapshot
+    )
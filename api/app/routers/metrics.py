@@ -0,0 +1,65 @@
+from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import func
+from ..database.database import SessionLocal, engine
+from ..core.metrics import registry, Gauge
+from ..core.cache import caches
+from ..models.scan import Scan
+from ..models.pentest import Pentest
+import hmac
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+router = APIRouter(tags=["Metrics"])
+
+# Optional bearer token required to scrape /metrics
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+def collect_job_states():
+    """Scans and pentests by status; pending and running ones are the job queue"""
+    gauge = Gauge("nexa_jobs", "Scans and pentests by kind and status", ("kind", "status"))
+    db = SessionLocal()
+    try:
+        for kind, model in (("scan", Scan), ("pentest", Pentest)):
+            for status, count in db.query(model.status, func.count(model.id)).group_by(model.status).all():
+                gauge.set(kind, status or "unknown", value=count)
+    finally:
+        db.close()
+    return [gauge]
+
+def collect_db_pool():
+    checked_out = Gauge("nexa_db_pool_checked_out", "Database connections currently checked out of the pool")
+    size = Gauge("nexa_db_pool_size", "Configured database pool size")
+    pool = engine.pool
+    if callable(getattr(pool, "checkedout", None)):
+        checked_out.set(value=pool.checkedout())
+    if callable(getattr(pool, "size", None)):
+        size.set(value=pool.size())
+    return [checked_out, size]
+
+def collect_caches():
+    hits = Gauge("nexa_cache_hits", "Response cache hits", ("cache",))
+    misses = Gauge("nexa_cache_misses", "Response cache misses", ("cache",))
+    ratio = Gauge("nexa_cache_hit_ratio", "Response cache hit ratio", ("cache",))
+    for name, cache in caches.items():
+        stats = cache.stats()
+        hits.set(name, value=stats["hits"])
+        misses.set(name, value=stats["misses"])
+        ratio.set(name, value=stats["hit_ratio"])
+    return [hits, misses, ratio]
+
+registry.add_collector(collect_job_states)
+registry.add_collector(collect_db_pool)
+registry.add_collector(collect_caches)
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics(request: Request):
+    """Expose metrics in the Prometheus text format"""
+    if METRICS_TOKEN:
+        auth_header = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(auth_header, f"Bearer {METRICS_TOKEN}"):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+    
+    return PlainTextResponse(registry.expose(), media_type="text/plain; version=0.0.4")
@@ -1,184 +1,141 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query, Response
 from sqlalchemy.orm import Session
 from ..database.database import get_db
-from ..schemas.network import NetworkMap, NetworkDevice
+from ..schemas.network import NetworkMap, NetworkChanges, NetworkDevice, DiscoveryJob
 from ..core.security import get_current_user
 from ..schemas.auth import User
-import uuid
-import random
-import asyncio
+from ..services import device_service, discovery_service, topology_service
+from ..utils import ipaddr
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Literal, Optional
 
 router = APIRouter(
     prefix="/network",
     tags=["Network Management"],
 )
 
-# In-memory storage for network devices - in a real application, this would be in the database
-# This is a temporary solution until a proper network device model is created
-network_devices = {}
-
 @router.get("/discover")
 async def discover_network(
     background_tasks: BackgroundTasks,
+    target: str = Query(discovery_service.DEFAULT_TARGET, description="CIDR range or address to sweep"),
+    ports: Optional[str] = Query(None, description="Comma-separated TCP ports to probe"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Discover network devices"""
-    # Initiate a background task to "discover" network devices
-    # In a real app, this would scan the network using tools like nmap
-    background_tasks.add_task(simulate_network_discovery, current_user.id)
+    try:
+        network = discovery_service.parse_target(target)
+        tcp_ports = [int(port) for port in ports.split(",")] if ports else list(discovery_service.DEFAULT_TCP_PORTS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not tcp_ports or not all(0 < port < 65536 for port in tcp_ports):
+        raise HTTPException(status_code=400, detail="Ports must be between 1 and 65535")
+    
+    # Sweep the range in the background; devices are added to the inventory as they are found
+    job = discovery_service.create_job(db, current_user.id, network)
+    background_tasks.add_task(discovery_service.run_discovery, job.id, current_user.id, str(network), tcp_ports)
     
     # Return immediate response
     return {
         "status": "success", 
-        "message": "Network discovery started. Check back in a moment for results."
+        "message": "Network discovery started. Check back in a moment for results.",
+        "jobId": job.id,
+        "job": DiscoveryJob(**discovery_service.to_discovery_job(job))
     }
 
-async def simulate_network_discovery(user_id: str):
-    """Simulate network discovery process"""
-    # Generate some network devices for this user
-    # In a real app, this would be the result of actual network scanning
-    
-    # Clear any previous devices for this user
-    if user_id in network_devices:
-        network_devices[user_id] = []
-    else:
-        network_devices[user_id] = []
-    
-    # Generate some simulated devices
-    device_types = ["server", "firewall", "router", "workstation", "printer", "iot"]
-    statuses = ["online", "offline"]
-    
-    # Generate between 4-10 devices
-    num_devices = random.randint(4, 10)
-    ip_prefix = "192.168.1."
-    
-    for i in range(num_devices):
-        device_type = random.choice(device_types)
-        device_id = str(uuid.uuid4())
-        ip = f"{ip_prefix}{random.randint(1, 254)}"
-        
-        device = {
-            "id": device_id,
-            "name": f"{device_type.capitalize()} {i+1}",
-            "ip": ip,
-            "type": device_type,
-            "status": random.choice(statuses),
-            "lastSeen": datetime.now().isoformat(),
-            "vulnerabilities": random.randint(0, 5)
-        }
-        
-        network_devices[user_id].append(device)
-        
-        # Simulate work
-        await asyncio.sleep(0.5)
-    
-    # Add some special devices
-    network_devices[user_id].append({
-        "id": str(uuid.uuid4()),
-        "name": "Web Server",
-        "ip": f"{ip_prefix}10",
-        "type": "server",
-        "status": "online",
-        "lastSeen": datetime.now().isoformat(),
-        "vulnerabilities": 3
-    })
+@router.get("/discover/{job_id}", response_model=DiscoveryJob)
+async def get_discovery_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the progress of a discovery job"""
+    job = discovery_service.get_job(db, current_user.id, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Discovery job not found")
     
-    network_devices[user_id].append({
-        "id": str(uuid.uuid4()),
-        "name": "Database Server",
-        "ip": f"{ip_prefix}11",
-        "type": "server",
-        "status": "online",
-        "lastSeen": datetime.now().isoformat(),
-        "vulnerabilities": 2
-    })
+    return DiscoveryJob(**discovery_service.to_discovery_job(job))
 
 @router.get("/devices/{device_id}", response_model=NetworkDevice)
 async def get_device(
     device_id: str, 
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
     """Get a specific network device"""
-    # Check if user has any devices
-    if current_user.id not in network_devices:
-        # No devices yet, run discovery first
-        raise HTTPException(status_code=404, detail="No devices found. Run network discovery first.")
+    device = device_service.get_device(db, current_user.id, device_id)
+    if device is None:
+        raise HTTPException(status_code=404, detail="Device not found")
     
-    # Find the device in the user's devices
-    for device in network_devices[current_user.id]:
-        if device["id"] == device_id:
-            return NetworkDevice(**device)
+    return NetworkDevice(**device_service.to_network_device(device))
+
+@router.delete("/devices/{device_id}")
+async def delete_device(
+    device_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Remove a device from the inventory"""
+    if not device_service.delete_device(db, current_user.id, device_id):
+        raise HTTPException(status_code=404, detail="Device not found")
     
-    raise HTTPException(status_code=404, detail="Device not found")
+    return {"status": "success", "message": "Device removed"}
 
 @router.get("/devices", response_model=List[NetworkDevice])
 async def get_all_devices(
-    current_user: User = Depends(get_current_user)
+    response: Response,
+    type: Optional[str] = None,
+    status: Optional[str] = None,
+    search: Optional[str] = Query(None, description="Substring of the IP address or name"),
+    seen_since: Optional[datetime] = None,
+    subnet: Optional[str] = Query(None, description="CIDR (10.4.0.0/16), address range (10.0.0.5-10.0.0.50) or address"),
+    sort: Literal["ip", "-ip", "name", "-name", "type", "-type", "status", "-status", "lastSeen", "-lastSeen"] = "ip",
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
-    """Get all network devices"""
-    # Check if user has any devices
-    if current_user.id not in network_devices:
-        # Return empty list instead of error
-        return []
+    """Get a page of network devices. The total number of matches is returned in X-Total-Count"""
+    try:
+        ip_range = ipaddr.parse_range(subnet) if subnet else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    devices, total = device_service.get_devices(
+        db, current_user.id, type=type, status=status, search=search,
+        seen_since=seen_since, ip_range=ip_range, sort=sort, offset=offset, limit=limit
+    )
+    response.headers["X-Total-Count"] = str(total)
     
-    return [NetworkDevice(**device) for device in network_devices[current_user.id]]
+    return [NetworkDevice(**device_service.to_network_device(device)) for device in devices]
 
 @router.get("", response_model=NetworkMap)
 async def get_network_map(
-    current_user: User = Depends(get_current_user)
+    zoom: Literal["auto", "device", "subnet", "site"] = Query(
+        "auto", description="device: one node per device; subnet/site: one node per /24 (/64) or /16 (/48); auto: subnet above NETWORK_MAP_MAX_NODES devices"
+    ),
+    format: Literal["full", "compact"] = Query(
+        "full", description="compact returns node attributes as columns and edges as node indexes"
+    ),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
     """Get network map"""
-    # Check if user has any devices
-    if current_user.id not in network_devices:
-        # No devices yet, return empty map
-        return NetworkMap(nodes=[], connections=[])
-    
-    # Create nodes from devices
-    nodes = []
-    for device in network_devices[current_user.id]:
-        nodes.append({
-            "id": device["id"],
-            "name": device["name"],
-            "type": device["type"],
-            "status": device["status"],
-            "ip": device["ip"]
-        })
-    
-    # Create connections based on device types
-    # In a real app, this would be based on actual network topology discovery
-    connections = []
-    
-    # Find any routers or firewalls to use as central nodes
-    central_nodes = [node for node in nodes if node["type"] in ["router", "firewall"]]
-    
-    if central_nodes:
-        # If we have central nodes, connect other devices to them
-        for central_node in central_nodes:
-            for node in nodes:
-                if node["id"] != central_node["id"]:
-                    connections.append({
-                        "source": central_node["id"],
-                        "target": node["id"],
-                        "type": "direct" if node["type"] == "server" else "indirect"
-                    })
-    else:
-        # Otherwise just create a simple chain of connections
-        for i in range(len(nodes) - 1):
-            connections.append({
-                "source": nodes[i]["id"],
-                "target": nodes[i+1]["id"],
-                "type": "direct" if i % 2 == 0 else "indirect"
-            })
-        
-        # Add a connection between the first and last
-        if len(nodes) > 2:
-            connections.append({
-                "source": nodes[0]["id"],
-                "target": nodes[-1]["id"],
-                "type": "indirect"
-            })
+    # The map is cached already encoded per inventory version, so skip response validation
+    return Response(
+        content=topology_service.get_network_map(db, current_user.id, zoom=zoom, format=format),
+        media_type="application/json"
+    )
+
+@router.get("/changes", response_model=NetworkChanges, responses={304: {"description": "Inventory unchanged since `since`"}})
+async def get_network_changes(
+    since: int = Query(..., ge=0, description="Inventory version the client holds, from a previous map or changes response"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the device-level map nodes and connections added, updated or removed since an inventory version"""
+    changes = topology_service.get_network_changes(db, current_user.id, since)
+    if changes is None:
+        return Response(status_code=304)
     
-    return NetworkMap(nodes=nodes, connections=connections) 
\ No newline at end of file
+    return Response(content=changes, media_type="application/json")
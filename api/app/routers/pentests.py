@@ -1,11 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query
+from sqlalchemy.orm import Session, load_only
+from typing import List, Union, Literal
 from ..database.database import get_db
-from ..schemas.pentests import PentestTarget, PentestStartResponse, PentestStatus, PentestResult
+from ..schemas.pentests import PentestTarget, PentestStartResponse, PentestStatus, PentestResult, PentestSummary
 from ..core.security import get_current_user
 from ..schemas.auth import User
 from ..models.pentest import Pentest
+from ..core import events
+from ..services import export_service
 import uuid
 import random
 import asyncio
@@ -78,6 +80,7 @@ async def start_pentest(
     
     db.add(new_pentest)
     db.commit()
+    events.publish(events.PENTEST_STARTED, user_id=current_user.id, pentest_id=pentest_id)
     
     # Start background task to simulate the pentest
     background_tasks.add_task(run_pentest_task, pentest_id, db)
@@ -167,6 +170,7 @@ async def run_pentest_task(pentest_id: str, db: Session):
     pentest.estimated_time_remaining = 0
     
     db.commit()
+    events.publish(events.PENTEST_COMPLETED, user_id=pentest.user_id, pentest_id=pentest_id)
 
 def generate_pentest_findings(scan_type: str, target: str):
     """Generate realistic pentest findings based on scan type and target"""
@@ -418,12 +422,92 @@ async def get_pentest_results(
         low_findings=pentest.low_findings
     )
 
-@router.get("", response_model=List[PentestResult])
+@router.get("/summary", response_model=List[PentestSummary])
+async def get_pentest_summaries(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """List pentests without loading their findings or summary text"""
+    pentests = db.query(Pentest).options(
+        load_only(
+            Pentest.id,
+            Pentest.target,
+            Pentest.scan_type,
+            Pentest.status,
+            Pentest.progress,
+            Pentest.start_time,
+            Pentest.end_time,
+            Pentest.total_findings,
+            Pentest.critical_findings,
+            Pentest.high_findings,
+            Pentest.medium_findings,
+            Pentest.low_findings
+        )
+    ).filter(Pentest.user_id == current_user.id).all()
+    
+    return [
+        PentestSummary(
+            id=pentest.id,
+            target=pentest.target,
+            start_time=pentest.start_time,
+            end_time=pentest.end_time,
+            status=pentest.status,
+            scan_type=pentest.scan_type,
+            progress=pentest.progress or 0,
+            total_findings=pentest.total_findings or 0,
+            critical_findings=pentest.critical_findings or 0,
+            high_findings=pentest.high_findings or 0,
+            medium_findings=pentest.medium_findings or 0,
+            low_findings=pentest.low_findings or 0
+        )
+        for pentest in pentests
+    ]
+
+def _export_finding(finding: dict) -> dict:
+    return {
+        "id": finding.get("id"),
+        "title": finding.get("title"),
+        "severity": finding.get("severity"),
+        "type": finding.get("type"),
+        "affected": finding.get("affected_component"),
+        "cve": finding.get("cve_id"),
+        "description": finding.get("description"),
+        "remediation": finding.get("remediation"),
+    }
+
+@router.get("/export")
+async def export_pentest_findings(
+    format: Literal["csv", "ndjson", "sarif"] = Query("csv"),
+    compress: bool = Query(False, description="Send the file gzip-compressed"),
+    current_user: User = Depends(get_current_user)
+):
+    """Stream the findings of all pentests as a CSV, NDJSON or SARIF file"""
+    user_id = current_user.id
+    records = export_service.stream_query(
+        lambda db: db.query(
+            Pentest.id, Pentest.target, Pentest.scan_type, Pentest.start_time, Pentest.findings
+        ).filter(Pentest.user_id == user_id).order_by(Pentest.start_time, Pentest.id),
+        lambda row: export_service.finding_records("pentest", row, _export_finding)
+    )
+    return export_service.export_response(
+        records,
+        export_service.FINDING_FIELDS,
+        format,
+        "pentest-findings",
+        export_service.finding_sarif,
+        compress=compress
+    )
+
+@router.get("", response_model=Union[List[PentestResult], List[PentestSummary]])
 async def get_all_pentests(
+    fields: Literal["full", "summary"] = Query("full"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get all pentests for the current user"""
+    if fields == "summary":
+        return await get_pentest_summaries(current_user, db)
+    
     pentests = db.query(Pentest).filter(Pentest.user_id == current_user.id).all()
     
     return [
@@ -1,11 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, status
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, status, Query
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Union, Literal
 from ..database.database import get_db
-from ..schemas.scan import ScanConfigRequest, ScanStartResponse, ScanStatusResponse, ScanResult
-from ..services import scan_service
+from ..schemas.scan import ScanConfigRequest, ScanStartResponse, ScanStatusResponse, ScanResult, ScanSummary
+from ..services import scan_service, export_service
 from ..core.security import get_current_user
 from ..schemas.auth import User
+from ..utils import ipaddr
 import os
 from fastapi.responses import FileResponse
 
@@ -131,11 +132,15 @@ async def download_scan_report(
     # For now, return a successful response
     return {"status": "success", "message": "Report download link generated", "link": f"/api/reports/{scan_id}.pdf"}
 
-@router.get("/scans", response_model=List[ScanResult])
+@router.get("/scans", response_model=Union[List[ScanResult], List[ScanSummary]])
 async def get_all_scans(
+    fields: Literal["full", "summary"] = Query("full"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    if fields == "summary":
+        return await get_scan_summaries(current_user, db, subnet=None)
+    
     scans = scan_service.get_user_scans(db, current_user.id)
     return [
         ScanResult(
@@ -151,6 +156,62 @@ async def get_all_scans(
         for scan in scans
     ]
 
+@router.get("/scans/summary", response_model=List[ScanSummary])
+async def get_scan_summaries(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    subnet: Optional[str] = Query(None, description="Only scans whose target lies in this CIDR or address range")
+):
+    """List scans without loading their findings or summary JSON"""
+    try:
+        ip_range = ipaddr.parse_range(subnet) if subnet else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    scans = scan_service.get_user_scan_summaries(db, current_user.id, ip_range=ip_range)
+    return [
+        ScanSummary(
+            id=scan.id,
+            target=scan.target,
+            scanType=scan.scan_type,
+            startTime=scan.start_time,
+            endTime=scan.end_time,
+            status=scan.status,
+            progress=scan.progress or 0,
+            totalFindings=scan.total_findings or 0,
+            severityCounts={
+                "critical": scan.critical_findings or 0,
+                "high": scan.high_findings or 0,
+                "medium": scan.medium_findings or 0,
+                "low": scan.low_findings or 0,
+                "info": scan.info_findings or 0
+            }
+        )
+        for scan in scans
+    ]
+
+@router.get("/scans/export")
+async def export_scan_findings(
+    format: Literal["csv", "ndjson", "sarif"] = Query("csv"),
+    compress: bool = Query(False, description="Send the file gzip-compressed"),
+    subnet: Optional[str] = Query(None, description="Only scans whose target lies in this CIDR or address range"),
+    current_user: User = Depends(get_current_user)
+):
+    """Stream the findings of all scans as a CSV, NDJSON or SARIF file"""
+    try:
+        ip_range = ipaddr.parse_range(subnet) if subnet else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return export_service.export_response(
+        scan_service.export_findings(current_user.id, ip_range=ip_range),
+        export_service.FINDING_FIELDS,
+        format,
+        "scan-findings",
+        export_service.finding_sarif,
+        compress=compress
+    )
+
 @router.get("/scans/{scan_id}", response_model=ScanResult)
 async def get_scan_by_id(
     scan_id: str,
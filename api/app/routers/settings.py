@@ -5,6 +5,7 @@ from ..schemas.settings import UserSettings, NotificationPreferences, SecuritySe
 from ..core.security import get_current_user
 from ..schemas.auth import User
 from ..models.user import User as UserModel
+from ..core import events
 
 router = APIRouter(
     prefix="/settings",
@@ -24,15 +25,19 @@ async def update_user_settings(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
+    if settings.email != user.email and db.query(UserModel).filter(UserModel.email == settings.email).first():
+        raise HTTPException(status_code=400, detail="Email already registered")
+    
     # Update user settings
-    user.name = settings.name
+    user.full_name = settings.name
     user.email = settings.email
-    user.company = settings.company
+    user.company_name = settings.company
     
     # In a real application, you would update additional fields as well
     # and possibly have a separate user_settings table
     
     db.commit()
+    events.publish(events.USER_UPDATED, user_id=user.id)
     
     return {"status": "success", "message": "User settings updated successfully"}
 
@@ -58,7 +63,8 @@ async def update_security_settings(
 ):
     """Update security settings"""
     # In a real application, you would update these in the database
-    # For now, just return success
+    # For now, just return success. Cached sessions of the user are dropped either way
+    events.publish(events.USER_UPDATED, user_id=current_user.id)
     
     return {
         "status": "success",
@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
+from typing import List
 from ..core.security import get_current_user
 from ..schemas.auth import User
-from ..schemas.dashboard import SystemHealth
-import psutil
-import time
+from ..schemas.dashboard import SystemHealth, HealthSample
+from ..core.cache import cache_stats
+from ..services import health_service
 from datetime import datetime
 
 router = APIRouter(
@@ -13,25 +14,9 @@ router = APIRouter(
 
 @router.get("/health", response_model=SystemHealth)
 async def get_system_health(current_user: User = Depends(get_current_user)):
-    """Get system health information"""
+    """Get system health information from the latest background sample"""
     try:
-        # Get CPU, memory, and disk usage
-        cpu_percent = psutil.cpu_percent(interval=1)
-        memory_percent = psutil.virtual_memory().percent
-        disk_percent = psutil.disk_usage('/').percent
-        
-        # Get system uptime
-        uptime = int(time.time() - psutil.boot_time())
-        
-        return SystemHealth(
-            status="healthy" if all([cpu_percent < 80, memory_percent < 80, disk_percent < 80]) else "warning",
-            cpu=round(cpu_percent, 1),
-            memory=round(memory_percent, 1),
-            disk=round(disk_percent, 1),
-            uptime=uptime,
-            lastUpdate=datetime.now().isoformat(),
-            error=None
-        )
+        return SystemHealth(**health_service.to_system_health(health_service.sampler.latest()))
     except Exception as e:
         return SystemHealth(
             status="error",
@@ -41,4 +26,21 @@ async def get_system_health(current_user: User = Depends(get_current_user)):
             uptime=0,
             lastUpdate=datetime.now().isoformat(),
             error=str(e)
-        ) 
\ No newline at end of file
+        )
+
+@router.get("/health/history", response_model=List[HealthSample])
+async def get_system_health_history(
+    resolution: int = Query(60, ge=1, le=3600, description="Seconds per point"),
+    window: int = Query(
+        min(3600, health_service.HISTORY_SECONDS), ge=1, le=health_service.HISTORY_SECONDS,
+        description="Seconds of history, at most what the sampler keeps"
+    ),
+    current_user: User = Depends(get_current_user)
+):
+    """Get sampled system health over time, averaged into points of `resolution` seconds"""
+    return health_service.sampler.history(resolution, window)
+
+@router.get("/cache")
+async def get_cache_stats(current_user: User = Depends(get_current_user)):
+    """Get hit/miss statistics for the response caches"""
+    return cache_stats()
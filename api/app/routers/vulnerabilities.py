@@ -1,13 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Literal, Optional
 from ..database.database import get_db
-from ..schemas.vulnerabilities import Vulnerability, VulnerabilityStatusUpdate, VulnerabilityScanResponse
+from ..schemas.vulnerabilities import (
+    Vulnerability, VulnerabilityStatusUpdate, VulnerabilityScanResponse,
+    VulnerabilityBulkUpdate, VulnerabilityBulkUpdateResponse, VulnerabilityFilter, VulnerabilityRescore
+)
 from ..core.security import get_current_user
 from ..schemas.auth import User
 from datetime import datetime
-import uuid
 from ..models.vulnerability import Vulnerability as VulnerabilityModel
+from ..services import rollup_service, device_service, vulnerability_service, export_service
+from ..core import events
+from ..utils import cvss, ipaddr
 
 router = APIRouter(
     prefix="/vulnerabilities",
@@ -16,16 +21,107 @@ router = APIRouter(
 
 @router.get("", response_model=List[Vulnerability])
 async def get_vulnerabilities(
+    subnet: Optional[str] = Query(None, description="Only vulnerabilities on hosts in this CIDR or address range"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get all vulnerabilities"""
-    vulnerabilities = db.query(VulnerabilityModel).filter(
+    query = db.query(VulnerabilityModel).filter(
         VulnerabilityModel.user_id == current_user.id
-    ).all()
+    )
+    if subnet:
+        try:
+            query = query.filter(ipaddr.range_clause(VulnerabilityModel.ip_hi, VulnerabilityModel.ip_lo, *ipaddr.parse_range(subnet)))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    vulnerabilities = query.all()
     
     return [Vulnerability.from_orm(vuln) for vuln in vulnerabilities]
 
+def selection_conditions(user_id: str, ids: Optional[List[str]], filter: Optional[VulnerabilityFilter]) -> List:
+    """SQL conditions for the user's vulnerabilities selected by ids and/or a filter"""
+    criteria = filter.model_dump(exclude_none=True) if filter else {}
+    try:
+        ip_range = ipaddr.parse_range(criteria["subnet"]) if "subnet" in criteria else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return vulnerability_service.filter_conditions(
+        user_id,
+        ids=ids,
+        status=criteria.get("status"),
+        severity=criteria.get("severity"),
+        host=criteria.get("host"),
+        device_id=criteria.get("deviceId"),
+        ip_range=ip_range,
+        affected=criteria.get("affected")
+    )
+
+@router.patch("", response_model=VulnerabilityBulkUpdateResponse)
+async def update_vulnerabilities_status(
+    update: VulnerabilityBulkUpdate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Update the status of many vulnerabilities at once, selected by ids and/or a filter"""
+    if update.ids is None and not (update.filter and update.filter.model_dump(exclude_none=True)):
+        raise HTTPException(status_code=400, detail="Provide ids or at least one filter criterion")
+    
+    conditions = selection_conditions(current_user.id, update.ids, update.filter)
+    updated = vulnerability_service.update_status(db, current_user.id, update.status, conditions)
+    if updated:
+        events.publish(events.VULNERABILITY_STATUS_CHANGED, user_id=current_user.id, status=update.status, count=updated)
+    
+    return VulnerabilityBulkUpdateResponse(status="success", updated=updated)
+
+@router.post("/rescore", response_model=VulnerabilityBulkUpdateResponse)
+async def rescore_vulnerabilities(
+    rescore: VulnerabilityRescore,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Set the CVSS environmental metrics of the selected vulnerabilities (all of them
+    without ids or filter) and recompute their environmental scores
+    """
+    try:
+        environment = cvss.parse_environment(rescore.environment)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    conditions = selection_conditions(current_user.id, rescore.ids, rescore.filter)
+    updated = vulnerability_service.rescore_environment(db, environment, conditions)
+    if updated:
+        # Same invalidation as the bulk status update: the status is unchanged, the scores are not
+        events.publish(events.VULNERABILITY_STATUS_CHANGED, user_id=current_user.id, count=updated)
+    
+    return VulnerabilityBulkUpdateResponse(status="success", updated=updated)
+
+@router.get("/export")
+async def export_vulnerabilities(
+    format: Literal["csv", "ndjson", "sarif"] = Query("csv"),
+    compress: bool = Query(False, description="Send the file gzip-compressed"),
+    status: Optional[str] = None,
+    severity: Optional[str] = None,
+    subnet: Optional[str] = Query(None, description="Only vulnerabilities on hosts in this CIDR or address range"),
+    current_user: User = Depends(get_current_user)
+):
+    """Stream the vulnerabilities as a CSV, NDJSON or SARIF file"""
+    try:
+        ip_range = ipaddr.parse_range(subnet) if subnet else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    conditions = vulnerability_service.filter_conditions(current_user.id, status=status, severity=severity, ip_range=ip_range)
+    return export_service.export_response(
+        vulnerability_service.export_records(conditions),
+        vulnerability_service.EXPORT_FIELDS,
+        format,
+        "vulnerabilities",
+        vulnerability_service.to_sarif,
+        compress=compress
+    )
+
 @router.get("/{vulnerability_id}", response_model=Vulnerability)
 async def get_vulnerability(
     vulnerability_id: str, 
@@ -59,9 +155,19 @@ async def update_vulnerability_status(
     if not vulnerability:
         raise HTTPException(status_code=404, detail="Vulnerability not found")
     
+    old_status = vulnerability.status
     vulnerability.status = status_update.status
     vulnerability.updated_at = datetime.now()
+    rollup_service.record_status_change(db, vulnerability, old_status)
+    if vulnerability.device_id:
+        device_service.update_vulnerability_counts(db, current_user.id, [vulnerability.device_id])
     db.commit()
+    events.publish(
+        events.VULNERABILITY_STATUS_CHANGED,
+        user_id=current_user.id,
+        vulnerability_id=vulnerability_id,
+        status=status_update.status
+    )
     
     return {"status": "success", "message": "Vulnerability status updated"}
 
@@ -92,11 +198,6 @@ async def perform_vulnerability_scan(user_id: str, db: Session):
     # Simulate scan delay
     await asyncio.sleep(2)
     
-    # Cleanup any old sample vulnerabilities from previous scans
-    db.query(VulnerabilityModel).filter(
-        VulnerabilityModel.user_id == user_id,
-    ).delete()
-    
     # Categories of vulnerabilities to simulate
     vulnerability_types = [
         {
@@ -106,7 +207,7 @@ async def perform_vulnerability_scan(user_id: str, db: Session):
                     "name": "SQL Injection",
                     "description": "SQL injection vulnerability in login form allows attackers to bypass authentication and extract sensitive data.",
                     "severity": "critical",
-                    "cvss_score": 9.8,
+                    "cvss_vector": "CVSS:3.1/AV:N/AC:L/PR:N/UI:N/S:U/C:H/I:H/A:H",
                     "cve_id": "CVE-2023-45678",
                     "remediation": "Use prepared statements, parameterized queries, and implement input validation. Consider using an ORM framework."
                 },
@@ -114,7 +215,7 @@ async def perform_vulnerability_scan(user_id: str, db: Session):
                     "name": "Cross-Site Scripting (XSS)",
                     "description": "Reflected XSS vulnerability in search functionality allows attackers to inject malicious scripts.",
                     "severity": "high",
-                    "cvss_score": 7.4,
+                    "cvss_vector": "CVSS:3.1/AV:N/AC:L/PR:N/UI:R/S:C/C:H/I:L/A:N",
                     "cve_id": None,
                     "remediation": "Implement proper output encoding, use Content-Security-Policy headers, and sanitize user input."
                 },
@@ -122,7 +223,7 @@ async def perform_vulnerability_scan(user_id: str, db: Session):
                     "name": "Insecure Direct Object References",
                     "description": "Application exposes a direct reference to internal objects, allowing unauthorized access to data.",
                     "severity": "medium",
-                    "cvss_score": 6.5,
+                    "cvss_vector": "CVSS:3.1/AV:N/AC:L/PR:L/UI:N/S:U/C:H/I:N/A:N",
                     "cve_id": None,
                     "remediation": "Implement proper access controls and use indirect references with authorization checks."
                 },
@@ -130,7 +231,7 @@ async def perform_vulnerability_scan(user_id: str, db: Session):
                     "name": "Cross-Site Request Forgery (CSRF)",
                     "description": "Application lacks CSRF tokens, allowing attackers to perform actions on behalf of authenticated users.",
                     "severity": "medium",
-                    "cvss_score": 6.8,
+                    "cvss_vector": "CVSS:3.1/AV:N/AC:L/PR:N/UI:R/S:U/C:N/I:H/A:N",
                     "cve_id": None,
                     "remediation": "Implement CSRF tokens for all state-changing operations and validate them server-side."
                 }
@@ -143,7 +244,7 @@ async def perform_vulnerability_scan(user_id: str, db: Session):
                     "name": "Outdated SSL/TLS Configuration",
                     "description": "Server supports outdated TLS 1.0 and SSL 3.0 protocols with known security vulnerabilities.",
                     "severity": "high",
-                    "cvss_score": 7.5,
+                    "cvss_vector": "CVSS:3.1/AV:N/AC:H/PR:N/UI:N/S:U/C:H/I:H/A:N",
                     "cve_id": "CVE-2015-0204",
                     "remediation": "Disable TLS 1.0 and SSL 3.0 in server configuration. Enable only TLS 1.2+ with secure cipher suites."
                 },
@@ -151,7 +252,7 @@ async def perform_vulnerability_scan(user_id: str, db: Session):
                     "name": "Open Ports Exposure",
                     "description": "Unnecessary ports are exposed to the internet, increasing the attack surface.",
                     "severity": "medium",
-                    "cvss_score": 5.9,
+                    "cvss_vector": "CVSS:3.1/AV:N/AC:L/PR:N/UI:N/S:U/C:L/I:N/A:N",
                     "cve_id": None,
                     "remediation": "Implement proper network segmentation and firewall rules. Only expose necessary services."
                 },
@@ -159,7 +260,7 @@ async def perform_vulnerability_scan(user_id: str, db: Session):
                     "name": "Weak SSH Configuration",
                     "description": "SSH server allows weak ciphers and authentication methods.",
                     "severity": "medium",
-                    "cvss_score": 6.2,
+                    "cvss_vector": "CVSS:3.1/AV:N/AC:H/PR:N/UI:N/S:U/C:H/I:N/A:N",
                     "cve_id": None,
                     "remediation": "Configure SSH to use only strong ciphers, disable password authentication, and implement key-based authentication."
                 }
@@ -172,7 +273,7 @@ async def perform_vulnerability_scan(user_id: str, db: Session):
                     "name": "Missing Security Headers",
                     "description": "Web server is missing important security headers like X-Content-Type-Options, X-Frame-Options, and Content-Security-Policy.",
                     "severity": "low",
-                    "cvss_score": 4.3,
+                    "cvss_vector": "CVSS:3.1/AV:N/AC:H/PR:N/UI:R/S:U/C:N/I:L/A:N",
                     "cve_id": None,
                     "remediation": "Configure web server to include all recommended security headers in HTTP responses."
                 },
@@ -180,7 +281,7 @@ async def perform_vulnerability_scan(user_id: str, db: Session):
                     "name": "Directory Listing Enabled",
                     "description": "Web server has directory listing enabled, revealing file structure to potential attackers.",
                     "severity": "low",
-                    "cvss_score": 3.8,
+                    "cvss_vector": "CVSS:3.1/AV:N/AC:H/PR:N/UI:N/S:U/C:L/I:N/A:N",
                     "cve_id": None,
                     "remediation": "Disable directory listing in web server configuration."
                 },
@@ -188,7 +289,7 @@ async def perform_vulnerability_scan(user_id: str, db: Session):
                     "name": "Default Credentials",
                     "description": "Application admin interface accessible with default credentials.",
                     "severity": "critical",
-                    "cvss_score": 9.1,
+                    "cvss_vector": "CVSS:3.1/AV:N/AC:L/PR:N/UI:N/S:U/C:H/I:H/A:H",
                     "cve_id": None,
                     "remediation": "Change all default credentials. Implement a strong password policy and periodic password rotation."
                 }
@@ -201,7 +302,7 @@ async def perform_vulnerability_scan(user_id: str, db: Session):
                     "name": "Insufficient Password Policy",
                     "description": "Password policy allows weak passwords that are susceptible to brute force attacks.",
                     "severity": "medium",
-                    "cvss_score": 5.5,
+                    "cvss_vector": "CVSS:3.1/AV:N/AC:H/PR:N/UI:N/S:U/C:L/I:L/A:N",
                     "cve_id": None,
                     "remediation": "Implement a strong password policy requiring minimum length, complexity, and prohibiting common passwords."
                 },
@@ -209,7 +310,7 @@ async def perform_vulnerability_scan(user_id: str, db: Session):
                     "name": "Missing Account Lockout",
                     "description": "Application doesn't lock accounts after multiple failed login attempts.",
                     "severity": "medium",
-                    "cvss_score": 6.0,
+                    "cvss_vector": "CVSS:3.1/AV:N/AC:L/PR:N/UI:N/S:U/C:L/I:L/A:N",
                     "cve_id": None,
                     "remediation": "Implement account lockout after a certain number of failed login attempts."
                 },
@@ -217,7 +318,7 @@ async def perform_vulnerability_scan(user_id: str, db: Session):
                     "name": "Missing Multi-Factor Authentication",
                     "description": "Critical functionality lacks multi-factor authentication.",
                     "severity": "high",
-                    "cvss_score": 7.2,
+                    "cvss_vector": "CVSS:3.1/AV:N/AC:L/PR:N/UI:N/S:U/C:H/I:N/A:N",
                     "cve_id": None,
                     "remediation": "Implement multi-factor authentication for all users, especially for administrative access."
                 }
@@ -228,8 +329,8 @@ async def perform_vulnerability_scan(user_id: str, db: Session):
     # Select random number of vulnerability categories
     selected_categories = random.sample(vulnerability_types, k=random.randint(2, len(vulnerability_types)))
     
-    # Create vulnerability objects to add to the database
-    vulnerabilities_to_add = []
+    # Findings of this scan; existing vulnerabilities keep their status, new ones get a simulated one
+    findings = []
     
     for category in selected_categories:
         # Select a random number of vulnerabilities from each category
@@ -241,22 +342,12 @@ async def perform_vulnerability_scan(user_id: str, db: Session):
             # Bias towards open vulnerabilities
             status_weights = [0.7, 0.2, 0.05, 0.05]
             
-            vulnerabilities_to_add.append(
-                VulnerabilityModel(
-                    id=str(uuid.uuid4()),
-                    user_id=user_id,
-                    name=vuln["name"],
-                    description=vuln["description"],
-                    severity=vuln["severity"],
-                    status=random.choices(status_options, weights=status_weights)[0],
-                    affected=category["category"],
-                    discovered=datetime.now(),
-                    cvss_score=vuln["cvss_score"],
-                    cve_id=vuln["cve_id"],
-                    remediation=vuln["remediation"]
-                )
-            )
+            findings.append({
+                **vuln,
+                "affected": category["category"],
+                "status": random.choices(status_options, weights=status_weights)[0],
+            })
     
-    # Add all vulnerabilities to the database
-    db.add_all(vulnerabilities_to_add)
-    db.commit() 
\ No newline at end of file
+    # Apply only what changed since the previous scan
+    counts = vulnerability_service.refresh_vulnerabilities(db, user_id, findings)
+    events.publish(events.VULNERABILITIES_INGESTED, user_id=user_id, count=counts["inserted"]) 
\ No newline at end of file
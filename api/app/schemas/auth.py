@@ -1,5 +1,6 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from pydantic import BaseModel, EmailStr, Field
+from typing import List, Optional
+from datetime import datetime
 
 class TokenData(BaseModel):
     user_id: str
@@ -47,4 +48,24 @@ class SignupResponse(BaseModel):
     user: User
 
 class RefreshTokenRequest(BaseModel):
-    refresh_token: Optional[str] = None 
\ No newline at end of file
+    refresh_token: Optional[str] = None
+
+class ApiKeyCreate(BaseModel):
+    name: str
+    scopes: List[str] = Field(default_factory=lambda: ["*"], description="e.g. scan:read, scan:write, vulnerabilities:*, *")
+    expiresInDays: Optional[int] = Field(None, ge=1, le=3650)
+
+class ApiKey(BaseModel):
+    id: str
+    name: str
+    prefix: str
+    scopes: List[str]
+    created_at: datetime
+    last_used_at: Optional[datetime] = None
+    expires_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class ApiKeyCreated(ApiKey):
+    key: str  # Only returned once, at creation
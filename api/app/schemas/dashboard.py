@@ -10,6 +10,24 @@ class SystemHealth(BaseModel):
     uptime: int
     lastUpdate: str
     error: Optional[str] = None
+    load: Optional[float] = None
+    openFds: Optional[int] = None
+    loopLagMs: Optional[float] = None
+    dbPoolCheckedOut: Optional[int] = None
+
+class HealthSample(BaseModel):
+    timestamp: float
+    cpu: Optional[float] = None
+    memory: Optional[float] = None
+    disk: Optional[float] = None
+    load_1: Optional[float] = None
+    load_5: Optional[float] = None
+    load_15: Optional[float] = None
+    open_fds: Optional[float] = None
+    loop_lag_ms: Optional[float] = None
+    uptime: Optional[float] = None
+    db_pool_checked_out: Optional[float] = None
+    db_pool_size: Optional[float] = None
 
 class Alert(BaseModel):
     id: str
@@ -47,4 +65,14 @@ class SecurityScore(BaseModel):
     risk_level: str
     vulnerability_counts: Dict[str, int]
     finding_counts: Dict[str, int]
-    recommendations: List[str] 
\ No newline at end of file
+    recommendations: List[str]
+
+class WidgetResult(BaseModel):
+    data: Optional[Any] = None
+    duration_ms: float
+    error: Optional[str] = None
+
+class DashboardBundle(BaseModel):
+    widgets: Dict[str, WidgetResult]
+    duration_ms: float
+    snapshot: str
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional, Literal
+from typing import Dict, List, Optional, Literal
 
 class NetworkNode(BaseModel):
     id: str
@@ -7,6 +7,8 @@ class NetworkNode(BaseModel):
     type: str
     status: str
     ip: Optional[str] = None
+    size: Optional[int] = None  # Number of devices, for subnet clusters
+    severityCounts: Dict[str, int] = {}  # Unresolved vulnerabilities by severity
 
 class NetworkConnection(BaseModel):
     source: str
@@ -16,6 +18,18 @@ class NetworkConnection(BaseModel):
 class NetworkMap(BaseModel):
     nodes: List[NetworkNode]
     connections: List[NetworkConnection]
+    version: Optional[int] = None
+    zoom: Optional[str] = None
+
+class NetworkChanges(BaseModel):
+    version: int
+    since: int
+    reset: bool  # The change log does not reach back to `since`: fetch the whole map again
+    addedNodes: List[NetworkNode] = []
+    updatedNodes: List[NetworkNode] = []
+    removedNodes: List[str] = []
+    addedConnections: List[NetworkConnection] = []
+    removedConnections: List[NetworkConnection] = []
 
 class NetworkDevice(BaseModel):
     id: str
@@ -24,4 +38,17 @@ class NetworkDevice(BaseModel):
     type: str
     status: str
     lastSeen: str
-    vulnerabilities: int 
\ No newline at end of file
+    vulnerabilities: int
+    severityCounts: Dict[str, int] = {}
+
+class DiscoveryJob(BaseModel):
+    id: str
+    target: str
+    status: str
+    progress: int
+    hostsTotal: int
+    hostsScanned: int
+    devicesFound: int
+    startedAt: Optional[str] = None
+    finishedAt: Optional[str] = None
+    error: Optional[str] = None
@@ -47,5 +47,24 @@ class PentestResult(BaseModel):
         from_attributes = True
         json_encoders = {
             datetime: lambda v: v.isoformat()
-        } 
-        
\ No newline at end of file
+        }
+
+class PentestSummary(BaseModel):
+    id: str
+    target: str
+    start_time: datetime
+    end_time: Optional[datetime] = None
+    status: Literal["running", "completed", "failed"]
+    scan_type: str
+    progress: int
+    total_findings: int
+    critical_findings: int
+    high_findings: int
+    medium_findings: int
+    low_findings: int
+    
+    class Config:
+        from_attributes = True
+        json_encoders = {
+            datetime: lambda v: v.isoformat()
+        }
@@ -39,4 +39,21 @@ class ScanResult(BaseModel):
         from_attributes = True
         json_encoders = {
             datetime: lambda v: v.isoformat()
-        } 
\ No newline at end of file
+        }
+
+class ScanSummary(BaseModel):
+    id: str
+    target: str
+    scanType: str
+    startTime: datetime
+    endTime: Optional[datetime] = None
+    status: str
+    progress: int
+    totalFindings: int
+    severityCounts: Dict[str, int]
+    
+    class Config:
+        from_attributes = True
+        json_encoders = {
+            datetime: lambda v: v.isoformat()
+        }
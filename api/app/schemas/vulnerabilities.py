@@ -1,16 +1,22 @@
-from pydantic import BaseModel
-from typing import Optional, Literal
+from pydantic import BaseModel, Field
+from typing import List, Optional, Literal
 from datetime import datetime
 
+VulnerabilityStatus = Literal["open", "in_progress", "resolved", "false_positive", "wont_fix"]
+
 class Vulnerability(BaseModel):
     id: str
     name: str
     description: str
     severity: Literal["critical", "high", "medium", "low", "info"]
-    status: Literal["open", "in_progress", "resolved", "false_positive", "wont_fix"]
+    status: VulnerabilityStatus
     affected: str
+    host: Optional[str] = None
     discovered: datetime
     cvss_score: Optional[float] = None
+    cvss_vector: Optional[str] = None
+    cvss_temporal_score: Optional[float] = None
+    cvss_environmental_score: Optional[float] = None
     cve_id: Optional[str] = None
     remediation: Optional[str] = None
     
@@ -23,6 +29,29 @@ class Vulnerability(BaseModel):
 class VulnerabilityStatusUpdate(BaseModel):
     status: str
 
+class VulnerabilityFilter(BaseModel):
+    status: Optional[str] = None
+    severity: Optional[str] = None
+    host: Optional[str] = None
+    deviceId: Optional[str] = None
+    subnet: Optional[str] = None  # CIDR or address range of the host
+    affected: Optional[str] = None
+
+class VulnerabilityBulkUpdate(BaseModel):
+    status: VulnerabilityStatus
+    ids: Optional[List[str]] = Field(None, max_length=5000)
+    filter: Optional[VulnerabilityFilter] = None
+
+class VulnerabilityBulkUpdateResponse(BaseModel):
+    status: str
+    updated: int
+
+class VulnerabilityRescore(BaseModel):
+    # Environmental metrics without prefix, e.g. "CR:H/IR:H/MAV:A"; unlisted ones become undefined
+    environment: str
+    ids: Optional[List[str]] = Field(None, max_length=5000)
+    filter: Optional[VulnerabilityFilter] = None
+
 class VulnerabilityScanResponse(BaseModel):
     success: bool
     message: str 
\ No newline at end of file
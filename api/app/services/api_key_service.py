@@ -0,0 +1,136 @@
+"""
+API keys for machine clients.
+
+Keys are random tokens shown once at creation. The database only holds their
+HMAC-SHA256 digest under API_KEY_SECRET (SECRET_KEY by default), in a unique
+indexed column, so verifying a key is one digest and one indexed lookup instead of
+a bcrypt check. Last-used times are collected in memory and written in batches.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import asyncio
+import hashlib
+import hmac
+import os
+import secrets
+import logging
+from dotenv import load_dotenv
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session
+from ..database.database import engine
+from ..models.api_key import ApiKey
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+API_KEY_PREFIX = "nxs_"
+API_KEY_SECRET = os.getenv("API_KEY_SECRET") or os.getenv("SECRET_KEY") or ""
+LAST_USED_FLUSH_INTERVAL = float(os.getenv("API_KEY_LAST_USED_FLUSH_INTERVAL", "30"))
+
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+# Areas that need an interactive session: keys cannot manage keys, accounts or the server
+SESSION_ONLY_AREAS = ("auth", "settings", "admin")
+# Path prefixes sharing a scope area
+AREA_ALIASES = {"scans": "scan"}
+
+def hash_key(key: str) -> str:
+    return hmac.new(API_KEY_SECRET.encode(), key.encode(), hashlib.sha256).hexdigest()
+
+def is_api_key(token: str) -> bool:
+    return token.startswith(API_KEY_PREFIX)
+
+def create_api_key(db: Session, user_id: str, name: str, scopes: List[str], expires_in_days: Optional[int] = None):
+    """Create a key and return (model, raw key). The raw key cannot be recovered later"""
+    key = API_KEY_PREFIX + secrets.token_urlsafe(32)
+    api_key = ApiKey(
+        user_id=user_id,
+        name=name,
+        prefix=key[:len(API_KEY_PREFIX) + 6],
+        key_hash=hash_key(key),
+        scopes=scopes,
+        expires_at=datetime.utcnow() + timedelta(days=expires_in_days) if expires_in_days else None
+    )
+    db.add(api_key)
+    db.commit()
+    db.refresh(api_key)
+    return api_key, key
+
+def get_user_api_keys(db: Session, user_id: str) -> List[ApiKey]:
+    return db.query(ApiKey).filter(ApiKey.user_id == user_id).order_by(ApiKey.created_at.desc()).all()
+
+def delete_api_key(db: Session, user_id: str, key_id: str) -> bool:
+    deleted = db.query(ApiKey).filter(ApiKey.id == key_id, ApiKey.user_id == user_id).delete()
+    db.commit()
+    return deleted > 0
+
+def authenticate_api_key(db: Session, key: str) -> Optional[ApiKey]:
+    """The unexpired key matching `key`, or None"""
+    api_key = db.query(ApiKey).filter(ApiKey.key_hash == hash_key(key)).first()
+    if api_key is None or (api_key.expires_at and api_key.expires_at < datetime.utcnow()):
+        return None
+    last_used.touch(api_key.id)
+    return api_key
+
+def required_scope(method: str, path: str) -> str:
+    """The scope a request needs, e.g. `scan:write` for POST /scan/start"""
+    area = path.strip("/").split("/", 1)[0] or "root"
+    area = AREA_ALIASES.get(area, area)
+    return f"{area}:{'read' if method in READ_METHODS else 'write'}"
+
+def has_scope(scopes: List[str], method: str, path: str) -> bool:
+    """Whether `scopes` grant a request. `*` grants every area, `<area>:*` and `<area>:write` imply `<area>:read`"""
+    scope = required_scope(method, path)
+    area, access = scope.split(":")
+    if area in SESSION_ONLY_AREAS:
+        return False
+    granted = set(scopes or [])
+    return bool(granted & {"*", f"{area}:*", scope} or (access == "read" and f"{area}:write" in granted))
+
+class LastUsedTracker:
+    """Collects key usage in memory and writes last_used_at every `interval` seconds in one batch"""
+
+    def __init__(self, interval: float = LAST_USED_FLUSH_INTERVAL):
+        self.interval = interval
+        self.pending: Dict[str, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def touch(self, key_id: str):
+        self.pending[key_id] = datetime.utcnow()
+
+    def flush(self):
+        pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        statement = (
+            update(ApiKey)
+            .where(ApiKey.id == bindparam("key_id"))
+            .values(last_used_at=bindparam("used_at"))
+        )
+        with engine.begin() as conn:
+            conn.execute(statement, [{"key_id": key_id, "used_at": used_at} for key_id, used_at in pending.items()])
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.flush()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await loop.run_in_executor(None, self.flush)
+            except Exception as e:
+                logger.error(f"Error recording API key usage: {e}")
+
+last_used = LastUsedTracker()
@@ -1,5 +1,5 @@
 from ..models.user import User
-from ..core.security import verify_password, get_password_hash, create_access_token, create_refresh_token
+from ..core.security import verify_password_async, get_password_hash_async, create_access_token, create_refresh_token
 from sqlalchemy.orm import Session
 from datetime import timedelta
 import os
@@ -23,15 +23,15 @@ def get_user_by_id(user_id: str, db: Session = None):
     else:
         return db.query(User).filter(User.id == user_id).first()
 
-def authenticate_user(db: Session, email: str, password: str):
+async def authenticate_user(db: Session, email: str, password: str):
     user = get_user_by_email(db, email)
     if not user:
         return False
-    if not verify_password(password, user.password):
+    if not await verify_password_async(password, user.password):
         return False
     return user
 
-def create_user(db: Session, user_data):
+async def create_user(db: Session, user_data):
     # Check if user with this email already exists
     db_user = get_user_by_email(db, user_data.email)
     if db_user:
@@ -41,7 +41,7 @@ def create_user(db: Session, user_data):
         )
     
     # Create new user with hashed password
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash_async(user_data.password)
     db_user = User(
         id=str(uuid.uuid4()),
         email=user_data.email,
@@ -0,0 +1,159 @@
+from ..models.scan import Scan
+from ..models.pentest import Pentest
+from ..models.daily_stats import DailyStat
+from sqlalchemy.orm import Session
+from sqlalchemy import func, case, and_
+from datetime import datetime, date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+SEVERITIES = ["critical", "high", "medium", "low"]
+ACTIVE_STATUSES = ["running", "pending"]
+CLOSED_VULNERABILITY_STATUSES = ["resolved", "false_positive"]
+
+def get_window_start(days: int, now: Optional[datetime] = None) -> datetime:
+    """Get midnight of the first day in a window of `days` days ending today"""
+    now = now or datetime.now()
+    first_day = now.date() - timedelta(days=days - 1)
+    return datetime(first_day.year, first_day.month, first_day.day)
+
+def bucket_start(day: date, bucket: str) -> date:
+    """Get the first day of the bucket that contains `day`"""
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+def get_bucket_starts(days: int, bucket: str, now: Optional[datetime] = None) -> List[date]:
+    """Get the start of every bucket in the window, newest first"""
+    today = (now or datetime.now()).date()
+    starts = []
+    for i in range(days):
+        start = bucket_start(today - timedelta(days=i), bucket)
+        if not starts or starts[-1] != start:
+            starts.append(start)
+    return starts
+
+def count_vulnerabilities_by_day(
+    db: Session,
+    user_id: str,
+    start: datetime,
+    severities: List[str] = SEVERITIES
+) -> Dict[Tuple[date, str], int]:
+    """Count vulnerabilities discovered since `start` per day and severity from the daily rollup"""
+    rows = db.query(DailyStat.date, DailyStat.severity, func.sum(DailyStat.count)).filter(
+        DailyStat.user_id == user_id,
+        DailyStat.severity.in_(severities),
+        DailyStat.date >= start.date()
+    ).group_by(DailyStat.date, DailyStat.severity).all()
+
+    return {(day, severity): int(count or 0) for day, severity, count in rows}
+
+def get_severity_series(
+    db: Session,
+    user_id: str,
+    days: int = 30,
+    bucket: str = "day",
+    severities: List[str] = SEVERITIES
+) -> List[Dict[str, object]]:
+    """
+    Get vulnerability counts per bucket and severity for the last `days` days.
+    Buckets with no vulnerabilities are filled with zero counts, newest bucket first.
+    """
+    now = datetime.now()
+    daily_counts = count_vulnerabilities_by_day(db, user_id, get_window_start(days, now), severities)
+
+    bucket_counts: Dict[Tuple[date, str], int] = {}
+    for (day, severity), count in daily_counts.items():
+        key = (bucket_start(day, bucket), severity)
+        bucket_counts[key] = bucket_counts.get(key, 0) + count
+
+    return [
+        {
+            "date": start.strftime("%Y-%m-%d"),
+            "severity": severity,
+            "count": bucket_counts.get((start, severity), 0)
+        }
+        for start in get_bucket_starts(days, bucket, now)
+        for severity in severities
+    ]
+
+def get_month_bounds(year: Optional[int] = None, month: Optional[int] = None) -> Tuple[datetime, datetime, datetime]:
+    """Get the start of the previous month, the given month (default current) and the following month"""
+    now = datetime.now()
+    start = datetime(year or now.year, month or now.month, 1)
+    previous_start = (start - timedelta(days=1)).replace(day=1)
+    next_start = (start + timedelta(days=32)).replace(day=1)
+    return previous_start, start, next_start
+
+def _count_if(condition, weight=1):
+    return func.coalesce(func.sum(case((condition, weight), else_=0)), 0)
+
+def _month_conditions(column, bounds):
+    # Conditions for "in the given month" and "in the previous month"
+    previous_start, start, next_start = bounds
+    return [
+        and_(column >= start, column < next_start),
+        and_(column >= previous_start, column < start),
+    ]
+
+def get_job_stats(db: Session, model, user_id: str, bounds: Tuple[datetime, datetime, datetime]) -> Dict[str, int]:
+    """Get total, active and month-over-month counts for scans or pentests in one pass"""
+    total, active, this_month, previous_month = db.query(
+        func.count(model.id),
+        _count_if(model.status.in_(ACTIVE_STATUSES)),
+        *[_count_if(condition) for condition in _month_conditions(model.start_time, bounds)]
+    ).filter(model.user_id == user_id).one()
+
+    return {
+        "total": total,
+        "active": active,
+        "this_month": this_month,
+        "previous_month": previous_month
+    }
+
+def get_vulnerability_stats(db: Session, user_id: str, bounds: Tuple[datetime, datetime, datetime]) -> Dict[str, Dict[str, int]]:
+    """
+    Get vulnerability counts per severity in one pass over the daily rollup: unresolved,
+    open, discovered in the given month and discovered in the previous month
+    """
+    previous_start, start, next_start = bounds
+    month_bounds = (previous_start.date(), start.date(), next_start.date())
+
+    columns = []
+    for severity in SEVERITIES:
+        is_severity = DailyStat.severity == severity
+        columns.extend([
+            _count_if(and_(is_severity, DailyStat.status.notin_(CLOSED_VULNERABILITY_STATUSES)), DailyStat.count),
+            _count_if(and_(is_severity, DailyStat.status == "open"), DailyStat.count),
+            *[
+                _count_if(and_(is_severity, condition), DailyStat.count)
+                for condition in _month_conditions(DailyStat.date, month_bounds)
+            ]
+        ])
+
+    row = db.query(*columns).filter(DailyStat.user_id == user_id).one()
+
+    stats = {"unresolved": {}, "open": {}, "this_month": {}, "previous_month": {}}
+    for i, severity in enumerate(SEVERITIES):
+        unresolved, open_count, this_month, previous_month = [int(value) for value in row[i * 4:i * 4 + 4]]
+        stats["unresolved"][severity] = unresolved
+        stats["open"][severity] = open_count
+        stats["this_month"][severity] = this_month
+        stats["previous_month"][severity] = previous_month
+    return stats
+
+def get_user_stats(db: Session, user_id: str, year: Optional[int] = None, month: Optional[int] = None) -> Dict[str, Dict]:
+    """Get every dashboard count for a user with one aggregate query per table"""
+    bounds = get_month_bounds(year, month)
+    return {
+        "scans": get_job_stats(db, Scan, user_id, bounds),
+        "pentests": get_job_stats(db, Pentest, user_id, bounds),
+        "vulnerabilities": get_vulnerability_stats(db, user_id, bounds)
+    }
+
+def percent_change(current: int, previous: int) -> int:
+    """Month-over-month change in percent, 100 when growing from zero"""
+    if previous == 0:
+        return 100 if current > 0 else 0
+    return round((current - previous) * 100 / previous)
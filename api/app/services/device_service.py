@@ -0,0 +1,330 @@
+from ..models.device import Device, InventoryVersion, InventoryChange
+from ..models.vulnerability import Vulnerability
+from ..utils import ipaddr
+from .dashboard_service import CLOSED_VULNERABILITY_STATUSES
+from sqlalchemy.orm import Session
+from sqlalchemy import func, or_, tuple_
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+import os
+import uuid
+
+load_dotenv()
+
+# Rows per INSERT statement, well under SQLite's bound-parameter limit
+UPSERT_BATCH_SIZE = 500
+
+# Inventory versions kept in the change log, per user
+CHANGELOG_VERSIONS = int(os.getenv("NETWORK_CHANGELOG_VERSIONS", "100"))
+
+SEVERITY_LEVELS = ("critical", "high", "medium", "low", "info")
+SEVERITY_COUNT_ATTRIBUTES = tuple(f"{severity}_findings" for severity in SEVERITY_LEVELS)
+
+# Device attributes shown on the network map, in change-log order
+MAP_ATTRIBUTES = ("name", "type", "status", "ip") + SEVERITY_COUNT_ATTRIBUTES
+MAP_COLUMNS = tuple(getattr(Device, attribute) for attribute in MAP_ATTRIBUTES)
+
+# Sort keys and the columns they order by; addresses sort numerically, so 10.0.0.9
+# comes before 10.0.0.10 and the (user_id, ip_hi, ip_lo) index serves the ordering
+SORT_COLUMNS = {
+    "ip": (Device.ip_hi, Device.ip_lo),
+    "name": (Device.name,),
+    "type": (Device.type,),
+    "status": (Device.status,),
+    "lastSeen": (Device.last_seen,),
+}
+
+def _upsert_statement(db: Session, table=Device.__table__):
+    # Both SQLite and PostgreSQL support INSERT ... ON CONFLICT DO UPDATE
+    if db.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+def bump_version(db: Session, user_id: str):
+    """Increment the user's inventory version inside the caller's transaction"""
+    table = InventoryVersion.__table__
+    stmt = _upsert_statement(db, table).values(user_id=user_id, version=1)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id],
+        set_={"version": table.c.version + 1}
+    ))
+
+def get_version(db: Session, user_id: str) -> int:
+    """The user's inventory version, 0 before any device was stored"""
+    version = db.query(InventoryVersion.version).filter(InventoryVersion.user_id == user_id).scalar()
+    return version or 0
+
+def _map_state(row) -> List:
+    """The attributes of a device shown on the network map, as stored in the change log"""
+    return [getattr(row, attribute) for attribute in MAP_ATTRIBUTES]
+
+def record_changes(db: Session, user_id: str, changes: List[Tuple[str, Optional[List], Optional[List]]]):
+    """
+    Bump the user's inventory version and log the (device id, before, after) changes
+    under it, inside the caller's transaction. Versions older than CHANGELOG_VERSIONS
+    are dropped from the log
+    """
+    if not changes:
+        return
+    bump_version(db, user_id)
+    version = get_version(db, user_id)
+    db.execute(InventoryChange.__table__.insert(), [
+        {"user_id": user_id, "version": version, "device_id": device_id, "before": before, "after": after}
+        for device_id, before, after in changes
+    ])
+    db.query(InventoryChange).filter(
+        InventoryChange.user_id == user_id,
+        InventoryChange.version <= version - CHANGELOG_VERSIONS
+    ).delete(synchronize_session=False)
+
+def get_changes(db: Session, user_id: str, since: int, version: int) -> Optional[List[InventoryChange]]:
+    """
+    The logged changes after version `since` up to `version`, oldest first, or None
+    when the log no longer covers every one of those versions
+    """
+    if since < 0 or since > version or version - since > CHANGELOG_VERSIONS:
+        return None
+    changes = db.query(InventoryChange).filter(
+        InventoryChange.user_id == user_id,
+        InventoryChange.version > since,
+        InventoryChange.version <= version
+    ).order_by(InventoryChange.version, InventoryChange.id).all()
+    if len({change.version for change in changes}) != version - since:
+        return None
+    return changes
+
+def upsert_devices(db: Session, user_id: str, devices: Iterable[Dict]) -> int:
+    """
+    Insert discovered devices or update the ones already known by IP, keeping their
+    id, first_seen and name (a new device is named after its IP unless given a name,
+    which only applies on insert). Each device is a dict with ip and optionally name, type,
+    status and last_seen. Devices added or whose map attributes changed are logged
+    under a new inventory version; refreshing last_seen alone leaves the version as
+    is. New devices take over the vulnerabilities already reported on their address.
+    Commits and returns the number of devices
+    """
+    now = datetime.utcnow()
+    rows = {}
+    for device in devices:
+        # The last report of an IP wins within one batch
+        ip_hi, ip_lo = ipaddr.encode(device["ip"])
+        rows[device["ip"]] = {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "ip": device["ip"],
+            "ip_hi": ip_hi,
+            "ip_lo": ip_lo,
+            "name": device.get("name") or device["ip"],
+            "type": device.get("type") or "unknown",
+            "status": device.get("status") or "online",
+            "first_seen": now,
+            "last_seen": device.get("last_seen") or now,
+        }
+
+    table = Device.__table__
+    rows = list(rows.values())
+    changes = []
+    for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+        batch = rows[start:start + UPSERT_BATCH_SIZE]
+        existing = {
+            device.ip: device for device in db.query(Device.id, *MAP_COLUMNS).filter(
+                Device.user_id == user_id, Device.ip.in_([row["ip"] for row in batch])
+            )
+        }
+        for row in batch:
+            known = existing.get(row["ip"])
+            counts = [getattr(known, attribute) for attribute in SEVERITY_COUNT_ATTRIBUTES] if known else [0] * len(SEVERITY_LEVELS)
+            name = known.name if known is not None and known.name is not None else row["name"]
+            after = [name, row["type"], row["status"], row["ip"]] + counts
+            if known is None:
+                changes.append((row["id"], None, after))
+            elif _map_state(known) != after:
+                changes.append((known.id, _map_state(known), after))
+
+        stmt = _upsert_statement(db).values(batch)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.ip],
+            set_={
+                "name": func.coalesce(table.c.name, stmt.excluded.name),
+                "type": stmt.excluded.type,
+                "status": stmt.excluded.status,
+                "last_seen": stmt.excluded.last_seen,
+                "ip_hi": stmt.excluded.ip_hi,
+                "ip_lo": stmt.excluded.ip_lo,
+            }
+        )
+        db.execute(stmt)
+
+    added = [(device_id, after) for device_id, before, after in changes if before is None]
+    if added:
+        changes.extend(_attach_vulnerabilities(db, user_id, added))
+    record_changes(db, user_id, changes)
+    db.commit()
+    return len(rows)
+
+def _attach_vulnerabilities(db: Session, user_id: str, added: List[Tuple[str, List]]) -> List:
+    """Attribute unattributed vulnerabilities to newly added devices by address, and count them"""
+    unattributed = db.query(Vulnerability.id).filter(
+        Vulnerability.user_id == user_id,
+        Vulnerability.device_id.is_(None),
+        Vulnerability.ip_hi.isnot(None)
+    ).first()
+    if unattributed is None:
+        return []
+
+    by_address = {}
+    for device_id, after in added:
+        ip_hi, ip_lo = ipaddr.encode(after[3])
+        if ip_hi is not None:
+            by_address[(ip_hi, ip_lo)] = device_id
+    updates = []
+    addresses = list(by_address)
+    for start in range(0, len(addresses), UPSERT_BATCH_SIZE):
+        chunk = addresses[start:start + UPSERT_BATCH_SIZE]
+        updates.extend(
+            {"id": vulnerability_id, "device_id": by_address[(ip_hi, ip_lo)]}
+            for vulnerability_id, ip_hi, ip_lo in db.query(Vulnerability.id, Vulnerability.ip_hi, Vulnerability.ip_lo).filter(
+                Vulnerability.user_id == user_id,
+                Vulnerability.device_id.is_(None),
+                tuple_(Vulnerability.ip_hi, Vulnerability.ip_lo).in_(chunk)
+            )
+        )
+    if not updates:
+        return []
+    db.bulk_update_mappings(Vulnerability, updates)
+    return count_vulnerabilities(db, user_id, {update["device_id"] for update in updates})
+
+def find_devices(db: Session, user_id: str, hosts: Iterable[str]) -> Dict[str, str]:
+    """The ids of the user's devices matching hosts, by address or else by device name"""
+    addresses, names = {}, set()
+    for host in set(filter(None, hosts)):
+        ip_hi, ip_lo = ipaddr.encode(host)
+        if ip_hi is None:
+            names.add(host)
+        else:
+            addresses[(ip_hi, ip_lo)] = host
+
+    found = {}
+    if addresses:
+        for device_id, ip_hi, ip_lo in db.query(Device.id, Device.ip_hi, Device.ip_lo).filter(
+            Device.user_id == user_id, tuple_(Device.ip_hi, Device.ip_lo).in_(list(addresses))
+        ):
+            found[addresses[(ip_hi, ip_lo)]] = device_id
+    if names:
+        for device_id, name in db.query(Device.id, Device.name).filter(Device.user_id == user_id, Device.name.in_(names)):
+            found.setdefault(name, device_id)
+    return found
+
+def count_vulnerabilities(db: Session, user_id: str, device_ids: Iterable[str]) -> List:
+    """
+    Recount the unresolved vulnerabilities of devices per severity with one grouped
+    query per batch, store the counts that changed and return those as change-log
+    entries. Runs inside the caller's transaction
+    """
+    device_ids = list(set(filter(None, device_ids)))
+    changes, updates = [], []
+    for start in range(0, len(device_ids), UPSERT_BATCH_SIZE):
+        chunk = device_ids[start:start + UPSERT_BATCH_SIZE]
+        counts = {device_id: dict.fromkeys(SEVERITY_LEVELS, 0) for device_id in chunk}
+        for device_id, severity, count in db.query(
+            Vulnerability.device_id, func.lower(Vulnerability.severity), func.count(Vulnerability.id)
+        ).filter(
+            Vulnerability.user_id == user_id,
+            Vulnerability.device_id.in_(chunk),
+            or_(Vulnerability.status.is_(None), Vulnerability.status.notin_(CLOSED_VULNERABILITY_STATUSES))
+        ).group_by(Vulnerability.device_id, func.lower(Vulnerability.severity)):
+            if severity in counts[device_id]:
+                counts[device_id][severity] = count
+
+        for device in db.query(Device.id, *MAP_COLUMNS).filter(Device.user_id == user_id, Device.id.in_(chunk)):
+            before = _map_state(device)
+            after = before[:4] + [counts[device.id][severity] for severity in SEVERITY_LEVELS]
+            if after != before:
+                changes.append((device.id, before, after))
+                updates.append({
+                    "id": device.id,
+                    "vulnerabilities": sum(after[4:]),
+                    **dict(zip(SEVERITY_COUNT_ATTRIBUTES, after[4:]))
+                })
+    if updates:
+        db.bulk_update_mappings(Device, updates)
+    return changes
+
+def update_vulnerability_counts(db: Session, user_id: str, device_ids: Iterable[str]):
+    """Recount the vulnerabilities of devices after vulnerabilities changed, inside the caller's transaction"""
+    db.flush()
+    record_changes(db, user_id, count_vulnerabilities(db, user_id, device_ids))
+
+def delete_device(db: Session, user_id: str, device_id: str) -> bool:
+    """Remove a device from the user's inventory, logging the removal. Returns False if it is not theirs"""
+    device = get_device(db, user_id, device_id)
+    if device is None:
+        return False
+    record_changes(db, user_id, [(device.id, _map_state(device), None)])
+    db.query(Vulnerability).filter(Vulnerability.user_id == user_id, Vulnerability.device_id == device.id).update(
+        {"device_id": None}, synchronize_session=False
+    )
+    db.delete(device)
+    db.commit()
+    return True
+
+def get_device(db: Session, user_id: str, device_id: str) -> Optional[Device]:
+    """Look a device up by primary key, checking it belongs to the user"""
+    device = db.get(Device, device_id)
+    if device is None or device.user_id != user_id:
+        return None
+    return device
+
+def get_devices(
+    db: Session,
+    user_id: str,
+    type: Optional[str] = None,
+    status: Optional[str] = None,
+    search: Optional[str] = None,
+    seen_since: Optional[datetime] = None,
+    ip_range: Optional[Tuple[int, int]] = None,
+    sort: str = "ip",
+    offset: int = 0,
+    limit: int = 100
+) -> Tuple[List[Device], int]:
+    """
+    A page of the user's devices matching the filters, and the total number of
+    matches. `ip_range` is a (first, last) pair from ipaddr.parse_range
+    """
+    query = db.query(Device).filter(Device.user_id == user_id)
+    if type:
+        query = query.filter(Device.type == type)
+    if status:
+        query = query.filter(Device.status == status)
+    if seen_since:
+        query = query.filter(Device.last_seen >= seen_since)
+    if ip_range:
+        query = query.filter(ipaddr.range_clause(Device.ip_hi, Device.ip_lo, *ip_range))
+    if search:
+        pattern = f"%{search}%"
+        query = query.filter(Device.ip.like(pattern) | Device.name.ilike(pattern))
+
+    total = query.with_entities(func.count(Device.id)).scalar()
+    descending = sort.startswith("-")
+    columns = [column.desc() if descending else column for column in SORT_COLUMNS[sort.lstrip("-")]]
+    devices = query.order_by(*columns, Device.id).offset(offset).limit(limit).all()
+    return devices, total
+
+def to_network_device(device: Device) -> Dict:
+    """Shape a device for the NetworkDevice schema"""
+    return {
+        "id": device.id,
+        "name": device.name,
+        "ip": device.ip,
+        "type": device.type,
+        "status": device.status,
+        "lastSeen": device.last_seen.isoformat() if device.last_seen else None,
+        "vulnerabilities": device.vulnerabilities or 0,
+        "severityCounts": {
+            severity: getattr(device, attribute) or 0
+            for severity, attribute in zip(SEVERITY_LEVELS, SEVERITY_COUNT_ATTRIBUTES)
+        },
+    }
@@ -0,0 +1,235 @@
+"""
+Host discovery.
+
+A sweep probes every address of a network range with TCP connects to common ports
+and an unprivileged UDP datagram to a port that is normally closed. A host is live
+if any TCP port accepts or refuses the connection, or if the UDP probe draws an
+ICMP port-unreachable (reported by the kernel as a refused connection). Probes run
+on the event loop with at most DISCOVERY_CONCURRENCY sockets open at a time, and
+live hosts are merged into the device inventory in batches while the sweep runs.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence
+import asyncio
+import ipaddress
+import os
+import logging
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+from ..database.database import SessionLocal
+from ..models.discovery_job import DiscoveryJob
+from . import device_service
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TARGET = os.getenv("DISCOVERY_DEFAULT_TARGET", "192.168.1.0/24")
+CONCURRENCY = int(os.getenv("DISCOVERY_CONCURRENCY", "1024"))
+TIMEOUT = float(os.getenv("DISCOVERY_TIMEOUT", "0.5"))
+MAX_HOSTS = int(os.getenv("DISCOVERY_MAX_HOSTS", "4096"))
+# Seconds between progress and inventory writes during a sweep
+FLUSH_INTERVAL = 0.5
+
+DEFAULT_TCP_PORTS = (22, 53, 80, 135, 139, 443, 445, 3389, 8080, 9100)
+UDP_PROBE_PORT = 33434  # Traceroute's first port, closed on almost every host
+
+# Device type guessed from the first matching open port
+PORT_TYPES = (
+    (9100, "printer"),
+    (631, "printer"),
+    (3389, "workstation"),
+    (135, "workstation"),
+    (139, "workstation"),
+    (53, "router"),
+    (22, "server"),
+    (80, "server"),
+    (443, "server"),
+    (8080, "server"),
+    (445, "server"),
+)
+
+def parse_target(target: str) -> ipaddress._BaseNetwork:
+    """Parse a CIDR range or single address, rejecting ranges over MAX_HOSTS addresses"""
+    try:
+        network = ipaddress.ip_network(target.strip(), strict=False)
+    except ValueError:
+        raise ValueError(f"Invalid network range: {target}")
+    if network.num_addresses > MAX_HOSTS:
+        raise ValueError(f"Network range {target} has more than {MAX_HOSTS} addresses")
+    return network
+
+def guess_type(open_ports: Iterable[int]) -> str:
+    ports = set(open_ports)
+    return next((device_type for port, device_type in PORT_TYPES if port in ports), "unknown")
+
+async def probe_tcp(ip: str, port: int, timeout: float = TIMEOUT) -> Optional[bool]:
+    """True if the port is open, False if the host refused it (so it is up), None without an answer"""
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+    except ConnectionRefusedError:
+        return False
+    except (OSError, asyncio.TimeoutError):
+        return None
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True
+
+class _UdpProbe(asyncio.DatagramProtocol):
+    def __init__(self, answered: asyncio.Future):
+        self.answered = answered
+
+    def datagram_received(self, data, addr):
+        if not self.answered.done():
+            self.answered.set_result(True)
+
+    def error_received(self, exc):
+        if not self.answered.done():
+            self.answered.set_result(isinstance(exc, ConnectionRefusedError))
+
+async def probe_udp(ip: str, port: int = UDP_PROBE_PORT, timeout: float = TIMEOUT) -> bool:
+    """True if the host answered a datagram, usually with ICMP port unreachable"""
+    loop = asyncio.get_running_loop()
+    answered = loop.create_future()
+    try:
+        transport, _ = await loop.create_datagram_endpoint(lambda: _UdpProbe(answered), remote_addr=(ip, port))
+    except OSError:
+        return False
+    try:
+        transport.sendto(b"\x00")
+        return await asyncio.wait_for(answered, timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    finally:
+        transport.close()
+
+async def probe_host(ip: str, tcp_ports: Sequence[int], timeout: float = TIMEOUT) -> Optional[Dict]:
+    """The device found at `ip`, or None if the host did not answer any probe"""
+    udp_probe = asyncio.ensure_future(probe_udp(ip, timeout=timeout))
+    tcp_results = await asyncio.gather(*(probe_tcp(ip, port, timeout) for port in tcp_ports))
+    if any(result is not None for result in tcp_results):
+        udp_probe.cancel()  # Already known to be up
+    elif not await udp_probe:
+        return None
+    open_ports = [port for port, result in zip(tcp_ports, tcp_results) if result]
+    return {
+        "ip": ip,
+        "name": ip,
+        "type": guess_type(open_ports),
+        "status": "online",
+        "last_seen": datetime.utcnow(),
+    }
+
+def _descriptor_budget() -> int:
+    try:
+        import resource
+        soft_limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    except (ImportError, ValueError, OSError):  # No resource module on Windows
+        return CONCURRENCY
+    return CONCURRENCY if soft_limit == resource.RLIM_INFINITY else max(soft_limit // 2, 16)
+
+def create_job(db: Session, user_id: str, network) -> DiscoveryJob:
+    job = DiscoveryJob(user_id=user_id, target=str(network), status="pending", hosts_total=_host_count(network))
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+def get_job(db: Session, user_id: str, job_id: str) -> Optional[DiscoveryJob]:
+    job = db.get(DiscoveryJob, job_id)
+    if job is None or job.user_id != user_id:
+        return None
+    return job
+
+def _hosts(network) -> Iterable[str]:
+    # hosts() skips the network and broadcast addresses, except for /31, /32 and single addresses
+    return (str(ip) for ip in (network.hosts() if network.num_addresses > 2 else network))
+
+def _host_count(network) -> int:
+    return network.num_addresses - 2 if network.num_addresses > 2 else network.num_addresses
+
+def _save_progress(job_id: str, user_id: str, devices: List[Dict], values: Dict):
+    db = SessionLocal()
+    try:
+        if devices:
+            device_service.upsert_devices(db, user_id, devices)
+        db.query(DiscoveryJob).filter(DiscoveryJob.id == job_id).update(values)
+        db.commit()
+    finally:
+        db.close()
+
+async def run_discovery(job_id: str, user_id: str, target: str, tcp_ports: Sequence[int] = DEFAULT_TCP_PORTS,
+                        timeout: float = TIMEOUT, concurrency: int = CONCURRENCY):
+    """Sweep `target`, streaming live hosts into the user's inventory and progress into the job"""
+    loop = asyncio.get_running_loop()
+    network = parse_target(target)
+    hosts = _hosts(network)
+    hosts_total = _host_count(network)
+    pending: List[Dict] = []
+    scanned = 0
+    found = 0
+
+    async def worker():
+        nonlocal scanned, found
+        for ip in hosts:  # Shared iterator: each worker takes the next address
+            device = await probe_host(ip, tcp_ports, timeout)
+            scanned += 1
+            if device:
+                pending.append(device)
+                found += 1
+
+    async def flush(values: Dict):
+        batch = pending[:]
+        del pending[:]
+        await loop.run_in_executor(None, _save_progress, job_id, user_id, batch, values)
+
+    # Each host keeps one socket per TCP port plus the UDP probe open, and the
+    # sweep must leave file descriptors for the rest of the process
+    concurrency = min(concurrency, _descriptor_budget())
+    workers = max(1, min(concurrency // (len(tcp_ports) + 1), hosts_total))
+    tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+    try:
+        await flush({"status": "running"})
+        sweep = asyncio.gather(*tasks)
+        while not sweep.done():
+            await asyncio.wait([sweep], timeout=FLUSH_INTERVAL)
+            await flush({
+                "hosts_scanned": scanned,
+                "devices_found": found,
+                "progress": min(int(scanned * 100 / hosts_total), 99),
+            })
+        sweep.result()
+        await flush({
+            "status": "completed",
+            "progress": 100,
+            "hosts_scanned": scanned,
+            "devices_found": found,
+            "finished_at": datetime.utcnow(),
+        })
+    except Exception as e:
+        logger.error(f"Discovery job {job_id} failed: {e}")
+        for task in tasks:
+            task.cancel()
+        await loop.run_in_executor(None, _save_progress, job_id, user_id, pending, {
+            "status": "failed",
+            "error": str(e),
+            "finished_at": datetime.utcnow(),
+        })
+
+def to_discovery_job(job: DiscoveryJob) -> Dict:
+    """Shape a job for the DiscoveryJob schema"""
+    return {
+        "id": job.id,
+        "target": job.target,
+        "status": job.status,
+        "progress": job.progress or 0,
+        "hostsTotal": job.hosts_total or 0,
+        "hostsScanned": job.hosts_scanned or 0,
+        "devicesFound": job.devices_found or 0,
+        "startedAt": job.started_at.isoformat() if job.started_at else None,
+        "finishedAt": job.finished_at.isoformat() if job.finished_at else None,
+        "error": job.error,
+    }
@@ -0,0 +1,182 @@
+"""
+Streaming exports.
+
+Exports never hold a result set in memory: rows are read through a server-side
+cursor (Query.yield_per) in its own session, turned into records one at a time,
+encoded as CSV, NDJSON or SARIF and sent in ~64 KB chunks through a
+StreamingResponse, optionally gzip-compressed on the fly. Memory use stays flat
+however many rows are exported.
+"""
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, Optional, Sequence
+import csv
+import io
+import json
+import zlib
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Query, Session
+from ..database.database import SessionLocal
+
+EXPORT_FORMATS = ("csv", "ndjson", "sarif")
+MEDIA_TYPES = {
+    "csv": "text/csv",  # Starlette appends the charset to text/* types
+    "ndjson": "application/x-ndjson",
+    "sarif": "application/sarif+json",
+}
+EXTENSIONS = {"csv": "csv", "ndjson": "ndjson", "sarif": "sarif"}
+
+# Rows fetched from the cursor at a time
+FETCH_SIZE = 1000
+# Bytes buffered before a chunk is sent
+CHUNK_BYTES = 64 * 1024
+
+SARIF_SCHEMA = "https://json.schemastore.org/sarif-2.1.0.json"
+SARIF_LEVELS = {"critical": "error", "high": "error", "medium": "warning", "low": "note", "info": "note"}
+# GitHub code scanning reads the numeric severity of a result from this property
+SARIF_SECURITY_SEVERITY = {"critical": "9.5", "high": "7.5", "medium": "5.0", "low": "2.5", "info": "0.0"}
+
+def stream_query(build_query: Callable[[Session], Query], to_records: Callable) -> Iterator[Dict]:
+    """
+    Run the query built by `build_query` in a dedicated session and yield the records
+    `to_records(row)` returns for each row (an iterable, so one row may give several).
+    The session lives as long as the iteration, independent of the request's
+    """
+    db = SessionLocal()
+    try:
+        for row in build_query(db).yield_per(FETCH_SIZE):
+            yield from to_records(row)
+    finally:
+        db.close()
+
+# Leading characters that make spreadsheets evaluate a cell as a formula
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+def _csv_cell(value) -> str:
+    """
+    A CSV cell for `value`. Scanner output is attacker-controlled, so text that a
+    spreadsheet would run as a formula is quoted with a leading apostrophe
+    """
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (int, float)):
+        return str(value)
+    text = str(value)
+    return "'" + text if text.startswith(FORMULA_PREFIXES) else text
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def encode_csv(records: Iterable[Dict], fields: Sequence[str]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for record in records:
+        writer.writerow([_csv_cell(record.get(field)) for field in fields])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def encode_ndjson(records: Iterable[Dict], fields: Sequence[str]) -> Iterator[str]:
+    for record in records:
+        yield json.dumps({field: record.get(field) for field in fields}, default=_json_default) + "\n"
+
+def sarif_result(record: Dict, rule_id: str, message: str, location: Optional[str]) -> Dict:
+    """A SARIF result for a finding; the whole record goes into its properties"""
+    severity = (record.get("severity") or "info").lower()
+    result = {
+        "ruleId": rule_id,
+        "level": SARIF_LEVELS.get(severity, "note"),
+        "message": {"text": message or rule_id},
+        "properties": {**record, "security-severity": SARIF_SECURITY_SEVERITY.get(severity, "0.0")},
+    }
+    if location:
+        result["locations"] = [{"logicalLocations": [{"name": location, "kind": "resource"}]}]
+    return result
+
+def encode_sarif(records: Iterable[Dict], to_result: Callable[[Dict], Dict]) -> Iterator[str]:
+    """One SARIF 2.1.0 log with a single run, its results written as they come"""
+    yield json.dumps({"version": "2.1.0", "$schema": SARIF_SCHEMA})[:-1]
+    yield ', "runs": [{"tool": {"driver": {"name": "NexaSecurity"}}, "results": ['
+    separator = ""
+    for record in records:
+        yield separator + json.dumps(to_result(record), default=_json_default)
+        separator = ","
+    yield "]}]}\n"
+
+def chunked(pieces: Iterable[str]) -> Iterator[bytes]:
+    """Join small encoded pieces into chunks of about CHUNK_BYTES"""
+    parts, size = [], 0
+    for piece in pieces:
+        parts.append(piece)
+        size += len(piece)
+        if size >= CHUNK_BYTES:
+            yield "".join(parts).encode()
+            parts, size = [], 0
+    if parts:
+        yield "".join(parts).encode()
+
+def gzipped(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def export_response(records: Iterable[Dict], fields: Sequence[str], format: str, filename: str,
+                    to_sarif: Callable[[Dict], Dict], compress: bool = False) -> StreamingResponse:
+    """
+    Stream `records` as an attachment in the given format. `fields` are the CSV
+    columns and NDJSON keys; `to_sarif` maps a record to a SARIF result. With
+    `compress` the body is a .gz file
+    """
+    if format == "csv":
+        pieces = encode_csv(records, fields)
+    elif format == "ndjson":
+        pieces = encode_ndjson(records, fields)
+    else:
+        pieces = encode_sarif(records, to_sarif)
+
+    body = chunked(pieces)
+    filename = f"{filename}.{EXTENSIONS[format]}"
+    media_type = MEDIA_TYPES[format]
+    if compress:
+        body = gzipped(body)
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+# Columns of scan and pentest finding exports
+FINDING_FIELDS = (
+    "source", "sourceId", "target", "scanType", "startTime",
+    "id", "title", "severity", "type", "affected", "cve", "description", "remediation",
+)
+
+def finding_records(source: str, row, normalize: Callable[[Dict], Dict]) -> Iterator[Dict]:
+    """One export record per finding of a scan or pentest row (id, target, scan_type, start_time, findings)"""
+    for finding in row.findings or []:
+        yield {
+            "source": source,
+            "sourceId": row.id,
+            "target": row.target,
+            "scanType": row.scan_type,
+            "startTime": row.start_time,
+            **normalize(finding),
+        }
+
+def finding_sarif(record: Dict) -> Dict:
+    return sarif_result(
+        record,
+        rule_id=record.get("cve") or record.get("title") or "finding",
+        message=f"{record.get('title')}: {record.get('description')}",
+        location=record.get("target"),
+    )
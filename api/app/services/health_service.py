@@ -0,0 +1,152 @@
+"""
+Background system health sampler.
+
+A task on the event loop takes a sample every HEALTH_SAMPLE_INTERVAL seconds and
+keeps the most recent HEALTH_HISTORY_SIZE samples in a ring buffer. The psutil
+calls run in a worker thread, so the health endpoints never block the loop and
+answer from the latest sample.
+"""
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+import asyncio
+import os
+import time
+import logging
+import psutil
+from dotenv import load_dotenv
+from ..database.database import engine
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL = float(os.getenv("HEALTH_SAMPLE_INTERVAL", "5"))
+HISTORY_SIZE = int(os.getenv("HEALTH_HISTORY_SIZE", "720"))  # 1 hour at 5s
+# Seconds of history the ring buffer can answer for
+HISTORY_SECONDS = int(HISTORY_SIZE * SAMPLE_INTERVAL)
+
+# Percent thresholds above which the system is reported as "warning"
+WARNING_THRESHOLD = 80
+
+def _db_pool_stats() -> Dict[str, Optional[int]]:
+    pool = engine.pool
+    checked_out = getattr(pool, "checkedout", None)
+    size = getattr(pool, "size", None)
+    return {
+        "db_pool_checked_out": checked_out() if callable(checked_out) else None,
+        "db_pool_size": size() if callable(size) else None
+    }
+
+def collect_sample(loop_lag_ms: float = 0.0) -> Dict[str, Any]:
+    """Take one sample of the host and process. Never blocks: CPU is measured since the previous call"""
+    process = psutil.Process()
+    try:
+        load_1, load_5, load_15 = os.getloadavg()
+    except (AttributeError, OSError):
+        load_1 = load_5 = load_15 = None
+    try:
+        open_fds = process.num_fds()
+    except AttributeError:
+        open_fds = process.num_handles()  # Windows
+
+    sample = {
+        "timestamp": time.time(),
+        "cpu": round(psutil.cpu_percent(interval=None), 1),
+        "memory": round(psutil.virtual_memory().percent, 1),
+        "disk": round(psutil.disk_usage("/").percent, 1),
+        "load_1": load_1,
+        "load_5": load_5,
+        "load_15": load_15,
+        "open_fds": open_fds,
+        "loop_lag_ms": round(loop_lag_ms, 2),
+        "uptime": int(time.time() - psutil.boot_time()),
+    }
+    sample.update(_db_pool_stats())
+    return sample
+
+class HealthSampler:
+    def __init__(self, interval: float = SAMPLE_INTERVAL, history_size: int = HISTORY_SIZE):
+        self.interval = interval
+        self.samples: Deque[Dict[str, Any]] = deque(maxlen=history_size)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            # Prime the CPU counter so the first sample is meaningful
+            psutil.cpu_percent(interval=None)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        lag_ms = 0.0
+        while True:
+            try:
+                sample = await loop.run_in_executor(None, collect_sample, lag_ms)
+                self.samples.append(sample)
+            except Exception as e:
+                logger.error(f"Error collecting health sample: {e}")
+
+            # Event-loop lag is how late the loop wakes us up after the sleep
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag_ms = max(loop.time() - expected, 0.0) * 1000
+
+    def latest(self) -> Dict[str, Any]:
+        """The most recent sample, or a fresh non-blocking one if the sampler hasn't run yet"""
+        if self.samples:
+            return self.samples[-1]
+        sample = collect_sample()
+        self.samples.append(sample)
+        return sample
+
+    def history(self, resolution: float, window: float) -> List[Dict[str, Any]]:
+        """Samples of the last `window` seconds averaged into buckets of `resolution` seconds"""
+        since = time.time() - window
+        buckets: Dict[int, List[Dict[str, Any]]] = {}
+        for sample in list(self.samples):
+            if sample["timestamp"] >= since:
+                buckets.setdefault(int(sample["timestamp"] // resolution), []).append(sample)
+
+        series = []
+        for bucket, samples in sorted(buckets.items()):
+            point = {"timestamp": bucket * resolution}
+            for field, value in samples[-1].items():
+                if field == "timestamp":
+                    continue
+                values = [s[field] for s in samples if s.get(field) is not None]
+                point[field] = round(sum(values) / len(values), 2) if values else None
+            series.append(point)
+        return series
+
+def health_status(sample: Dict[str, Any]) -> str:
+    return "healthy" if all(
+        sample[field] < WARNING_THRESHOLD for field in ("cpu", "memory", "disk")
+    ) else "warning"
+
+def to_system_health(sample: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape a sample for the SystemHealth schema"""
+    return {
+        "status": health_status(sample),
+        "cpu": sample["cpu"],
+        "memory": sample["memory"],
+        "disk": sample["disk"],
+        "uptime": sample["uptime"],
+        "lastUpdate": datetime.fromtimestamp(sample["timestamp"]).isoformat(),
+        "error": None,
+        "load": sample["load_1"],
+        "openFds": sample["open_fds"],
+        "loopLagMs": sample["loop_lag_ms"],
+        "dbPoolCheckedOut": sample["db_pool_checked_out"]
+    }
+
+sampler = HealthSampler()
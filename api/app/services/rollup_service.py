@@ -0,0 +1,132 @@
+from ..models.daily_stats import DailyStat
+from ..models.vulnerability import Vulnerability
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from datetime import date, datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+RollupKey = Tuple[str, Optional[date], str, str]
+
+def rollup_key(vuln) -> RollupKey:
+    """
+    Get the daily_stats key (user_id, date, severity, status) a vulnerability is counted
+    under. `discovered` must be set before the row is counted (inserts set it explicitly
+    with datetime.now(), the clock rebuild() reads back); without it the date is None and,
+    as in rebuild(), the row is not counted
+    """
+    day = vuln.discovered.date() if vuln.discovered else None
+    return (vuln.user_id, day, vuln.severity, vuln.status or "open")
+
+def _to_date(value) -> date:
+    # SQLite returns date() as a 'YYYY-MM-DD' string, other databases return a date
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+
+def _upsert_statement(db: Session):
+    # Both SQLite and PostgreSQL support INSERT ... ON CONFLICT DO UPDATE
+    if db.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(DailyStat.__table__)
+
+def apply_deltas(db: Session, deltas: Dict[RollupKey, int]):
+    """
+    Add count deltas to the rollup in one statement. Runs inside the caller's
+    transaction, so the rollup commits or rolls back together with the change
+    """
+    rows = [
+        {"user_id": user_id, "date": day, "severity": severity, "status": status, "count": delta}
+        for (user_id, day, severity, status), delta in deltas.items()
+        if delta and severity and day is not None
+    ]
+    if not rows:
+        return
+
+    table = DailyStat.__table__
+    stmt = _upsert_statement(db).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.date, table.c.severity, table.c.status],
+        set_={"count": table.c.count + stmt.excluded.count}
+    )
+    db.execute(stmt)
+
+def record_inserted(db: Session, vulnerabilities: Iterable):
+    """Count newly inserted vulnerabilities in the rollup"""
+    deltas: Dict[RollupKey, int] = {}
+    for vuln in vulnerabilities:
+        key = rollup_key(vuln)
+        deltas[key] = deltas.get(key, 0) + 1
+    apply_deltas(db, deltas)
+
+def record_status_change(db: Session, vuln, old_status: str):
+    """Move a vulnerability from its old status bucket to its current one"""
+    new_key = rollup_key(vuln)
+    old_key = new_key[:3] + (old_status or "open",)
+    if old_key != new_key:
+        apply_deltas(db, {old_key: -1, new_key: 1})
+
+def record_moves(db: Session, moves: Iterable[Tuple[RollupKey, RollupKey]]):
+    """Move vulnerabilities between buckets, given (old key, new key) pairs, in one statement"""
+    deltas: Dict[RollupKey, int] = {}
+    for old_key, new_key in moves:
+        if old_key != new_key:
+            deltas[old_key] = deltas.get(old_key, 0) - 1
+            deltas[new_key] = deltas.get(new_key, 0) + 1
+    apply_deltas(db, deltas)
+
+def record_bulk_status_change(db: Session, user_id: str, groups: Iterable[Tuple], status: str):
+    """
+    Move counted groups of a user's vulnerabilities to `status`, given as
+    (discovery date, severity, old status, count) rows of a grouped query
+    """
+    deltas: Dict[RollupKey, int] = {}
+    for day, severity, old_status, count in groups:
+        if not day:
+            continue  # Not counted without a discovery date, as in rebuild()
+        day = _to_date(day)
+        for key, delta in (((user_id, day, severity, old_status or "open"), -count), ((user_id, day, severity, status), count)):
+            deltas[key] = deltas.get(key, 0) + delta
+    apply_deltas(db, deltas)
+
+def clear_user(db: Session, user_id: str):
+    """Remove every rollup row of a user (before re-recording their vulnerabilities)"""
+    db.query(DailyStat).filter(DailyStat.user_id == user_id).delete(synchronize_session=False)
+
+def rebuild(db: Session, user_id: Optional[str] = None) -> int:
+    """Recompute the rollup from the vulnerabilities table, for one user or everyone. Returns the rows written"""
+    rollup_query = db.query(DailyStat)
+    source_query = db.query(
+        Vulnerability.user_id,
+        func.date(Vulnerability.discovered),
+        Vulnerability.severity,
+        func.coalesce(Vulnerability.status, "open"),
+        func.count(Vulnerability.id)
+    ).filter(Vulnerability.severity.isnot(None), Vulnerability.discovered.isnot(None))
+
+    if user_id:
+        rollup_query = rollup_query.filter(DailyStat.user_id == user_id)
+        source_query = source_query.filter(Vulnerability.user_id == user_id)
+
+    rollup_query.delete(synchronize_session=False)
+
+    rows = source_query.group_by(
+        Vulnerability.user_id,
+        func.date(Vulnerability.discovered),
+        Vulnerability.severity,
+        func.coalesce(Vulnerability.status, "open")
+    ).all()
+
+    db.bulk_insert_mappings(DailyStat, [
+        {
+            "user_id": row_user_id,
+            "date": _to_date(day),
+            "severity": severity,
+            "status": status,
+            "count": count
+        }
+        for row_user_id, day, severity, status, count in rows
+    ])
+    db.commit()
+    return len(rows)
@@ -1,6 +1,10 @@
 from ..models.scan import Scan
 from ..models.vulnerability import Vulnerability
-from sqlalchemy.orm import Session
+from . import rollup_service, device_service, export_service, vulnerability_service
+from ..core import events
+from ..utils import ipaddr
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session, load_only
 import uuid
 from datetime import datetime
 import asyncio
@@ -8,7 +12,10 @@ import random
 from fastapi import BackgroundTasks
 import json
 import os
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
 
 def create_scan(db: Session, user_id: str, config):
     """Create a new scan in the database"""
@@ -19,10 +26,15 @@ def create_scan(db: Session, user_id: str, config):
         scan_type=config.scanType,
         output_directory=config.outputDirectory
     )
+    covered = ipaddr.target_range(config.networkTarget)
+    if covered:
+        new_scan.ip_hi, new_scan.ip_lo = ipaddr.split(covered[0])
+        new_scan.ip_end_hi, new_scan.ip_end_lo = ipaddr.split(covered[1])
     
     db.add(new_scan)
     db.commit()
     db.refresh(new_scan)
+    events.publish(events.SCAN_STARTED, user_id=user_id, scan_id=new_scan.id)
     
     return new_scan
 
@@ -34,6 +46,64 @@ def get_user_scans(db: Session, user_id: str):
     """Get all scans for a user"""
     return db.query(Scan).filter(Scan.user_id == user_id).all()
 
+def get_user_scan_summaries(db: Session, user_id: str, ip_range: Optional[Tuple[int, int]] = None):
+    """
+    Get all scans for a user with only the scalar columns loaded (findings and summary
+    JSON stay deferred). `ip_range` keeps the scans whose whole target lies inside it
+    """
+    query = db.query(Scan).options(
+        load_only(
+            Scan.id,
+            Scan.target,
+            Scan.scan_type,
+            Scan.status,
+            Scan.progress,
+            Scan.start_time,
+            Scan.end_time,
+            Scan.total_findings,
+            Scan.critical_findings,
+            Scan.high_findings,
+            Scan.medium_findings,
+            Scan.low_findings,
+            Scan.info_findings
+        )
+    ).filter(Scan.user_id == user_id)
+    if ip_range:
+        query = query.filter(*_target_in_range(ip_range))
+    return query.all()
+
+def _target_in_range(ip_range: Tuple[int, int]) -> List:
+    """Conditions keeping the scans whose whole target lies inside `ip_range`"""
+    first, last = ip_range
+    return [
+        ipaddr.range_clause(Scan.ip_hi, Scan.ip_lo, first, last),
+        tuple_(Scan.ip_end_hi, Scan.ip_end_lo) <= tuple_(*ipaddr.split(last))
+    ]
+
+def _export_finding(finding: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": finding.get("id"),
+        "title": finding.get("title"),
+        "severity": finding.get("severity"),
+        "type": finding.get("type"),
+        "affected": finding.get("affected"),
+        "cve": finding.get("cve"),
+        "description": finding.get("description"),
+        "remediation": finding.get("remediation"),
+    }
+
+def export_findings(user_id: str, ip_range: Optional[Tuple[int, int]] = None):
+    """The findings of all the user's scans as export records, streamed scan by scan"""
+    def build_query(db: Session):
+        query = db.query(Scan.id, Scan.target, Scan.scan_type, Scan.start_time, Scan.findings).filter(Scan.user_id == user_id)
+        if ip_range:
+            query = query.filter(*_target_in_range(ip_range))
+        return query.order_by(Scan.start_time, Scan.id)
+
+    return export_service.stream_query(
+        build_query, lambda row: export_service.finding_records("scan", row, _export_finding)
+    )
+
 def update_scan_status(db: Session, scan_id: str, status: str, progress: int, current_task: str, estimated_time_remaining: Optional[int] = None):
     """Update scan status"""
     scan = get_scan(db, scan_id)
@@ -62,11 +132,42 @@ def complete_scan(db: Session, scan_id: str, findings: List[Dict[str, Any]], sum
         scan.summary = summary
         scan.estimated_time_remaining = 0
         
+        # Pre-compute severity counts so list views don't need to load the findings
+        severity_counts = summary.get("severity_counts", {})
+        scan.total_findings = sum(severity_counts.values())
+        scan.critical_findings = severity_counts.get("critical", 0)
+        scan.high_findings = severity_counts.get("high", 0)
+        scan.medium_findings = severity_counts.get("medium", 0)
+        scan.low_findings = severity_counts.get("low", 0)
+        scan.info_findings = severity_counts.get("info", 0)
+        
         db.commit()
         db.refresh(scan)
+        events.publish(events.SCAN_COMPLETED, user_id=scan.user_id, scan_id=scan.id)
+    return scan
+
+def fail_scan(db: Session, scan_id: str):
+    """Mark a scan as failed, discarding whatever its task left uncommitted"""
+    db.rollback()
+    scan = get_scan(db, scan_id)
+    if scan:
+        scan.status = "failed"
+        scan.current_task = "Failed"
+        scan.end_time = datetime.now()
+        scan.estimated_time_remaining = 0
+        db.commit()
+        events.publish(events.SCAN_FAILED, user_id=scan.user_id, scan_id=scan.id)
     return scan
 
 async def run_scan_task(scan_id: str, db: Session):
+    """Run a scan in the background, marking it failed if it raises"""
+    try:
+        await _simulate_scan(scan_id, db)
+    except Exception as e:
+        logger.error(f"Scan {scan_id} failed: {e}")
+        fail_scan(db, scan_id)
+
+async def _simulate_scan(scan_id: str, db: Session):
     """Function to simulate a scan process with real data creation"""
     # Update to running
     update_scan_status(db, scan_id, "running", 0, "Initializing scan", 180)
@@ -102,7 +203,7 @@ async def run_scan_task(scan_id: str, db: Session):
     summary = generate_summary_for_findings(findings)
     
     # Store findings as vulnerabilities
-    store_findings_as_vulnerabilities(db, scan.user_id, findings)
+    store_findings_as_vulnerabilities(db, scan.user_id, findings, host=scan_host(scan.target))
     
     # Complete scan
     complete_scan(db, scan_id, findings, summary)
@@ -136,6 +237,7 @@ def generate_network_scan_findings(target):
             "remediation": "Upgrade to the latest version of OpenSSH.",
             "affected": "OpenSSH 7.5p1",
             "cve": "CVE-2018-15473",
+            "cvss_vector": "CVSS:3.1/AV:N/AC:L/PR:N/UI:N/S:U/C:H/I:N/A:N",
         },
         {
             "id": f"nf-{uuid.uuid4()}",
@@ -146,6 +248,7 @@ def generate_network_scan_findings(target):
             "remediation": "Disable weak cipher algorithms in the SSH server configuration.",
             "affected": "SSH Server",
             "cve": None,
+            "cvss_vector": "CVSS:3.1/AV:N/AC:H/PR:N/UI:N/S:U/C:H/I:N/A:N",
         }
     ]
     
@@ -179,6 +282,7 @@ def generate_web_scan_findings(target):
             "remediation": "Configure the web server to include proper security headers.",
             "affected": "Web Server",
             "cve": None,
+            "cvss_vector": "CVSS:3.1/AV:N/AC:L/PR:N/UI:R/S:U/C:L/I:L/A:N",
         }
     ]
     
@@ -193,6 +297,7 @@ def generate_web_scan_findings(target):
             "remediation": "Configure custom error pages and disable debugging information in production.",
             "affected": "Web Application",
             "cve": None,
+            "cvss_vector": "CVSS:3.1/AV:N/AC:L/PR:N/UI:N/S:U/C:L/I:N/A:N",
         })
     
     if random.random() > 0.7:
@@ -205,6 +310,7 @@ def generate_web_scan_findings(target):
             "remediation": "Use parameterized queries and input validation.",
             "affected": "Web Application",
             "cve": None,
+            "cvss_vector": "CVSS:3.1/AV:N/AC:L/PR:N/UI:N/S:U/C:H/I:H/A:H",
         })
     
     return base_findings
@@ -250,11 +356,25 @@ def generate_summary_for_findings(findings):
         "scan_type": "network"  # Would be dynamic in real system
     }
 
-def store_findings_as_vulnerabilities(db: Session, user_id: str, findings):
-    """Store scan findings as vulnerability records"""
+def scan_host(target: Optional[str]) -> Optional[str]:
+    """The single host a scan target names (address or hostname), None for network ranges"""
+    covered = ipaddr.target_range(target)
+    if covered and covered[0] != covered[1]:
+        return None
+    return ipaddr.extract_host(target)
+
+def store_findings_as_vulnerabilities(db: Session, user_id: str, findings, host: Optional[str] = None):
+    """
+    Store scan findings as vulnerability records, reported on `host` when the scan
+    targeted one and attributed to the inventory device with that address or name
+    """
+    ip_hi, ip_lo = ipaddr.encode(host)
+    device_id = device_service.find_devices(db, user_id, [host]).get(host) if host else None
+    vulnerabilities = []
     for finding in findings:
         # Only store actual vulnerabilities
         if finding.get("type") == "vulnerability":
+            scored = vulnerability_service.cvss_fields(finding.get("cvss_vector"))
             vuln = Vulnerability(
                 id=str(uuid.uuid4()),
                 user_id=user_id,
@@ -263,17 +383,31 @@ def store_findings_as_vulnerabilities(db: Session, user_id: str, findings):
                 severity=finding.get("severity"),
                 status="open",
                 affected=finding.get("affected", "Unknown"),
+                host=host,
+                ip_hi=ip_hi,
+                ip_lo=ip_lo,
+                device_id=device_id,
                 discovered=datetime.now(),
-                cvss_score=get_cvss_from_severity(finding.get("severity")),
+                cvss_score=scored.get("cvss_score", get_cvss_from_severity(finding.get("severity"))),
+                cvss_vector=scored.get("cvss_vector"),
+                cvss_metrics=scored.get("cvss_metrics"),
+                cvss_temporal_score=scored.get("cvss_temporal_score"),
+                cvss_environmental_score=scored.get("cvss_environmental_score"),
                 cve_id=finding.get("cve"),
                 remediation=finding.get("remediation")
             )
             db.add(vuln)
+            vulnerabilities.append(vuln)
     
+    # Keep the dashboard rollup in step within the same transaction
+    rollup_service.record_inserted(db, vulnerabilities)
+    if device_id and vulnerabilities:
+        device_service.update_vulnerability_counts(db, user_id, [device_id])
     db.commit()
+    events.publish(events.VULNERABILITIES_INGESTED, user_id=user_id, count=len(vulnerabilities))
 
 def get_cvss_from_severity(severity):
-    """Convert severity string to approximate CVSS score"""
+    """Convert severity string to approximate CVSS score, for findings without a CVSS vector"""
     severity_map = {
         "critical": 9.5,
         "high": 7.8,
@@ -0,0 +1,336 @@
+"""
+Network topology.
+
+The map is built from the device inventory as an integer-indexed graph: node
+attributes are parallel lists and edges are parallel arrays of node indexes, so a
+map of tens of thousands of devices is a handful of flat arrays. Devices are
+grouped by subnet; each subnet hangs off its gateway (a router or firewall in it,
+or its lowest address) and every gateway hangs off the core device. This gives
+O(nodes) edges. Large maps are collapsed into subnet clusters at a zoom level, and
+built maps are cached per inventory version.
+
+Clients polling a device-level map fetch only what changed since the version they
+hold: the inventory at that version is rebuilt from the current devices by undoing
+the change log, and the node and edge sets of both versions are compared.
+"""
+from array import array
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+import ipaddress
+import json
+import os
+import socket
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+from ..models.device import Device
+from ..core.cache import get_cache, _MISSING
+from . import device_service
+
+load_dotenv()
+
+# Maps with more devices than this are clustered by subnet when zoom is "auto"
+MAP_MAX_NODES = int(os.getenv("NETWORK_MAP_MAX_NODES", "2000"))
+
+# Cluster prefix length of each zoom level, for IPv4 and IPv6
+ZOOM_PREFIXES = {
+    "subnet": (24, 64),
+    "site": (16, 48),
+}
+# Prefix the device-level map groups devices by when choosing gateways
+GATEWAY_PREFIXES = ZOOM_PREFIXES["subnet"]
+
+GATEWAY_TYPES = ("firewall", "router")
+EDGE_TYPES = ("direct", "indirect")
+DIRECT, INDIRECT = 0, 1
+SEVERITY_LEVELS = device_service.SEVERITY_LEVELS
+
+map_cache = get_cache("network_map", ttl=3600, maxsize=256)
+
+def subnet_of(ip: str, prefixes: Tuple[int, int]) -> str:
+    """The CIDR of the subnet containing `ip` at the given (IPv4, IPv6) prefix lengths"""
+    ipv4_prefix, ipv6_prefix = prefixes
+    if ":" not in ip and ipv4_prefix in (8, 16, 24):
+        # Fast path for the common IPv4 case: keep the leading octets
+        octets = ip.split(".")
+        kept = ipv4_prefix // 8
+        return ".".join(octets[:kept] + ["0"] * (4 - kept)) + f"/{ipv4_prefix}"
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return "unknown"
+    prefix = ipv4_prefix if address.version == 4 else ipv6_prefix
+    return str(ipaddress.ip_network(f"{address}/{prefix}", strict=False))
+
+def _ip_sort_key(ip: str) -> bytes:
+    """Packed address bytes: sorts numerically, IPv4 before IPv6, unparseable addresses last"""
+    try:
+        return socket.inet_pton(socket.AF_INET, ip)
+    except OSError:
+        pass
+    try:
+        return socket.inet_pton(socket.AF_INET6, ip)
+    except OSError:
+        return b"\xff" * 17
+
+class Topology:
+    """Nodes as parallel attribute lists, edges as parallel arrays of node indexes"""
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.names: List[str] = []
+        self.types: List[str] = []
+        self.statuses: List[str] = []
+        self.ips: List[Optional[str]] = []
+        self.sizes: List[Optional[int]] = []
+        self.severity_counts: List[List[int]] = []  # Unresolved vulnerabilities per SEVERITY_LEVELS
+        self.sources = array("i")
+        self.targets = array("i")
+        self.edge_types = array("b")
+
+    def add_node(self, id: str, name: str, type: str, status: str, ip: Optional[str],
+                 severity_counts: List[int], size: Optional[int] = None) -> int:
+        self.ids.append(id)
+        self.names.append(name)
+        self.types.append(type)
+        self.statuses.append(status)
+        self.ips.append(ip)
+        self.severity_counts.append(severity_counts)
+        self.sizes.append(size)
+        return len(self.ids) - 1
+
+    def add_edge(self, source: int, target: int, edge_type: int):
+        self.sources.append(source)
+        self.targets.append(target)
+        self.edge_types.append(edge_type)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def edge_set(self) -> Set[Tuple[str, str, int]]:
+        """Edges as (source id, target id, type), comparable between topologies"""
+        ids = self.ids
+        return {
+            (ids[source], ids[target], edge_type)
+            for source, target, edge_type in zip(self.sources, self.targets, self.edge_types)
+        }
+
+    def to_map(self) -> Dict:
+        """The map in the NetworkMap shape, with node ids in the edges"""
+        ids = self.ids
+        nodes = [
+            {
+                "id": id, "name": name, "type": type, "status": status, "ip": ip, "size": size,
+                "severityCounts": dict(zip(SEVERITY_LEVELS, counts)),
+            }
+            for id, name, type, status, ip, size, counts in zip(
+                ids, self.names, self.types, self.statuses, self.ips, self.sizes, self.severity_counts
+            )
+        ]
+        connections = [
+            {"source": ids[source], "target": ids[target], "type": EDGE_TYPES[edge_type]}
+            for source, target, edge_type in zip(self.sources, self.targets, self.edge_types)
+        ]
+        return {"nodes": nodes, "connections": connections}
+
+    def to_compact(self) -> Dict:
+        """The map as columns, with edges as node indexes: much smaller than to_map for large maps"""
+        return {
+            "nodes": {
+                "id": self.ids,
+                "name": self.names,
+                "type": self.types,
+                "status": self.statuses,
+                "ip": self.ips,
+                "size": self.sizes,
+                "severityCounts": self.severity_counts,
+            },
+            "edges": {
+                "source": self.sources.tolist(),
+                "target": self.targets.tolist(),
+                "type": self.edge_types.tolist(),
+            },
+            "edgeTypes": list(EDGE_TYPES),
+            "severityLevels": list(SEVERITY_LEVELS),
+        }
+
+def _pick_hub(members: Sequence[int], types: List[str]) -> int:
+    """The gateway of a group: its first firewall or router, else its lowest address"""
+    for gateway_type in GATEWAY_TYPES:
+        for index in members:
+            if types[index] == gateway_type:
+                return index
+    return members[0]  # Members are sorted by address
+
+def _link_groups(topology: Topology, groups: Dict[str, List[int]], member_edge_type) -> Dict[str, int]:
+    """Connect each group's members to its hub and every hub to the core; returns the hub of each group"""
+    hubs = {}
+    for subnet, members in groups.items():
+        hub = _pick_hub(members, topology.types)
+        hubs[subnet] = hub
+        for index in members:
+            if index != hub:
+                topology.add_edge(hub, index, member_edge_type(index))
+
+    if hubs:
+        core = _pick_hub(sorted(hubs.values()), topology.types)
+        for hub in hubs.values():
+            if hub != core:
+                topology.add_edge(core, hub, DIRECT)
+    return hubs
+
+def build_device_topology(devices: Sequence[Tuple]) -> Topology:
+    """Build the device-level graph from (id, name, type, status, ip, *severity counts) rows"""
+    topology = Topology()
+    devices = sorted(devices, key=lambda device: _ip_sort_key(device[4]))
+    if devices:
+        columns = list(zip(*devices))
+        ids, names, types, statuses, ips = (list(column) for column in columns[:5])
+        topology.ids, topology.names, topology.types, topology.statuses, topology.ips = ids, names, types, statuses, ips
+        topology.severity_counts = [list(counts) for counts in zip(*columns[5:])]
+        topology.sizes = [None] * len(ids)
+
+    groups: Dict[str, List[int]] = {}
+    for index, ip in enumerate(topology.ips):
+        groups.setdefault(subnet_of(ip, GATEWAY_PREFIXES), []).append(index)
+
+    types = topology.types
+    _link_groups(topology, groups, lambda index: DIRECT if types[index] == "server" else INDIRECT)
+    return topology
+
+def build_cluster_topology(devices: Sequence[Tuple], prefixes: Tuple[int, int]) -> Topology:
+    """Collapse devices into one node per subnet at the given prefix lengths, summing their severity counts"""
+    clusters: Dict[str, List[Tuple[str, str]]] = {}
+    cluster_counts: Dict[str, List[int]] = {}
+    for device in devices:
+        subnet = subnet_of(device[4], prefixes)
+        clusters.setdefault(subnet, []).append((device[2], device[3]))
+        counts = cluster_counts.setdefault(subnet, [0] * len(SEVERITY_LEVELS))
+        for level, count in enumerate(device[5:]):
+            counts[level] += count or 0
+
+    topology = Topology()
+    groups: Dict[str, List[int]] = {}
+    for subnet in sorted(clusters, key=lambda cidr: _ip_sort_key(cidr.split("/")[0])):
+        members = clusters[subnet]
+        member_types = {type for type, _ in members}
+        # A cluster containing a gateway device can act as a gateway in the cluster graph
+        cluster_type = next((type for type in GATEWAY_TYPES if type in member_types), "subnet")
+        status = "online" if any(status == "online" for _, status in members) else "offline"
+        index = topology.add_node(f"subnet:{subnet}", subnet, cluster_type, status, subnet, cluster_counts[subnet], size=len(members))
+        # Clusters are linked within their enclosing, wider network
+        enclosing = subnet_of(subnet.split("/")[0], (max(prefixes[0] - 8, 8), max(prefixes[1] - 16, 16)))
+        groups.setdefault(enclosing, []).append(index)
+
+    _link_groups(topology, groups, lambda index: INDIRECT)
+    return topology
+
+def load_devices(db: Session, user_id: str) -> List[Tuple]:
+    """The user's devices as (id, name, type, status, ip, *severity counts) rows, the change-log order"""
+    return db.query(Device.id, *device_service.MAP_COLUMNS).filter(Device.user_id == user_id).all()
+
+def resolve_zoom(zoom: str, device_count: int) -> str:
+    if zoom == "auto":
+        return "device" if device_count <= MAP_MAX_NODES else "subnet"
+    return zoom
+
+def get_network_map(db: Session, user_id: str, zoom: str = "auto", format: str = "full") -> str:
+    """
+    The user's network map as JSON, at a zoom level ("auto", "device", "subnet" or
+    "site"), as a NetworkMap ("full") or columns ("compact"). Maps are cached encoded
+    per inventory version, so a request only costs the version lookup until the
+    inventory changes
+    """
+    version = device_service.get_version(db, user_id)
+    key = map_cache.key(user_id, "network", {"version": version, "zoom": zoom, "format": format})
+    cached = map_cache.get(key)
+    if cached is not _MISSING:
+        return cached
+
+    devices = load_devices(db, user_id)
+    level = resolve_zoom(zoom, len(devices))
+    if level == "device":
+        topology = build_device_topology(devices)
+    else:
+        topology = build_cluster_topology(devices, ZOOM_PREFIXES[level])
+
+    result = topology.to_compact() if format == "compact" else topology.to_map()
+    result.update({"version": version, "zoom": level})
+    encoded = json.dumps(result, separators=(",", ":"))
+    map_cache.set(key, encoded)
+    return encoded
+
+def _node(device: Tuple) -> Dict:
+    id, name, type, status, ip = device[:5]
+    return {
+        "id": id, "name": name, "type": type, "status": status, "ip": ip, "size": None,
+        "severityCounts": dict(zip(SEVERITY_LEVELS, device[5:])),
+    }
+
+def _connection(edge: Tuple[str, str, int]) -> Dict:
+    return {"source": edge[0], "target": edge[1], "type": EDGE_TYPES[edge[2]]}
+
+def diff_inventory(changes, current: Dict[str, Tuple]) -> Dict:
+    """
+    The device-level map changes between the inventory before `changes` (oldest
+    first) and `current`, the devices by id after them
+    """
+    previous = dict(current)
+    for change in reversed(changes):
+        if change.before is None:
+            previous.pop(change.device_id, None)
+        else:
+            previous[change.device_id] = (change.device_id, *change.before)
+
+    added, updated, removed = [], [], []
+    edges_changed = False
+    for device_id in dict.fromkeys(change.device_id for change in changes):
+        before, after = previous.get(device_id), current.get(device_id)
+        if before == after:
+            continue
+        if before is None:
+            added.append(_node(after))
+        elif after is None:
+            removed.append(device_id)
+        else:
+            updated.append(_node(after))
+        # Edges only depend on which devices exist, their addresses and their types
+        if before is None or after is None or before[2] != after[2] or before[4] != after[4]:
+            edges_changed = True
+
+    added_edges, removed_edges = set(), set()
+    if edges_changed:
+        old_edges = build_device_topology(list(previous.values())).edge_set()
+        new_edges = build_device_topology(list(current.values())).edge_set()
+        added_edges, removed_edges = new_edges - old_edges, old_edges - new_edges
+
+    return {
+        "addedNodes": added,
+        "updatedNodes": updated,
+        "removedNodes": removed,
+        "addedConnections": [_connection(edge) for edge in sorted(added_edges)],
+        "removedConnections": [_connection(edge) for edge in sorted(removed_edges)],
+    }
+
+def get_network_changes(db: Session, user_id: str, since: int) -> Optional[str]:
+    """
+    The device-level map changes since inventory version `since` as NetworkChanges
+    JSON, or None when the inventory is still at that version. When the change log
+    no longer reaches back to `since` the result only has reset set, and the client
+    should fetch the whole map again
+    """
+    version = device_service.get_version(db, user_id)
+    if since == version:
+        return None
+
+    key = map_cache.key(user_id, "network-changes", {"since": since, "version": version})
+    cached = map_cache.get(key)
+    if cached is not _MISSING:
+        return cached
+
+    result = {"version": version, "since": since, "reset": True}
+    changes = device_service.get_changes(db, user_id, since, version)
+    if changes is not None:
+        current = {device[0]: tuple(device) for device in load_devices(db, user_id)}
+        result.update(diff_inventory(changes, current), reset=False)
+    encoded = json.dumps(result, separators=(",", ":"))
+    map_cache.set(key, encoded)
+    return encoded
@@ -0,0 +1,285 @@
+"""
+Vulnerability ingestion and triage.
+
+A rescan is reconciled with the stored vulnerabilities instead of replacing them:
+findings are matched to existing rows by a stable key (name, affected component,
+host), and only the differences are written, in batches inside one transaction.
+Matched rows keep their id, discovery date and triage status; rows no longer
+reported are resolved. The daily rollup and per-device counts are moved by the
+same deltas. Bulk triage is one set-based UPDATE, with the rollup deltas taken
+from one grouped query over the same rows. CVSS vectors are scored with
+app.utils.cvss. Environmental metrics are set per vulnerability by
+rescore_environment and kept when a rescan matches the row; a newly reported
+finding has none until it is rescored.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import uuid
+from sqlalchemy import BigInteger, Column, Float, MetaData, String, Table, func, or_, select
+from sqlalchemy.orm import Session
+from ..models.vulnerability import Vulnerability
+from ..utils import cvss, ipaddr
+from . import rollup_service, device_service, export_service
+
+# Rows per UPDATE ... WHERE id IN (...) statement
+BATCH_SIZE = 500
+# Per-transaction lookup of rescore_environment's results, by the vector they replace
+_rescored = Table(
+    "rescored_vectors", MetaData(),
+    Column("old", BigInteger, primary_key=True),
+    Column("new", BigInteger),
+    Column("vector", String),
+    Column("score", Float),
+    prefixes=["TEMPORARY"],
+)
+
+# Finding attributes a rescan may change on a matched vulnerability
+UPDATABLE_FIELDS = (
+    "description", "severity", "cvss_score", "cvss_vector", "cvss_metrics", "cvss_temporal_score",
+    "cvss_environmental_score", "cve_id", "remediation",
+)
+# Statuses a finding that is no longer reported is resolved from; triage decisions stay
+RESOLVABLE_STATUSES = (None, "open", "in_progress")
+
+VulnerabilityKey = Tuple[Optional[str], Optional[str], Optional[str]]
+
+def vulnerability_key(name: Optional[str], affected: Optional[str], host: Optional[str]) -> VulnerabilityKey:
+    """The identity of a finding across scans"""
+    return (name, affected, host)
+
+def cvss_fields(vector: Optional[str], environment: Optional[int] = None) -> Dict:
+    """
+    The CVSS columns of a vulnerability with the given vector, its environmental
+    metrics replaced by those of the packed `environment` when given. Empty when
+    the vector is missing or not a valid CVSS v3.1 vector
+    """
+    try:
+        code = cvss.encode(vector)
+    except ValueError:
+        return {}
+    if environment is not None:
+        code = cvss.with_environment(code, environment)
+    base, temporal, environmental = cvss.scores(code)
+    return {
+        "cvss_vector": cvss.to_vector(code),
+        "cvss_metrics": code,
+        "cvss_score": base,
+        "cvss_temporal_score": temporal,
+        "cvss_environmental_score": environmental,
+    }
+
+def refresh_vulnerabilities(db: Session, user_id: str, findings: Iterable[Dict], host: Optional[str] = None) -> Dict[str, int]:
+    """
+    Reconcile the user's vulnerabilities on `host` (None for account-wide scans) with
+    the findings of a new scan. Each finding is a dict with name and affected plus the
+    UPDATABLE_FIELDS, and the status to give it if it is new. A cvss_vector replaces
+    cvss_score; a matched row keeps its environmental metrics, a new one gets none.
+    Commits, and returns the number of rows inserted, updated, reopened and resolved
+    """
+    now = datetime.now()
+    reported: Dict[VulnerabilityKey, Dict] = {}
+    for finding in findings:
+        finding = {**finding, "cvss_vector": None, **cvss_fields(finding.get("cvss_vector"))}
+        reported[vulnerability_key(finding["name"], finding.get("affected"), host)] = finding
+
+    existing = db.query(
+        Vulnerability.id, Vulnerability.user_id, Vulnerability.name, Vulnerability.affected,
+        Vulnerability.host, Vulnerability.status, Vulnerability.discovered, Vulnerability.device_id,
+        *(getattr(Vulnerability, field) for field in UPDATABLE_FIELDS)
+    ).filter(
+        Vulnerability.user_id == user_id,
+        Vulnerability.host.is_(None) if host is None else Vulnerability.host == host
+    ).all()
+
+    updates: List[Dict] = []
+    resolved: List[str] = []
+    moves: List[Tuple[rollup_service.RollupKey, rollup_service.RollupKey]] = []
+    touched_devices = set()
+    counts = {"inserted": 0, "updated": 0, "reopened": 0, "resolved": 0}
+    for row in existing:
+        finding = reported.pop(vulnerability_key(row.name, row.affected, row.host), None)
+        old_key = rollup_service.rollup_key(row)
+        if finding is None:
+            if row.status in RESOLVABLE_STATUSES:
+                resolved.append(row.id)
+                moves.append((old_key, old_key[:3] + ("resolved",)))
+                touched_devices.add(row.device_id)
+            continue
+
+        if finding["cvss_vector"] and row.cvss_metrics is not None and row.cvss_metrics & cvss.ENVIRONMENT_MASK:
+            # Keep the environmental metrics set by rescore_environment
+            finding = {**finding, **cvss_fields(finding["cvss_vector"], environment=row.cvss_metrics)}
+        changes = {field: finding.get(field) for field in UPDATABLE_FIELDS if finding.get(field) != getattr(row, field)}
+        if row.status == "resolved":
+            changes["status"] = "open"  # Reported again after being resolved
+            counts["reopened"] += 1
+        if not changes:
+            continue
+        updates.append({"id": row.id, "updated_at": now, **changes})
+        new_key = old_key[:2] + (changes.get("severity", row.severity), changes.get("status", row.status or "open"))
+        if new_key != old_key:
+            moves.append((old_key, new_key))
+            touched_devices.add(row.device_id)
+        counts["updated"] += 1
+
+    ip_hi, ip_lo = ipaddr.encode(host)
+    device_id = device_service.find_devices(db, user_id, [host]).get(host) if host else None
+    inserted = [
+        Vulnerability(
+            id=str(uuid.uuid4()),
+            user_id=user_id,
+            name=finding["name"],
+            description=finding.get("description"),
+            severity=finding.get("severity"),
+            status=finding.get("status", "open"),
+            affected=finding.get("affected"),
+            host=host,
+            ip_hi=ip_hi,
+            ip_lo=ip_lo,
+            device_id=device_id,
+            discovered=now,
+            cvss_score=finding.get("cvss_score"),
+            cvss_vector=finding.get("cvss_vector"),
+            cvss_metrics=finding.get("cvss_metrics"),
+            cvss_temporal_score=finding.get("cvss_temporal_score"),
+            cvss_environmental_score=finding.get("cvss_environmental_score"),
+            cve_id=finding.get("cve_id"),
+            remediation=finding.get("remediation"),
+        )
+        for finding in reported.values()
+    ]
+    if inserted:
+        touched_devices.add(device_id)
+    counts["inserted"] = len(inserted)
+    counts["resolved"] = len(resolved)
+
+    if updates:
+        db.bulk_update_mappings(Vulnerability, updates)
+    for start in range(0, len(resolved), BATCH_SIZE):
+        db.query(Vulnerability).filter(Vulnerability.id.in_(resolved[start:start + BATCH_SIZE])).update(
+            {"status": "resolved", "updated_at": now}, synchronize_session=False
+        )
+    db.add_all(inserted)
+    rollup_service.record_inserted(db, inserted)
+    rollup_service.record_moves(db, moves)
+    if touched_devices - {None}:
+        device_service.update_vulnerability_counts(db, user_id, touched_devices)
+    db.commit()
+    return counts
+
+def filter_conditions(user_id: str, ids: Optional[List[str]] = None, status: Optional[str] = None,
+                      severity: Optional[str] = None, host: Optional[str] = None, device_id: Optional[str] = None,
+                      ip_range: Optional[Tuple[int, int]] = None, affected: Optional[str] = None) -> List:
+    """SQL conditions selecting the user's vulnerabilities by ids and attribute filters"""
+    conditions = [Vulnerability.user_id == user_id]
+    if ids is not None:
+        conditions.append(Vulnerability.id.in_(ids))
+    if status:
+        conditions.append(func.coalesce(Vulnerability.status, "open") == status)
+    if severity:
+        conditions.append(func.lower(Vulnerability.severity) == severity.lower())
+    if host:
+        conditions.append(Vulnerability.host == host)
+    if device_id:
+        conditions.append(Vulnerability.device_id == device_id)
+    if ip_range:
+        conditions.append(ipaddr.range_clause(Vulnerability.ip_hi, Vulnerability.ip_lo, *ip_range))
+    if affected:
+        conditions.append(Vulnerability.affected == affected)
+    return conditions
+
+def update_status(db: Session, user_id: str, status: str, conditions: List) -> int:
+    """
+    Set the status of every vulnerability matching `conditions` (which must include
+    the user_id check) in one UPDATE. The rollup and the per-device counts are moved
+    once for the whole batch. Commits and returns the number of rows changed
+    """
+    conditions = conditions + [or_(Vulnerability.status.is_(None), Vulnerability.status != status)]
+
+    # Rollup buckets and devices of the rows about to change, grouped in the database.
+    # The rows are locked first (FOR UPDATE is not allowed on the grouped query itself),
+    # so a concurrent update of the same rows waits for this one instead of moving the
+    # rollup from statuses they no longer have; SQLite has no row locks and ignores it
+    locked = select(Vulnerability.id).where(*conditions).with_for_update()
+    day = func.date(Vulnerability.discovered)
+    old_status = func.coalesce(Vulnerability.status, "open")
+    groups = db.query(
+        day, Vulnerability.severity, old_status, Vulnerability.device_id, func.count(Vulnerability.id)
+    ).filter(Vulnerability.id.in_(locked)).group_by(day, Vulnerability.severity, old_status, Vulnerability.device_id).all()
+
+    updated = db.query(Vulnerability).filter(*conditions).update(
+        {"status": status, "updated_at": datetime.now()}, synchronize_session=False
+    )
+    rollup_service.record_bulk_status_change(
+        db, user_id, [(discovered, severity, previous, count) for discovered, severity, previous, _, count in groups], status
+    )
+    touched_devices = {device_id for _, _, _, device_id, _ in groups}
+    if touched_devices - {None}:
+        device_service.update_vulnerability_counts(db, user_id, touched_devices)
+    db.commit()
+    return updated
+
+def rescore_environment(db: Session, environment: int, conditions: List) -> int:
+    """
+    Give every vulnerability matching `conditions` that has a CVSS vector the
+    environmental metrics packed in `environment` and recompute its environmental
+    score. Vulnerabilities sharing a vector share the result, so only the distinct
+    vectors are scored (with cvss.score_batch). The results go into a temporary
+    table keyed by the old vector, and one UPDATE looks each row's new values up in
+    it. Commits and returns the number of rows changed
+    """
+    conditions = conditions + [Vulnerability.cvss_metrics.isnot(None)]
+    codes = [code for code, in db.query(Vulnerability.cvss_metrics).filter(*conditions).distinct()]
+
+    # New vector by old vector; those already in this environment stay
+    replaced: Dict[int, int] = {}
+    for code in codes:
+        new_code = cvss.with_environment(code, environment)
+        if new_code != code:
+            replaced[code] = new_code
+    if not replaced:
+        return 0
+
+    _, _, environmental = cvss.score_batch(list(replaced.values()))
+    connection = db.connection()
+    _rescored.create(connection)
+    connection.execute(_rescored.insert(), [
+        {"old": code, "new": new_code, "vector": cvss.to_vector(new_code), "score": float(score)}
+        for (code, new_code), score in zip(replaced.items(), environmental)
+    ])
+
+    def rescored(column):
+        return select(column).where(_rescored.c.old == Vulnerability.cvss_metrics).scalar_subquery()
+
+    updated = db.query(Vulnerability).filter(
+        *conditions, Vulnerability.cvss_metrics.in_(select(_rescored.c.old))
+    ).update({
+        "cvss_metrics": rescored(_rescored.c.new),
+        "cvss_vector": rescored(_rescored.c.vector),
+        "cvss_environmental_score": rescored(_rescored.c.score),
+    }, synchronize_session=False)
+    _rescored.drop(connection)
+    db.commit()
+    return updated
+
+EXPORT_FIELDS = (
+    "id", "name", "severity", "status", "cvss_score", "cvss_vector", "cvss_temporal_score",
+    "cvss_environmental_score", "cve_id", "affected", "host", "device_id",
+    "discovered", "updated_at", "description", "remediation",
+)
+
+def export_records(conditions: List) -> Iterator[Dict]:
+    """The matching vulnerabilities as export records, oldest first, streamed from a server-side cursor"""
+    columns = [getattr(Vulnerability, field) for field in EXPORT_FIELDS]
+    return export_service.stream_query(
+        lambda db: db.query(*columns).filter(*conditions).order_by(Vulnerability.discovered, Vulnerability.id),
+        lambda row: (dict(zip(EXPORT_FIELDS, row)),)
+    )
+
+def to_sarif(record: Dict) -> Dict:
+    return export_service.sarif_result(
+        record,
+        rule_id=record["cve_id"] or record["name"] or record["id"],
+        message=f"{record['name']}: {record['description']}",
+        location=record["host"] or record["affected"],
+    )
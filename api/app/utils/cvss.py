@@ -0,0 +1,288 @@
+"""
+CVSS v3.1 vectors and scores.
+
+A vector's metrics are packed into one integer (44 bits, fits a BIGINT column):
+each metric takes the few bits needed for the index of its value, with index 0
+meaning "not defined" (X) for the temporal and environmental metrics. Scoring
+follows the CVSS v3.1 specification, including its Roundup function. Batches are
+scored with NumPy when it is installed, by looking each vector up in tables of
+every metric combination's score; one vector at a time otherwise.
+"""
+from math import floor
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # Batch scoring falls back to the scalar path
+    np = None
+
+VERSION_PREFIX = "CVSS:3.1/"
+
+# (metric, values, weights) in vector order. Base metrics have no "X"; modified
+# metrics list "X" followed by the values of their base metric, in the same order
+BASE_METRICS = (
+    ("AV", ("N", "A", "L", "P"), (0.85, 0.62, 0.55, 0.2)),
+    ("AC", ("L", "H"), (0.77, 0.44)),
+    ("PR", ("N", "L", "H"), (0.85, 0.62, 0.27)),
+    ("UI", ("N", "R"), (0.85, 0.62)),
+    ("S", ("U", "C"), (0, 1)),
+    ("C", ("N", "L", "H"), (0, 0.22, 0.56)),
+    ("I", ("N", "L", "H"), (0, 0.22, 0.56)),
+    ("A", ("N", "L", "H"), (0, 0.22, 0.56)),
+)
+TEMPORAL_METRICS = (
+    ("E", ("X", "U", "P", "F", "H"), (1, 0.91, 0.94, 0.97, 1)),
+    ("RL", ("X", "O", "T", "W", "U"), (1, 0.95, 0.96, 0.97, 1)),
+    ("RC", ("X", "U", "R", "C"), (1, 0.92, 0.96, 1)),
+)
+REQUIREMENT_METRICS = tuple(
+    (name, ("X", "L", "M", "H"), (1, 0.5, 1, 1.5)) for name in ("CR", "IR", "AR")
+)
+MODIFIED_METRICS = tuple(
+    ("M" + name, ("X",) + values, (None,) + weights) for name, values, weights in BASE_METRICS
+)
+ENVIRONMENTAL_METRICS = REQUIREMENT_METRICS + MODIFIED_METRICS
+METRICS = BASE_METRICS + TEMPORAL_METRICS + ENVIRONMENTAL_METRICS
+
+# Privileges Required weighs more when the scope changes
+PR_CHANGED_WEIGHTS = (0.85, 0.68, 0.5)
+
+VALUES = {name: values for name, values, _ in METRICS}
+WEIGHTS = {name: weights for name, _, weights in METRICS}
+BASE_NAMES = tuple(name for name, _, _ in BASE_METRICS)
+MODIFIED_NAMES = tuple(name for name, _, _ in MODIFIED_METRICS)
+
+def _layout() -> Dict[str, Tuple[int, int]]:
+    shifts, shift = {}, 0
+    for name, values, _ in METRICS:
+        bits = (len(values) - 1).bit_length()
+        shifts[name] = (shift, (1 << bits) - 1)
+        shift += bits
+    return shifts
+
+# Bit offset and mask of each metric in a packed vector
+LAYOUT = _layout()
+# Bits of the environmental metrics
+ENVIRONMENT_MASK = sum(LAYOUT[name][1] << LAYOUT[name][0] for name, _, _ in ENVIRONMENTAL_METRICS)
+
+Scores = Tuple[float, float, float]
+
+def _split(text: str, allowed: Iterable[str]) -> Dict[str, str]:
+    allowed = set(allowed)
+    metrics: Dict[str, str] = {}
+    for part in text.split("/"):
+        name, _, value = part.partition(":")
+        if name not in allowed or value not in VALUES[name]:
+            raise ValueError(f"Invalid CVSS metric: {part}")
+        if name in metrics:
+            raise ValueError(f"Duplicate CVSS metric: {name}")
+        metrics[name] = value
+    return metrics
+
+def parse(vector: str) -> Dict[str, str]:
+    """The metrics of a CVSS v3.1 vector string. Raises ValueError if it is not a valid one"""
+    vector = vector.strip() if vector else ""
+    if not vector.startswith(VERSION_PREFIX):
+        raise ValueError(f"Not a CVSS v3.1 vector: {vector}")
+    metrics = _split(vector[len(VERSION_PREFIX):], VALUES)
+    missing = [name for name in BASE_NAMES if name not in metrics]
+    if missing:
+        raise ValueError(f"CVSS vector lacks base metrics: {', '.join(missing)}")
+    return metrics
+
+def parse_environment(text: str) -> int:
+    """
+    Pack environmental metrics given without prefix ("CR:H/IR:H/MAV:A"); unlisted
+    ones are not defined. The result only has bits inside ENVIRONMENT_MASK
+    """
+    text = text.strip().strip("/")
+    metrics = _split(text, (name for name, _, _ in ENVIRONMENTAL_METRICS)) if text else {}
+    return pack(metrics)
+
+def pack(metrics: Dict[str, str]) -> int:
+    code = 0
+    for name, value in metrics.items():
+        shift, _ = LAYOUT[name]
+        code |= VALUES[name].index(value) << shift
+    return code
+
+def unpack(code: int) -> Dict[str, str]:
+    """The metrics of a packed vector, without the undefined ones"""
+    metrics = {}
+    for name, values, _ in METRICS:
+        shift, mask = LAYOUT[name]
+        value = values[(code >> shift) & mask]
+        if value != "X":
+            metrics[name] = value
+    return metrics
+
+def encode(vector: str) -> int:
+    return pack(parse(vector))
+
+def to_vector(code: int) -> str:
+    """The canonical vector string of a packed vector"""
+    return VERSION_PREFIX + "/".join(f"{name}:{value}" for name, value in unpack(code).items())
+
+def with_environment(code: int, environment: int) -> int:
+    """`code` with its environmental metrics replaced by those packed in `environment`"""
+    return (code & ~ENVIRONMENT_MASK) | (environment & ENVIRONMENT_MASK)
+
+def roundup(value: float) -> float:
+    """Smallest number with one decimal that is >= value, as defined in CVSS v3.1 Appendix A"""
+    int_input = round(value * 100000)
+    if int_input % 10000 == 0:
+        return int_input / 100000.0
+    return (floor(int_input / 10000) + 1) / 10.0
+
+def _index(code: int, name: str) -> int:
+    shift, mask = LAYOUT[name]
+    return (code >> shift) & mask
+
+def _modified_index(code: int, name: str) -> int:
+    """Index into the base metric's values of a modified metric, the base value when undefined"""
+    index = _index(code, "M" + name)
+    return index - 1 if index else _index(code, name)
+
+def _impact_exploitability(changed: bool, c: float, i: float, a: float, av: float, ac: float, ui: float,
+                           pr_index: int, modified: bool) -> Tuple[float, float]:
+    iss = 1 - (1 - c) * (1 - i) * (1 - a)
+    if modified:
+        iss = min(iss, 0.915)
+    if not changed:
+        impact = 6.42 * iss
+    elif modified:
+        impact = 7.52 * (iss - 0.029) - 3.25 * (iss * 0.9731 - 0.02) ** 13
+    else:
+        impact = 7.52 * (iss - 0.029) - 3.25 * (iss - 0.02) ** 15
+    pr = (PR_CHANGED_WEIGHTS if changed else WEIGHTS["PR"])[pr_index]
+    return impact, 8.22 * av * ac * pr * ui
+
+def _combine(changed: bool, impact: float, exploitability: float) -> float:
+    if impact <= 0:
+        return 0.0
+    if changed:
+        return roundup(min(1.08 * (impact + exploitability), 10))
+    return roundup(min(impact + exploitability, 10))
+
+def scores(code: int) -> Scores:
+    """The base, temporal and environmental scores of a packed vector"""
+    weight = lambda name: WEIGHTS[name][_index(code, name)]
+    base_weight = lambda name, index: WEIGHTS[name][index]
+
+    changed = _index(code, "S") == 1
+    impact, exploitability = _impact_exploitability(
+        changed, weight("C"), weight("I"), weight("A"), weight("AV"), weight("AC"), weight("UI"),
+        _index(code, "PR"), False
+    )
+    base = _combine(changed, impact, exploitability)
+    temporal_factor = weight("E") * weight("RL") * weight("RC")
+    temporal = roundup(base * temporal_factor)
+
+    modified = {name: _modified_index(code, name) for name in BASE_NAMES}
+    modified_changed = modified["S"] == 1
+    impact, exploitability = _impact_exploitability(
+        modified_changed,
+        weight("CR") * base_weight("C", modified["C"]),
+        weight("IR") * base_weight("I", modified["I"]),
+        weight("AR") * base_weight("A", modified["A"]),
+        base_weight("AV", modified["AV"]), base_weight("AC", modified["AC"]), base_weight("UI", modified["UI"]),
+        modified["PR"], True
+    )
+    environmental = roundup(_combine(modified_changed, impact, exploitability) * temporal_factor)
+    return base, temporal, environmental
+
+def score(vector: str) -> Scores:
+    return scores(encode(vector))
+
+# Packed vectors split into the fields the batch lookup tables are keyed by
+BASE_BITS = LAYOUT["E"][0]
+BASE_MASK = (1 << BASE_BITS) - 1
+TEMPORAL_BITS = LAYOUT["CR"][0] - BASE_BITS
+REQUIREMENT_SHIFT = LAYOUT["CR"][0]
+REQUIREMENT_BITS = LAYOUT["MAV"][0] - REQUIREMENT_SHIFT
+
+_tables = None
+
+def _roundup_array(values):
+    # Same as roundup: ceiling division of the rounded hundred-thousandths into tenths
+    int_input = np.rint(values * 100000).astype(np.int64)
+    return -(-int_input // 10000) / 10.0
+
+def _rounded_scores(keys, requirements, modified: bool):
+    """
+    The combined (base or modified) score for keys laid out like the base metric
+    bits, multiplying C, I and A by the `requirements` weights. Impossible indexes
+    are clamped, those table entries are never looked up
+    """
+    index = {name: np.minimum((keys >> LAYOUT[name][0]) & LAYOUT[name][1], len(VALUES[name]) - 1) for name in BASE_NAMES}
+    weight = lambda name: np.array(WEIGHTS[name], dtype=np.float64)[index[name]]
+    changed = index["S"] == 1
+    cr, ir, ar = requirements
+
+    iss = 1 - (1 - cr * weight("C")) * (1 - ir * weight("I")) * (1 - ar * weight("A"))
+    if modified:
+        iss = np.minimum(iss, 0.915)
+        impact_changed = 7.52 * (iss - 0.029) - 3.25 * (iss * 0.9731 - 0.02) ** 13
+    else:
+        impact_changed = 7.52 * (iss - 0.029) - 3.25 * (iss - 0.02) ** 15
+    impact = np.where(changed, impact_changed, 6.42 * iss)
+    pr = np.where(changed, np.array(PR_CHANGED_WEIGHTS)[index["PR"]], np.array(WEIGHTS["PR"])[index["PR"]])
+    exploitability = 8.22 * weight("AV") * weight("AC") * pr * weight("UI")
+    total = np.where(changed, 1.08 * (impact + exploitability), impact + exploitability)
+    return np.where(impact <= 0, 0.0, _roundup_array(np.minimum(total, 10)))
+
+def _lookup_tables():
+    """
+    Built on first use: the base score of every base metric combination, the
+    temporal factor of every temporal combination, and the modified score (before
+    the temporal factor) of every modified metric and requirement combination
+    """
+    global _tables
+    if _tables is None:
+        base = _rounded_scores(np.arange(1 << BASE_BITS), (1.0, 1.0, 1.0), False)
+
+        keys = np.arange(1 << TEMPORAL_BITS) << BASE_BITS
+        factor = lambda name: np.array(WEIGHTS[name])[np.minimum((keys >> LAYOUT[name][0]) & LAYOUT[name][1], len(VALUES[name]) - 1)]
+        temporal = factor("E") * factor("RL") * factor("RC")
+
+        keys = np.arange(1 << (BASE_BITS + REQUIREMENT_BITS))
+        requirement = lambda name: np.array(WEIGHTS[name])[np.minimum(
+            (keys >> (LAYOUT[name][0] - REQUIREMENT_SHIFT + BASE_BITS)) & LAYOUT[name][1], len(VALUES[name]) - 1
+        )]
+        environmental = _rounded_scores(keys & BASE_MASK, (requirement("CR"), requirement("IR"), requirement("AR")), True)
+        _tables = base, temporal, environmental
+    return _tables
+
+def _score_arrays(codes):
+    base_table, temporal_table, environmental_table = _lookup_tables()
+    base = base_table[codes & BASE_MASK]
+    temporal_factor = temporal_table[(codes >> BASE_BITS) & ((1 << TEMPORAL_BITS) - 1)]
+    temporal = _roundup_array(base * temporal_factor)
+
+    # Key of the modified metrics, undefined ones taking the base value, and the requirements
+    key = ((codes >> REQUIREMENT_SHIFT) & ((1 << REQUIREMENT_BITS) - 1)) << BASE_BITS
+    for name in BASE_NAMES:
+        shift, mask = LAYOUT[name]
+        modified_shift, modified_mask = LAYOUT["M" + name]
+        modified = (codes >> modified_shift) & modified_mask
+        key |= np.where(modified == 0, (codes >> shift) & mask, modified - 1) << shift
+    environmental = _roundup_array(environmental_table[key] * temporal_factor)
+    return base, temporal, environmental
+
+def score_batch(codes: Sequence[int], environment: Optional[int] = None):
+    """
+    Base, temporal and environmental scores of many packed vectors, with their
+    environmental metrics replaced by `environment` when given. With NumPy the
+    scores are looked up in precomputed tables and returned as float arrays;
+    without it they are computed one vector at a time and returned as lists
+    """
+    if np is None:
+        if environment is not None:
+            codes = [with_environment(code, environment) for code in codes]
+        results = [scores(code) for code in codes]
+        return [r[0] for r in results], [r[1] for r in results], [r[2] for r in results]
+
+    codes = np.asarray(codes, dtype=np.int64)
+    if environment is not None:
+        codes = (codes & ~ENVIRONMENT_MASK) | (environment & ENVIRONMENT_MASK)
+    return _score_arrays(codes)
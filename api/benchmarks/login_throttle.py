@@ -0,0 +1,56 @@
+"""
+Overhead of the login throttle.
+
+Times the in-memory SlidingWindowLimiter with --keys keys already tracked, next to
+the bcrypt verify that a throttled attempt skips. Runs in-process, no API needed:
+
+    python benchmarks/login_throttle.py
+
+With 100k keys this measured about 130 ns to check an unknown key, 250-330 ns for
+a blocked one and 1.3 us to record a failure, against about 300 ms for one bcrypt
+verify. Reserving and releasing an attempt, as every login now does, is printed too.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.security import get_password_hash, verify_password
+from app.core.throttle import SlidingWindowLimiter
+
+def per_call(function, number: int) -> float:
+    """Best of three runs, in seconds per call"""
+    return min(timeit.repeat(function, number=number, repeat=3)) / number
+
+def main(args):
+    limiter = SlidingWindowLimiter(limit=5, window=900, max_keys=args.keys + 1)
+    for i in range(args.keys - 1):
+        limiter.record_failure(f"user{i}@example.com")
+    blocked = "blocked@example.com"
+    for _ in range(limiter.limit + 1):
+        limiter.record_failure(blocked)
+    assert limiter.retry_after(blocked) > 0
+
+    n = args.number
+    print(f"{args.keys} keys tracked")
+    print(f"check, unknown key: {per_call(lambda: limiter.retry_after('unknown@example.com'), n) * 1e9:.0f} ns")
+    print(f"check, blocked key: {per_call(lambda: limiter.retry_after(blocked), n) * 1e9:.0f} ns")
+
+    def reserve_and_release():
+        limiter.acquire("new@example.com")
+        limiter.release("new@example.com")
+
+    print(f"acquire + release:  {per_call(reserve_and_release, n) * 1e9:.0f} ns")
+    print(f"acquire, blocked:   {per_call(lambda: limiter.acquire(blocked), n) * 1e9:.0f} ns")
+    print(f"record_failure:     {per_call(lambda: limiter.record_failure('user7@example.com'), n) * 1e9:.0f} ns")
+
+    hashed = get_password_hash("benchmark-password")
+    print(f"bcrypt verify:      {per_call(lambda: verify_password('wrong-password', hashed), 5) * 1e3:.1f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--keys", type=int, default=100000, help="Keys tracked by the limiter")
+    parser.add_argument("--number", type=int, default=1000000, help="Calls per timing run")
+    main(parser.parse_args())
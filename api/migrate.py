@@ -15,10 +15,10 @@ logger = logging.getLogger(__name__)
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 try:
-    from app.database.migrate import migrate_users_table
+    from app.database.migrate import run_migrations
     
     logger.info("Starting migration...")
-    migrate_users_table()
+    run_migrations()
     logger.info("Migration completed successfully.")
 except Exception as e:
     logger.error(f"Migration failed: {e}")
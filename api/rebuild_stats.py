@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Rebuild the daily_stats rollup for NexaSecurity API.
+Run this script to recompute the dashboard rollup from the vulnerabilities table,
+optionally for a single user: python rebuild_stats.py [user_id]
+"""
+import sys
+import os
+import logging
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Add the app directory to the path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    from app.database.database import SessionLocal, create_db_and_tables
+    from app.models.user import User  # noqa: F401 - registers the users table for foreign keys
+    from app.services import rollup_service
+    
+    user_id = sys.argv[1] if len(sys.argv) > 1 else None
+    
+    logger.info(f"Rebuilding daily_stats for {'user ' + user_id if user_id else 'all users'}...")
+    create_db_and_tables()
+    db = SessionLocal()
+    try:
+        rows = rollup_service.rebuild(db, user_id)
+    finally:
+        db.close()
+    logger.info(f"Rebuild completed successfully with {rows} rows.")
+except Exception as e:
+    logger.error(f"Rebuild failed: {e}")
+    sys.exit(1)
@@ -0,0 +1,23 @@
+import os
+import sys
+import tempfile
+
+# Point the app at a throwaway database before anything imports it
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/test.db"
+os.environ.setdefault("SECRET_KEY", "test-secret")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from app import main  # noqa: F401  Registers every model on Base
+from app.database.database import SessionLocal, create_db_and_tables
+
+create_db_and_tables()
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,51 @@
+import asyncio
+import uuid
+
+from app.core import events
+from app.core.cache import ResponseCache, dashboard_cache
+from app.models.user import User
+from app.services import scan_service
+from app.schemas.scan import ScanConfigRequest
+
+def test_evicted_generation_counters_never_revive_entries():
+    cache = ResponseCache("test", maxsize=2)
+    stale = cache.key("a", "/dashboard/stats", {})
+    cache.set(stale, "stale")
+    cache.invalidate_user("a")
+    cache.set(cache.key("a", "/dashboard/stats", {}), "also stale")
+    for user in ("b", "c", "d"):
+        cache.invalidate_user(user)
+
+    # "a" is no longer tracked, and reads neither of its earlier generations
+    assert len(cache.backend._counters) == 2
+    assert cache.get(cache.key("a", "/dashboard/stats", {})) not in ("stale", "also stale")
+    cache.set(cache.key("e", "/dashboard/stats", {}), "fresh")
+    assert cache.get(cache.key("e", "/dashboard/stats", {})) == "fresh"
+
+def test_failed_scan_invalidates_dashboard(db, monkeypatch):
+    user = User(id=str(uuid.uuid4()), email=f"{uuid.uuid4()}@example.com", full_name="Scan")
+    db.add(user)
+    db.commit()
+    config = ScanConfigRequest(networkTarget="10.0.0.1", outputDirectory="/tmp", scanType="network", useCustomPasswordList=False)
+    scan = scan_service.create_scan(db, user.id, config)
+    key = dashboard_cache.key(user.id, "/dashboard/alerts", {})
+
+    async def no_sleep(seconds):
+        pass
+
+    def broken(scan):
+        raise RuntimeError("scanner crashed")
+
+    monkeypatch.setattr(scan_service.asyncio, "sleep", no_sleep)
+    monkeypatch.setattr(scan_service, "generate_findings_for_scan", broken)
+    published = []
+    monkeypatch.setitem(events._subscribers, events.SCAN_FAILED, [
+        *events._subscribers[events.SCAN_FAILED], lambda event, **payload: published.append(payload)
+    ])
+    asyncio.run(scan_service.run_scan_task(scan.id, db))
+
+    db.refresh(scan)
+    assert (scan.status, scan.end_time is not None) == ("failed", True)
+    assert published == [{"user_id": user.id, "scan_id": scan.id}]
+    # The alerts widget lists failed scans, so the user's cached dashboard is dropped
+    assert dashboard_cache.key(user.id, "/dashboard/alerts", {}) != key
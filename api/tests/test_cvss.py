@@ -0,0 +1,127 @@
+import random
+import uuid
+
+import pytest
+from sqlalchemy import event
+
+from app.database.database import engine
+from app.models.user import User
+from app.models.vulnerability import Vulnerability
+from app.services import vulnerability_service
+from app.utils import cvss
+
+# Base scores of the vectors in FIRST's "CVSS v3.1 Examples" document
+FIRST_EXAMPLES = {
+    "AV:N/AC:L/PR:N/UI:R/S:C/C:L/I:L/A:N": 6.1,  # CVE-2013-1937, phpMyAdmin XSS
+    "AV:N/AC:L/PR:L/UI:N/S:C/C:L/I:L/A:N": 6.4,  # CVE-2013-0375, MySQL stored SQL injection
+    "AV:N/AC:H/PR:N/UI:R/S:U/C:L/I:N/A:N": 3.1,  # CVE-2014-3566, SSLv3 POODLE
+    "AV:N/AC:L/PR:L/UI:N/S:C/C:H/I:H/A:H": 9.9,  # CVE-2012-1516, VMware guest to host escape
+    "AV:L/AC:L/PR:H/UI:N/S:U/C:L/I:L/A:L": 4.2,  # CVE-2009-0783, Apache Tomcat XML parser
+    "AV:N/AC:L/PR:L/UI:N/S:U/C:H/I:H/A:H": 8.8,  # CVE-2012-0384, Cisco IOS command injection
+    "AV:L/AC:L/PR:N/UI:R/S:U/C:H/I:H/A:H": 7.8,  # CVE-2015-1098, iWork denial of service
+    "AV:N/AC:L/PR:N/UI:N/S:U/C:H/I:N/A:N": 7.5,  # CVE-2014-0160, OpenSSL Heartbleed
+    "AV:N/AC:L/PR:N/UI:N/S:U/C:H/I:H/A:H": 9.8,  # CVE-2014-6271, GNU Bash Shellshock
+    "AV:N/AC:H/PR:N/UI:N/S:C/C:N/I:H/A:N": 6.8,  # CVE-2008-1447, DNS kaminsky bug
+    "AV:P/AC:L/PR:N/UI:N/S:U/C:H/I:H/A:H": 6.8,  # CVE-2014-2005, Sophos login screen bypass
+    "AV:N/AC:L/PR:N/UI:N/S:C/C:L/I:N/A:N": 5.8,  # CVE-2010-0467, Joomla directory traversal
+    "AV:A/AC:L/PR:N/UI:N/S:C/C:H/I:N/A:H": 9.3,  # CVE-2012-1342, Cisco access-list bypass
+    "AV:A/AC:L/PR:N/UI:N/S:U/C:H/I:H/A:H": 8.8,  # CVE-2013-6014, Juniper proxy ARP denial of service
+    "AV:P/AC:L/PR:N/UI:N/S:U/C:N/I:H/A:N": 4.6,  # CVE-2019-7551, Cantemo Portal stored XSS
+    "AV:N/AC:L/PR:N/UI:R/S:U/C:H/I:H/A:H": 8.8,  # CVE-2016-0725, Android mediaserver
+    "AV:N/AC:H/PR:N/UI:N/S:U/C:H/I:H/A:N": 7.4,  # CVE-2016-1645, Chrome PDFium
+    "AV:N/AC:L/PR:N/UI:R/S:C/C:H/I:H/A:H": 9.6,  # CVE-2016-5729, Lenovo BIOS
+    "AV:N/AC:H/PR:N/UI:R/S:U/C:H/I:H/A:N": 6.8,  # CVE-2018-3652, Intel Xeon debug interface
+}
+
+# Temporal and environmental scores worked through the formulas of section 7 of the
+# v3.1 specification, as (base, temporal, environmental)
+SPECIFICATION_CASES = {
+    "AV:N/AC:L/PR:N/UI:N/S:U/C:H/I:H/A:H/E:P/RL:O/RC:C": (9.8, 8.8, 8.8),
+    "AV:N/AC:L/PR:N/UI:N/S:U/C:H/I:H/A:H/E:U/RL:O/RC:U": (9.8, 7.8, 7.8),
+    "AV:N/AC:L/PR:N/UI:N/S:U/C:H/I:H/A:H/CR:L/IR:L/AR:L": (9.8, 9.8, 8.0),
+    "AV:N/AC:L/PR:N/UI:N/S:U/C:H/I:H/A:H/MAV:P/MC:N": (9.8, 9.8, 6.1),
+    "AV:N/AC:L/PR:N/UI:N/S:U/C:H/I:H/A:H/E:F/RL:W/RC:R/MPR:L/MUI:R": (9.8, 8.9, 7.3),
+    # Scope changed: the environmental score uses v3.1's modified impact formula (the
+    # 0.9731 factor and exponent 13), so it can exceed the base score even without
+    # environmental metrics
+    "AV:N/AC:L/PR:L/UI:N/S:C/C:H/I:H/A:H": (9.9, 9.9, 10.0),
+    "AV:N/AC:L/PR:N/UI:R/S:C/C:H/I:H/A:H": (9.6, 9.6, 9.7),
+    "AV:N/AC:L/PR:L/UI:N/S:U/C:H/I:H/A:H/MS:C": (8.8, 8.8, 10.0),
+    "AV:N/AC:L/PR:L/UI:N/S:C/C:H/I:H/A:H/MS:U": (9.9, 9.9, 8.8),
+    "AV:N/AC:L/PR:L/UI:N/S:C/C:H/I:H/A:H/CR:H/IR:H/AR:H": (9.9, 9.9, 10.0),
+}
+
+@pytest.mark.parametrize("vector,expected", FIRST_EXAMPLES.items())
+def test_first_examples(vector, expected):
+    base, temporal, environmental = cvss.score(f"CVSS:3.1/{vector}")
+    assert (base, temporal) == (expected, expected)
+    if "S:U" in vector:
+        # Scope changed vectors go through v3.1's modified impact formula, see below
+        assert environmental == expected
+
+@pytest.mark.parametrize("vector,expected", SPECIFICATION_CASES.items())
+def test_temporal_and_environmental(vector, expected):
+    assert cvss.score(f"CVSS:3.1/{vector}") == expected
+
+def test_roundup():
+    # Appendix A of the specification
+    assert (cvss.roundup(4.02), cvss.roundup(4.0), cvss.roundup(4.000000000000001)) == (4.1, 4.0, 4.0)
+
+def test_round_trip():
+    vector = "CVSS:3.1/AV:N/AC:L/PR:N/UI:N/S:U/C:H/I:H/A:H/E:P/RL:O/RC:C/CR:H/MAV:A"
+    assert cvss.to_vector(cvss.encode(vector)) == vector
+
+@pytest.mark.parametrize("vector", [
+    "CVSS:3.0/AV:N/AC:L/PR:N/UI:N/S:U/C:H/I:H/A:H",
+    "CVSS:3.1/AV:N/AC:L",
+    "CVSS:3.1/AV:Q/AC:L/PR:N/UI:N/S:U/C:H/I:H/A:H",
+    "CVSS:3.1/AV:N/AV:N/AC:L/PR:N/UI:N/S:U/C:H/I:H/A:H",
+    "",
+])
+def test_invalid_vectors(vector):
+    with pytest.raises(ValueError):
+        cvss.parse(vector)
+
+def _random_codes(count):
+    rng = random.Random(1)
+    return [cvss.pack({name: rng.choice(values) for name, values in cvss.VALUES.items()}) for _ in range(count)]
+
+def test_score_batch_matches_scalar(monkeypatch):
+    pytest.importorskip("numpy")
+    codes = _random_codes(20000)
+    environment = cvss.parse_environment("CR:H/IR:H/AR:M/MAV:A/MS:C")
+    with_numpy = [list(map(float, scores)) for scores in cvss.score_batch(codes, environment)]
+    monkeypatch.setattr(cvss, "np", None)
+    assert with_numpy == list(cvss.score_batch(codes, environment))
+    assert with_numpy[2][:100] == [cvss.scores(cvss.with_environment(code, environment))[2] for code in codes[:100]]
+
+def test_rescore_environment_is_one_update(db):
+    user = User(id=str(uuid.uuid4()), email=f"{uuid.uuid4()}@example.com", full_name="Rescore")
+    db.add(user)
+    vectors = [f"CVSS:3.1/{vector}" for vector in list(FIRST_EXAMPLES)[:5]]
+    db.add_all(
+        Vulnerability(user_id=user.id, name=f"finding {index}", **vulnerability_service.cvss_fields(vector))
+        for index, vector in enumerate(vectors * 3)
+    )
+    db.add(Vulnerability(user_id=user.id, name="unscored"))
+    db.commit()
+
+    environment = cvss.parse_environment("CR:H/IR:H/MAV:A")
+    updates = []
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE"):
+            updates.append(statement)
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        changed = vulnerability_service.rescore_environment(db, environment, [Vulnerability.user_id == user.id])
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert (changed, len(updates)) == (15, 1)
+
+    for row in db.query(Vulnerability).filter(Vulnerability.user_id == user.id, Vulnerability.cvss_metrics.isnot(None)):
+        expected = vulnerability_service.cvss_fields(row.cvss_vector.split("/CR:")[0], environment=environment)
+        assert (row.cvss_metrics, row.cvss_vector, row.cvss_environmental_score) == (
+            expected["cvss_metrics"], expected["cvss_vector"], expected["cvss_environmental_score"]
+        )
+    # Already in that environment
+    assert vulnerability_service.rescore_environment(db, environment, [Vulnerability.user_id == user.id]) == 0
@@ -0,0 +1,88 @@
+import asyncio
+import socket
+import uuid
+
+from app.models.device import Device
+from app.models.user import User
+from app.services import device_service, discovery_service
+
+def _closed_port(kind=socket.SOCK_STREAM) -> int:
+    # Bind and release an ephemeral port, leaving nothing listening on it
+    with socket.socket(socket.AF_INET, kind) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def _tcp_server():
+    server = await asyncio.start_server(lambda reader, writer: writer.close(), "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+class _Echo(asyncio.DatagramProtocol):
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.transport.sendto(data, addr)
+
+def test_probe_tcp_open_and_closed():
+    async def run():
+        server, port = await _tcp_server()
+        async with server:
+            return (
+                await discovery_service.probe_tcp("127.0.0.1", port, timeout=2),
+                await discovery_service.probe_tcp("127.0.0.1", _closed_port(), timeout=2),
+            )
+
+    assert asyncio.run(run()) == (True, False)
+
+def test_probe_udp_answered_and_refused():
+    async def run():
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(_Echo, local_addr=("127.0.0.1", 0))
+        try:
+            port = transport.get_extra_info("sockname")[1]
+            return (
+                await discovery_service.probe_udp("127.0.0.1", port, timeout=2),
+                await discovery_service.probe_udp("127.0.0.1", _closed_port(socket.SOCK_DGRAM), timeout=2),
+            )
+        finally:
+            transport.close()
+
+    # A reply and an ICMP port unreachable both show the host is up
+    assert asyncio.run(run()) == (True, True)
+
+def test_run_discovery_records_job(db, monkeypatch):
+    user = User(id=str(uuid.uuid4()), email=f"{uuid.uuid4()}@example.com", full_name="Discovery")
+    db.add(user)
+    db.commit()
+    job = discovery_service.create_job(db, user.id, discovery_service.parse_target("127.0.0.1/32"))
+
+    async def run():
+        server, open_port = await _tcp_server()
+        closed_port = _closed_port()
+        # Only the open port may count towards the guessed type
+        monkeypatch.setattr(discovery_service, "PORT_TYPES", ((closed_port, "printer"), (open_port, "server")))
+        async with server:
+            await discovery_service.run_discovery(job.id, user.id, "127.0.0.1", tcp_ports=(open_port, closed_port), timeout=2)
+
+    asyncio.run(run())
+
+    db.refresh(job)
+    assert (job.status, job.progress, job.hosts_total, job.hosts_scanned, job.devices_found) == ("completed", 100, 1, 1, 1)
+    assert job.finished_at is not None
+    device = db.query(Device).filter(Device.user_id == user.id).one()
+    assert (device.ip, device.type, device.status) == ("127.0.0.1", "server", "online")
+
+def test_rediscovery_keeps_device_name(db):
+    user = User(id=str(uuid.uuid4()), email=f"{uuid.uuid4()}@example.com", full_name="Inventory")
+    db.add(user)
+    db.commit()
+    device_service.upsert_devices(db, user.id, [{"ip": "10.1.0.5"}])
+    device = db.query(Device).filter(Device.user_id == user.id).one()
+    assert device.name == "10.1.0.5"
+    device.name = "build server"
+    db.commit()
+    version = device_service.get_version(db, user.id)
+
+    device_service.upsert_devices(db, user.id, [{"ip": "10.1.0.5", "name": "10.1.0.5"}])
+    db.refresh(device)
+    assert (device.name, device_service.get_version(db, user.id)) == ("build server", version)
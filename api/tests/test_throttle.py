@@ -0,0 +1,26 @@
+from app.core.throttle import SlidingWindowLimiter
+
+def test_reservations_in_flight_count_towards_the_limit():
+    limiter = SlidingWindowLimiter(limit=3, window=900)
+    assert [limiter.acquire("a") for _ in range(5)] == [0.0, 0.0, 0.0, 1.0, 1.0]
+
+def test_release_frees_a_reservation():
+    limiter = SlidingWindowLimiter(limit=2, window=900)
+    assert limiter.acquire("a") == 0.0
+    assert limiter.acquire("a") == 0.0
+    limiter.release("a")
+    assert limiter.acquire("a") == 0.0
+
+def test_failures_block_with_backoff():
+    limiter = SlidingWindowLimiter(limit=2, window=900, backoff_base=30)
+    for _ in range(2):
+        assert limiter.acquire("a") == 0.0
+        limiter.record_failure("a")
+    assert 29 < limiter.acquire("a") <= 30
+    assert limiter.acquire("b") == 0.0
+
+def test_one_attempt_goes_ahead_when_none_is_in_flight():
+    limiter = SlidingWindowLimiter(limit=1, window=900, backoff_base=0)
+    limiter.record_failure("a")
+    assert limiter.acquire("a") == 0.0
+    assert limiter.acquire("a") == 1.0